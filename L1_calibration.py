@@ -0,0 +1,176 @@
+# L1_calibration.py
+# Gamepad stick calibration. Each axis is described by its raw range, rest
+# position, deadzone, response curve and direction, taken from the device's
+# absinfo and overridden by joystick_calibration.tsv. buildTable() turns that
+# into a lookup table holding the scaled value of every raw position, so
+# L1_gamepad scales an axis event with a single index instead of float math.
+# This program runs on SCUTTLE with any CPU.
+#
+# Usage:
+#   python L1_calibration.py capture    # measure the connected gamepad and save it to the TSV
+#   python L1_calibration.py show       # print the calibration the gamepad would use
+
+# Import external libraries
+import argparse
+import array
+import os
+import select
+import time
+from typing import Callable, NamedTuple
+import numpy as np
+from evdev import ecodes
+
+AXES = ("LEFT_X", "LEFT_Y", "RIGHT_X", "RIGHT_Y")
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "joystick_calibration.tsv")
+COLUMNS = ("device", "axis", "min", "max", "centre", "deadzone", "expo", "invert")
+
+
+class AxisCalibration(NamedTuple):
+    minimum: int                            # raw value at full left / up
+    maximum: int                            # raw value at full right / down
+    centre: float | None = None             # raw value at rest, None for the middle of the range
+    deadzone: int = 0                       # raw distance from the centre that reads as 0
+    expo: float = 0.0                       # 0 is linear, 1 is fully cubic
+    invert: bool = False
+
+
+def fromAbsInfo(info) -> AxisCalibration:
+    """Calibration from the range and flat (deadzone) the driver reports for an axis."""
+    return AxisCalibration(info.min, info.max, None, info.flat)
+
+
+def _readRows(path: str) -> list[list[str]]:
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+    return [line.split("\t") for line in lines if line.strip() and not line.startswith("#")]
+
+
+def loadCalibration(name: str, defaults: dict[str, AxisCalibration],
+                    path: str = DEFAULT_PATH) -> dict[str, AxisCalibration]:
+    """
+    Return defaults with the rows of the TSV for the device `name` applied.
+    A row is device, axis, min, max, centre, deadzone, expo, invert (an empty
+    centre is the middle of the range). Older files have one row per device
+    with only the left stick's X and Y ranges. Those rows set the ranges alone,
+    in either order: their direction does not follow this code's +Y down.
+    """
+    calibrations = dict(defaults)
+    for row in _readRows(path):
+        if row[0] != name:
+            continue
+        if len(row) == 5:                                   # device, x range, y range
+            for axis, (a, b) in zip(("LEFT_X", "LEFT_Y"), (row[1:3], row[3:5])):
+                a, b = int(a), int(b)
+                calibrations[axis] = calibrations[axis]._replace(minimum=min(a, b), maximum=max(a, b))
+        elif len(row) == len(COLUMNS) and row[1] in AXES:
+            _, axis, minimum, maximum, centre, deadzone, expo, invert = row
+            calibrations[axis] = AxisCalibration(int(minimum), int(maximum), float(centre) if centre else None,
+                                                 int(deadzone), float(expo), invert.strip() == "1")
+        else:
+            raise ValueError(f"{path}: cannot read calibration row {row}")
+    return calibrations
+
+
+def saveCalibration(name: str, calibrations: dict[str, AxisCalibration], path: str = DEFAULT_PATH):
+    """Replace the rows of device `name` in the TSV, keeping the other devices' rows."""
+    kept = [row for row in _readRows(path) if row[0] != name]
+    with open(path, "w") as f:
+        f.write("# " + "\t".join(COLUMNS) + "\n")
+        for row in kept:
+            f.write("\t".join(row) + "\n")
+        for axis in AXES:
+            cal = calibrations[axis]
+            centre = "" if cal.centre is None else f"{cal.centre:g}"
+            f.write(f"{name}\t{axis}\t{cal.minimum}\t{cal.maximum}\t{centre}\t{cal.deadzone}"
+                    f"\t{cal.expo:g}\t{int(cal.invert)}\n")
+
+
+def expoCurve(expo: float) -> Callable[[np.ndarray], np.ndarray]:
+    """The usual RC expo: (1 - expo) * x + expo * x**3, finer control near the centre."""
+    return lambda x: (1 - expo) * x + expo * x ** 3
+
+
+def buildTable(cal: AxisCalibration, curve: Callable[[np.ndarray], np.ndarray] | None = None):
+    """
+    Returns (offset, table): the scaled value of raw position r is
+    table[r - offset], for every r from the lowest to the highest raw value.
+    curve maps the linear value in [-1, 1] to the output and replaces expo.
+    """
+    low, high = min(cal.minimum, cal.maximum), max(cal.minimum, cal.maximum)
+    raw = np.arange(low, high + 1, dtype=float)
+    if cal.centre is None:                                  # the same float math as before the tables
+        centred = raw - (low + high) / 2
+        values = centred / ((high - low) / 2)
+    else:                                                   # each side scaled to its own end
+        centred = raw - cal.centre
+        span = np.where(centred < 0, cal.centre - low, high - cal.centre)
+        values = np.clip(centred / np.maximum(span, 1), -1.0, 1.0)
+    values[np.abs(centred) < cal.deadzone] = 0.0
+    if curve is not None:
+        values = np.asarray(curve(values), dtype=float)
+    elif cal.expo:
+        values = expoCurve(cal.expo)(values)
+    if cal.invert != (cal.minimum > cal.maximum):           # a reversed range inverts too
+        values = -values
+    values += 0.0                                           # no -0.0 in the table
+    table = array.array("d")
+    table.frombytes(values.tobytes())
+    return low, table
+
+
+def _collect(device, codes, seconds: float) -> dict[int, list[int]]:
+    """Raw values of the given axes reported during `seconds`, starting with their current values."""
+    values = {code: [device.absinfo(code).value] for code in codes}
+    deadline = time.monotonic() + seconds
+    while (remaining := deadline - time.monotonic()) > 0:
+        if select.select([device.fd], [], [], remaining)[0]:
+            for event in device.read():
+                if event.type == ecodes.EV_ABS and event.code in values:
+                    values[event.code].append(event.value)
+    return values
+
+
+def capture(path: str = DEFAULT_PATH, restSeconds: float = 2.0, moveSeconds: float = 6.0):
+    """Measure the sticks of the connected gamepad and save them; expo and invert are kept."""
+    import L1_gamepad as gp
+    device = gp.findGamepad()
+    codes = gp.Gamepad.AXES_MAP
+    current = loadCalibration(device.name, {name: fromAbsInfo(device.absinfo(code)) for code, name in codes.items()}, path)
+
+    input(f"Calibrating {device.name}. Leave both sticks centred and press Enter...")
+    rest = _collect(device, codes, restSeconds)
+    input("Now move both sticks around their full range until told to stop. Press Enter to start...")
+    moved = _collect(device, codes, moveSeconds)
+    print("Stop.")
+
+    calibrations = {}
+    for code, name in codes.items():
+        centre = float(np.mean(rest[code]))
+        noise = max(abs(v - centre) for v in rest[code])
+        deadzone = max(device.absinfo(code).flat, int(np.ceil(noise * 2)))
+        calibrations[name] = AxisCalibration(min(moved[code]), max(moved[code]), round(centre, 1), deadzone,
+                                             current[name].expo, current[name].invert)
+        print(f"{name}: {calibrations[name]}")
+    saveCalibration(device.name, calibrations, path)
+    print("Saved to", path)
+    device.close()
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gamepad stick calibration")
+    parser.add_argument("command", choices=["capture", "show"])
+    parser.add_argument("--path", default=DEFAULT_PATH, help="calibration TSV")
+    args = parser.parse_args()
+    if args.command == "capture":
+        capture(args.path)
+    else:
+        import L1_gamepad as gp
+        device = gp.findGamepad()
+        defaults = {name: fromAbsInfo(device.absinfo(code)) for code, name in gp.Gamepad.AXES_MAP.items()}
+        for name, cal in loadCalibration(device.name, defaults, args.path).items():
+            print(f"{name}: {cal}")
+        device.close()
@@ -5,42 +5,197 @@
 # This code runs on SCUTTLE with rasPi setup. (last updated 2020.11)
 
 # Import external libraries
+import ctypes       # for the i2c message buffers
 import smbus2       # a Python package to communicate over i2c
 import numpy as np  # use numpy to build the angles array
+import threading    # for the per-thread i2c message buffers
 import time         # for keeping time
 
-bus=smbus2.SMBus(1) # declare the i2c bus object
+import L1_trace as trace     # spans for L1_trace.py
+
+bus = None          # the i2c bus object, opened on first use (see getBus)
 
 encL = 0x40         # encoder i2c address for LEFT motor
 encR = 0x41         # encoder i2c address for RIGHT motor (this encoder has A1 pin pulled high)
+angleRegister = 0xFE    # first of the two angle registers (0xFE & 0xFF)
+degreesPerCount = 360/2**14
+
+_pairMsgs = threading.local()   # reusable i2c messages for readRawPair, built on first use in each thread
+
+# sample status markers (see EncoderReader and L2_encoder_sampler)
+VALID = 0           # read from the encoder
+ESTIMATED = 1       # the read failed; the angle was extrapolated from the previous samples
+STALE = 2           # no new sample for too long
+INVALID = 3         # the read failed; the angle is INVALID_ANGLE
+INVALID_ANGLE = float("nan")    # returned instead of an angle when a read fails (never 0, which looks like a real angle)
+failedReads = 0     # singleReading failures, counted instead of printed after the first
+
+def getBus():                                                                   # return the i2c bus object, opening SMBus(1) if needed
+    global bus
+    if bus is None:
+        bus = smbus2.SMBus(1)
+    return bus
+
+def setBus(newBus):                                                             # use another SMBus-like object (e.g. a fake bus without hardware)
+    global bus
+    bus = newBus
+
+def closeBus():                                                                 # release the i2c bus; the next read opens it again
+    global bus
+    if bus is not None and hasattr(bus, "close"):
+        bus.close()
+    bus = None
 
-def singleReading(encoderSelection):                                            # return a reading for an encoder in degrees (motor shaft angle)
+@trace.traced()
+def singleReading(encoderSelection, i2c=None):                                  # return a reading for an encoder in degrees (motor shaft angle)
+    if i2c is None:
+        i2c = getBus()
     try:
-        twoByteReading = bus.read_i2c_block_data(encoderSelection, 0xFE, 2)     # request data from registers 0xFE & 0xFF of the encoder. Approx 700 microseconds.
+        twoByteReading = i2c.read_i2c_block_data(encoderSelection, 0xFE, 2)     # request data from registers 0xFE & 0xFF of the encoder. Approx 700 microseconds.
         binaryPosition = (twoByteReading[0] << 6) | twoByteReading[1]           # remove unused bits 6 & 7 from byte 0xFF creating 14 bit value
         degreesPosition = binaryPosition*(360/2**14)                            # convert to degrees
         degreesAngle = round(degreesPosition,1)                                 # round to nearest 0.1 degrees
-    except:
-        print("Encoder reading failed.")                                        # indicate a failed reading
-        degreesAngle = 0
+    except OSError:
+        global failedReads
+        if not failedReads:
+            print("Encoder reading failed (further failures are counted in L1_encoder.failedReads).")
+        failedReads += 1
+        degreesAngle = INVALID_ANGLE                                            # a 0 here would look like a jump of the shaft
     return degreesAngle
 
-def readShaftPositions():                                   # read both motor shafts.  approx 0.0023 seconds.
+@trace.traced()
+def readShaftPositions(i2c=None):                           # read both motor shafts.  approx 0.0023 seconds.
     try:
-        rawAngle = singleReading(encL)                      # capture left motor shaft
+        rawAngle = singleReading(encL, i2c)                 # capture left motor shaft
         angle0 = 360.0 - rawAngle                           # invert the reading for left side only
         angle0 = round(angle0,1)                            # repeat rounding due to math effects
     except:
         print('Warning(I2C): Could not read left encoder')  # indicate which reading failed
         angle0 = 0
     try:
-        angle1 = singleReading(encR)                        # capture right motor shaft
+        angle1 = singleReading(encR, i2c)                   # capture right motor shaft
     except:
         print('Warning(I2C): Could not read right encoder') # indicate which reading failed
         angle1 = 0
     angles = np.array([angle0,angle1])
     return angles
 
+def _buildPairMessages():
+    bufL = ctypes.create_string_buffer(2)                   # keep the buffers so replies can be read without copies through i2c_msg
+    bufR = ctypes.create_string_buffer(2)
+    msgs = (smbus2.i2c_msg.write(encL, [angleRegister]),
+            smbus2.i2c_msg(addr=encL, flags=smbus2.smbus2.I2C_M_RD, len=2, buf=bufL),
+            smbus2.i2c_msg.write(encR, [angleRegister]),
+            smbus2.i2c_msg(addr=encR, flags=smbus2.smbus2.I2C_M_RD, len=2, buf=bufR))
+    return msgs, bufL, bufR
+
+def readRawPair(i2c=None):                                  # read both encoders in one i2c transaction
+    """
+    Returns (rawLeft, rawRight, t): the 14 bit shaft positions of both encoders
+    fetched in a single i2c_rdwr batch, and the time.monotonic() of the read.
+    Errors are raised rather than printed. Each thread has its own message
+    buffers, so reads from several threads never mix up their replies.
+    """
+    if i2c is None:
+        i2c = getBus()
+    try:
+        msgs, bufL, bufR = _pairMsgs.msgs
+    except AttributeError:
+        msgs, bufL, bufR = _pairMsgs.msgs = _buildPairMessages()
+    i2c.i2c_rdwr(*msgs)
+    t = time.monotonic()
+    bL = bufL.raw
+    bR = bufR.raw
+    return (bL[0] << 6) | (bL[1] & 0x3F), (bR[0] << 6) | (bR[1] & 0x3F), t
+
+@trace.traced()
+def readAnglesPair(i2c=None, decimals=None):                # read both shafts in degrees from one transaction
+    """
+    Returns (angleLeft, angleRight, t) in degrees with the left side inverted,
+    like readShaftPositions(). Pass decimals=1 to round the way it does.
+    """
+    rawL, rawR, t = readRawPair(i2c)
+    angle0 = 360.0 - rawL * degreesPerCount                 # invert the reading for left side only
+    angle1 = rawR * degreesPerCount
+    if decimals is not None:
+        angle0 = round(angle0, decimals)
+        angle1 = round(angle1, decimals)
+    return angle0, angle1, t
+
+class DeviceStats:
+    """Counters for one encoder. Latencies are of successful reads."""
+    __slots__ = ("reads", "errors", "retries", "timeouts", "latency_ns", "max_latency_ns")
+
+    def __init__(self):
+        self.reads = self.errors = self.retries = self.timeouts = self.latency_ns = self.max_latency_ns = 0
+
+    def add(self, latency_ns: int):
+        self.reads += 1
+        self.latency_ns += latency_ns
+        if latency_ns > self.max_latency_ns:
+            self.max_latency_ns = latency_ns
+
+    def asDict(self) -> dict:
+        return {"reads": self.reads, "errors": self.errors, "retries": self.retries, "timeouts": self.timeouts,
+                "mean_latency_us": self.latency_ns / max(self.reads, 1) / 1000, "max_latency_us": self.max_latency_ns / 1000}
+
+
+class EncoderReader:
+    """
+    Reads both encoders in one transaction like readAnglesPair(). When that
+    fails, each encoder is read on its own, up to `retries` times but only
+    while the `budget` (s) since the start of the read lasts, so the failing
+    encoder is known and a good one still gives its angle. An encoder that
+    cannot be read returns INVALID_ANGLE with the INVALID status.
+    """
+
+    def __init__(self, i2c=None, retries: int = 2, budget: float = 0.002):
+        self.i2c = i2c                                      # None for L1_encoder's bus
+        self.retries = retries
+        self.budget_ns = int(budget * 1e9)
+        self.stats = {encL: DeviceStats(), encR: DeviceStats()}
+        self.pairErrors = 0                                 # failed reads of both encoders together
+
+    def read(self):
+        """Returns (angleL, angleR, t, statusL, statusR), angles in degrees as from readAnglesPair()."""
+        i2c = self.i2c if self.i2c is not None else getBus()
+        start = time.perf_counter_ns()
+        try:
+            angleL, angleR, t = readAnglesPair(i2c)
+            latency = time.perf_counter_ns() - start
+            self.stats[encL].add(latency)
+            self.stats[encR].add(latency)
+            return angleL, angleR, t, VALID, VALID
+        except OSError:
+            self.pairErrors += 1
+
+        deadline = start + self.budget_ns
+        angles = [INVALID_ANGLE, INVALID_ANGLE]
+        statuses = [INVALID, INVALID]
+        for side, address in enumerate((encL, encR)):
+            stats = self.stats[address]
+            for _ in range(self.retries):
+                attemptStart = time.perf_counter_ns()
+                if attemptStart > deadline:
+                    stats.timeouts += 1                     # out of time for this sample
+                    break
+                stats.retries += 1
+                try:
+                    msb, lsb = i2c.read_i2c_block_data(address, angleRegister, 2)
+                except OSError:
+                    stats.errors += 1
+                    continue
+                stats.add(time.perf_counter_ns() - attemptStart)
+                degrees = ((msb << 6) | (lsb & 0x3F)) * degreesPerCount
+                angles[side] = 360.0 - degrees if address == encL else degrees     # left side inverted
+                statuses[side] = VALID
+                break
+        return angles[0], angles[1], time.monotonic(), statuses[0], statuses[1]
+
+    def report(self) -> dict:
+        return {"pair_errors": self.pairErrors, **{f"0x{address:02x}": s.asDict() for address, s in self.stats.items()}}
+
+
 # THIS LOOP RUNS IF THE PROGRAM IS CALLED DIRECTLY
 if __name__ == "__main__":
     print("Testing Encoders")
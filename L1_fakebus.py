@@ -0,0 +1,136 @@
+# L1_fakebus.py
+# An SMBus-like stand-in for the i2c bus that answers like the two AS5048
+# encoders on SCUTTLE. Use it with L1_encoder.setBus() (or pass it to the
+# encoder functions directly) to run, benchmark and test encoder code
+# without i2c hardware.
+# This program runs on any computer.
+
+# Import external libraries
+import ctypes
+import random
+import time
+
+ENCODER_ADDRESSES = (0x40, 0x41)    # LEFT and RIGHT encoder addresses, as in L1_encoder
+ANGLE_REGISTER = 0xFE               # first of the two angle registers (0xFE & 0xFF)
+COUNTS = 2**14                      # counts per revolution of the 14 bit encoders
+I2C_M_RD = 0x0001                   # flag marking a read message in an i2c_rdwr batch
+
+
+class FakeEncoderBus:
+    """
+    Holds a raw 14 bit shaft angle per encoder address and returns it in the
+    same two-byte layout the AS5048 uses. Angles can be set directly or
+    spun at a constant rate against a clock.
+
+    Faults can be injected to test error handling: each device read fails
+    with probability failRate (only for failAddresses, if given), each
+    transaction takes spikeDelay longer with probability spikeRate, and
+    failNext() makes the next reads fail for certain.
+    """
+
+    def __init__(self, addresses=ENCODER_ADDRESSES, delay: float = 0.0, clock=time.monotonic,
+                 failRate: float = 0.0, failAddresses=None, spikeRate: float = 0.0, spikeDelay: float = 0.005,
+                 seed: int = 1):
+        self.addresses = tuple(addresses)
+        self.rates = {address: 0.0 for address in self.addresses}   # spin rates (degrees/s)
+        self.delay = delay                                  # simulated duration of one transaction (s)
+        self.clock = clock
+        self.reads = 0                                      # number of transactions served
+        self._base = {address: 0.0 for address in self.addresses}   # angles at time _t0 (degrees)
+        self._t0 = clock()
+        self.failRate = failRate
+        self.failAddresses = None if failAddresses is None else set(failAddresses)
+        self.spikeRate = spikeRate
+        self.spikeDelay = spikeDelay
+        self.faults = 0                                     # reads failed on purpose
+        self._failNext = {}                                 # address (None for any) -> reads left to fail
+        self._random = random.Random(seed)
+
+    def failNext(self, count: int, address: int | None = None):
+        """Fail the next `count` reads of one encoder, or of any encoder."""
+        self._failNext[address] = self._failNext.get(address, 0) + count
+
+    def _injectFault(self, address: int) -> bool:
+        for key in (address, None):
+            if self._failNext.get(key):
+                self._failNext[key] -= 1
+                return True
+        if self.failRate and (self.failAddresses is None or address in self.failAddresses):
+            return self._random.random() < self.failRate
+        return False
+
+    def setDegrees(self, address: int, degrees: float):
+        """Set the shaft angle of one encoder in degrees."""
+        self._rebase()
+        self._base[address] = degrees
+
+    def spin(self, address: int, degreesPerSecond: float):
+        """Turn one shaft at a constant rate, starting from its current angle."""
+        self._rebase()
+        self.rates[address] = degreesPerSecond
+
+    def degrees(self, address: int) -> float:
+        return self._angleAt(address, self.clock()) % 360
+
+    def _rebase(self):
+        now = self.clock()
+        for address in self.addresses:
+            self._base[address] = self._angleAt(address, now)
+        self._t0 = now
+
+    def _angleAt(self, address: int, now: float) -> float:
+        return self._base[address] + self.rates[address] * (now - self._t0)
+
+    def _rawReading(self, address: int) -> int:
+        if address not in self._base:
+            raise OSError(121, "Remote I/O error")          # what smbus2 raises for a missing device
+        if (self.failRate or self._failNext) and self._injectFault(address):
+            self.faults += 1
+            raise OSError(121, "Remote I/O error")
+        return int(round(self._angleAt(address, self.clock()) * COUNTS / 360)) % COUNTS
+
+    def _transaction(self):
+        self.reads += 1
+        delay = self.delay
+        if self.spikeRate and self._random.random() < self.spikeRate:
+            delay += self.spikeDelay
+        if delay:
+            time.sleep(delay)
+
+    def read_i2c_block_data(self, i2c_addr: int, register: int, length: int, force=None) -> list[int]:
+        self._transaction()
+        if register != ANGLE_REGISTER or length != 2:
+            raise OSError(5, "Input/output error")
+        raw = self._rawReading(i2c_addr)
+        return [raw >> 6, raw & 0x3F]                       # bits 13..6 in 0xFE, bits 5..0 in 0xFF
+
+    def i2c_rdwr(self, *i2c_msgs):
+        """Serve a batch of smbus2.i2c_msg messages as one transaction."""
+        self._transaction()
+        register = {}
+        for msg in i2c_msgs:                                # decoded every time: callers reuse and change messages
+            address = msg.addr
+            if msg.flags & I2C_M_RD:
+                if register.get(address) != ANGLE_REGISTER or msg.len != 2:
+                    raise OSError(5, "Input/output error")
+                raw = self._rawReading(address)
+                ctypes.memmove(msg.buf, bytes((raw >> 6, raw & 0x3F)), 2)
+            else:
+                register[address] = msg.buf[0][0]           # the write selects the register to read from
+
+    def close(self):
+        pass
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    import L1_encoder as enc
+
+    fake = FakeEncoderBus()
+    fake.spin(enc.encL, 90)
+    fake.spin(enc.encR, -90)
+    enc.setBus(fake)
+    for i in range(5):
+        encValues = enc.readShaftPositions()
+        print("Left: ", encValues[0], "\t", "Right: ", encValues[1])
+        time.sleep(0.5)
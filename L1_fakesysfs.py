@@ -0,0 +1,73 @@
+# L1_fakesysfs.py
+# A fake /sys/class/pwm tree made of ordinary files, by default on tmpfs
+# (/dev/shm). Point L1_pwm.PWMChannel at it with root=tree.root (or set
+# L1_pwm.sysfs_root) to run, benchmark and test the motor outputs without
+# PWM hardware. Channels are created already exported, with a 20 kHz period.
+# This program runs on any Linux computer.
+
+# Import external libraries
+import os
+import shutil
+import tempfile
+
+
+class FakePWMSysfs:
+    """pwmchipN/pwmM directories with period, duty_cycle, enable and polarity files."""
+
+    def __init__(self, chips: dict[int, int] | None = None, period_ns: int = 50000, base: str | None = None):
+        if base is None and os.path.isdir("/dev/shm"):
+            base = "/dev/shm"
+        self.root = tempfile.mkdtemp(prefix="scuttle-pwm-", dir=base)
+        for chip, channels in (chips or {0: 2, 1: 2}).items():     # chip number -> number of channels
+            chipPath = self.path(chip)
+            os.makedirs(chipPath)
+            self._write(f"{chipPath}/npwm", channels)
+            self._write(f"{chipPath}/export", "")
+            self._write(f"{chipPath}/unexport", "")
+            for channel in range(channels):
+                channelPath = self.path(chip, channel)
+                os.makedirs(channelPath)
+                self._write(f"{channelPath}/period", period_ns)
+                self._write(f"{channelPath}/duty_cycle", 0)
+                self._write(f"{channelPath}/enable", 0)
+                self._write(f"{channelPath}/polarity", "normal")
+
+    def path(self, chip: int, channel: int | None = None) -> str:
+        chipPath = f"{self.root}/pwmchip{chip}"
+        return chipPath if channel is None else f"{chipPath}/pwm{channel}"
+
+    @staticmethod
+    def _write(path: str, value):
+        with open(path, "w") as f:
+            f.write(f"{value}\n")
+
+    def read(self, chip: int, channel: int, attribute: str) -> str:
+        """Return an attribute as the kernel would report it (only the first line counts,
+        since a regular file keeps old bytes past a shorter pwrite())."""
+        with open(f"{self.path(chip, channel)}/{attribute}") as f:
+            return f.readline().strip()
+
+    def duty_ns(self, chip: int, channel: int) -> int:
+        return int(self.read(chip, channel, "duty_cycle"))
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    import L1_pwm
+    with FakePWMSysfs() as tree:
+        channel = L1_pwm.PWMChannel(0, 1, root=tree.root)
+        channel.enable()
+        for duty in (0.5, 0.5, 0.25, 0.25, 0.25, 1.0):
+            channel.duty_cycle = duty
+        print("duty_cycle file:", tree.duty_ns(0, 1), "ns of", tree.read(0, 1, "period"), "ns,",
+              "enabled:", tree.read(0, 1, "enable"), "\t", channel.stats())
+        channel.close()
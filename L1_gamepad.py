@@ -1,29 +1,122 @@
 # L1_gamepad.py
+# Reads the gamepad from a background thread. Each time the gamepad finishes
+# reporting a change (an EV_SYN event) the reader thread publishes a new
+# immutable GamepadSnapshot in one attribute assignment, so the control loop
+# always sees a complete, consistent state without locking.
+import fcntl
+import json
+import os
+import struct
 import time
 import threading
+from types import MappingProxyType
+from typing import NamedTuple
 import numpy as np
 from evdev import list_devices, InputDevice, ecodes
 
+import L1_calibration as cal
+import L1_trace as trace
+
+EVIOCSCLOCKID = 0x400445a0  # ioctl that selects the clock of a device's event timestamps
+cachePath = os.path.expanduser("~/.cache/scuttle/gamepad.json")    # the last gamepad found, checked before scanning
+
+
+def _isGamepad(device) -> bool:
+    return ecodes.EV_ABS in device.capabilities()     # any device that reports analog sticks
+
+
+def _openCached():
+    """Open the gamepad found last time, if it is still at the same path."""
+    try:
+        with open(cachePath) as f:
+            cached = json.load(f)
+        device = InputDevice(cached["path"])
+    except (OSError, ValueError, KeyError):
+        return None
+    if device.name == cached.get("name") and _isGamepad(device):
+        return device
+    device.close()
+    return None
+
+
+def findGamepad():
+    """
+    Return an open InputDevice for the first gamepad. Every other device
+    opened while looking is closed again, and the result is remembered in
+    cachePath so the next start usually opens just one device.
+    """
+    device = _openCached()
+    if device is not None:
+        return device
+    for path in list_devices():
+        candidate = InputDevice(path)
+        if device is None and _isGamepad(candidate):
+            device = candidate
+        else:
+            candidate.close()
+    if device is None:
+        raise LookupError("no gamepad found in /dev/input")
+    try:
+        os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+        with open(cachePath, "w") as f:
+            json.dump({"path": device.path, "name": device.name}, f)
+    except OSError:
+        pass                    # only a cache
+    return device
+
+
+class GamepadSnapshot(NamedTuple):
+    """The gamepad state after one complete report. Never modified after it is published."""
+    seq: int                # increases by one with every snapshot
+    timestamp: float        # time of the newest event in the snapshot (s, time.monotonic() for real devices)
+    values: tuple           # 4 scaled axes then 12 buttons, as returned by readValues()
+    axes: MappingProxyType  # raw axis values by name
+    buttons: MappingProxyType
+    hat: tuple
+
+    def readValues(self, out=None):
+        """Copy the 16 values into out (a list or array), or into a new array."""
+        if out is None:
+            out = np.empty(16)
+        (out[0], out[1], out[2], out[3], out[4], out[5], out[6], out[7],
+         out[8], out[9], out[10], out[11], out[12], out[13], out[14], out[15]) = self.values
+        return out
+
+
 class Gamepad:
     # raw axis min/max (your sticks) and trigger threshold
     DEADZONE = 125
     TRIGGER_THRESHOLD = 10   # >10 counts as “pressed”
+    AXES_MAP = {
+        ecodes.ABS_X:  'LEFT_X',
+        ecodes.ABS_Y:  'LEFT_Y',
+        ecodes.ABS_RX: 'RIGHT_X',
+        ecodes.ABS_RY: 'RIGHT_Y',
+    }
     
-    def __init__(self):
-        # Get first gamepad (any device that reports analog sticks)
-        devices = [InputDevice(d) for d in list_devices()]
-        gamepads = [d for d in devices if ecodes.EV_ABS in d.capabilities()]
-
-        self._dev = gamepads[0]
-        print("Found gamepad:", self._dev.name)
+    def __init__(self, device=None, threaded=True, verbose=False, lazy=False,
+                 calibrationPath=cal.DEFAULT_PATH, curves=None):
+        """
+        device: an evdev InputDevice (or anything with the same interface, such
+        as the simulated gamepad in L1_sim). By default the first device that
+        reports analog sticks is used (see findGamepad).
+        threaded: read events from a background thread. When False, events
+        are fed in by calling processEvent().
+        verbose: print the gamepad's capabilities and axis ranges.
+        lazy: do not open the gamepad until open() is called or it is first read.
+        calibrationPath: the TSV whose rows for this gamepad override its absinfo
+        (see L1_calibration.py).
+        curves: optional {axis name: function} response curves, replacing expo.
+        """
+        self._dev = device
+        self.threaded = threaded
+        self.verbose = verbose
+        self.opened = False
+        self.calibrationPath = calibrationPath
+        self.curves = curves or {}
 
         # map only the four main axes
-        self.axesMap = {
-            ecodes.ABS_X:  'LEFT_X',
-            ecodes.ABS_Y:  'LEFT_Y',
-            ecodes.ABS_RX: 'RIGHT_X',
-            ecodes.ABS_RY: 'RIGHT_Y',
-        }
+        self.axesMap = dict(self.AXES_MAP)
 
         # digital buttons
         self.buttonMap = {
@@ -43,64 +136,158 @@ class Gamepad:
             ecodes.BTN_TR:    'RT',
         }
 
+        # initialize everything. axes, buttons and hat are the working state,
+        # only touched by processEvent(); readers use the published snapshot.
+        self.axes = {name: None for name in self.axesMap.values()}
+        self.buttons = {name: 0 for name in self.buttonMap.values()}
+        self.hat = [0, 0]
+        self.axis_ranges = {}
+        self.calibration = {}       # AxisCalibration per axis
+        self.axis_tables = {}       # per axis code: (lowest raw value, last index, table of scaled values)
+        self.axisValues = {name: 0.0 for name in self.axesMap.values()}    # scaled, updated by processEvent()
+        self._snapshot = None
+        self._reportTimes = [0.0] * 256     # timestamp of snapshot seq at [seq % 256], see reportTime()
+        self._eventTime = 0.0
+        self._timeOffset = 0.0
+
+        self.stateUpdating = False
+        self.thread = None
+        if not lazy:
+            self.open()
+
+    def open(self):
+        """Find and open the gamepad, read its axis ranges and start reading events. Does nothing if open."""
+        if self.opened:
+            return self
+        if self._dev is None:
+            self._dev = findGamepad()
+        print("Found gamepad:", self._dev.name)
+        self._timeOffset = self._useMonotonicTimestamps()
+
         # Ask gamepad for its raw minimum and maximum values for the X and Y axes
-        caps = self._dev.capabilities(verbose=True, absinfo=True)
-        print("Gamepad capabilities:", caps)
+        if self.verbose:
+            caps = self._dev.capabilities(verbose=True, absinfo=True)
+            print("Gamepad capabilities:", caps)
 
-        self.axis_ranges = {}
+        defaults = {}
         for abs_code, logical in self.axesMap.items():
             info = self._dev.absinfo(abs_code)
             self.axis_ranges[logical] = (info.min, info.max, info.flat)
-            print(f"{logical}: raw_min={info.min}, raw_max={info.max}, deadzone={info.flat}, threshold={info.fuzz}")
+            defaults[logical] = cal.fromAbsInfo(info)
+            if self.verbose:
+                print(f"{logical}: raw_min={info.min}, raw_max={info.max}, deadzone={info.flat}, threshold={info.fuzz}")
+        self.calibration = cal.loadCalibration(self._dev.name, defaults, self.calibrationPath)
+        for abs_code, logical in self.axesMap.items():
+            low, table = cal.buildTable(self.calibration[logical], self.curves.get(logical))
+            self.axis_tables[abs_code] = (low, len(table) - 1, table)
+        self._publish()
+        self.opened = True
 
-        # initialize everything
-        self.axes = {name: None for name in self.axesMap.values()}
-        self.buttons = {name: 0 for name in self.buttonMap.values()}
-        self.hat = [0, 0]
-        self.states = {'axes': self.axes, 'buttons': self.buttons, 'hat': self.hat}
+        if self.threaded:
+            self.thread = threading.Thread(target=self._updater, daemon=True)
+            self.thread.start()
+        else:
+            self.stateUpdating = True
+        return self
 
+    def close(self):
+        """Close the device. A reading thread stops with the device."""
+        if not self.opened:
+            return
+        self.opened = False
         self.stateUpdating = False
-        self.thread = threading.Thread(target=self._updater, daemon=True)
-        self.thread.start()
+        self._dev.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _useMonotonicTimestamps(self) -> float:
+        """
+        Ask the kernel to stamp events with CLOCK_MONOTONIC so they can be
+        compared with time.monotonic(). Returns the offset to add to event
+        timestamps (non-zero only if the kernel keeps using the wall clock).
+        Devices without a file descriptor (simulated ones) are left alone.
+        """
+        fd = getattr(self._dev, "fd", None)
+        if fd is None:
+            return 0.0
+        try:
+            fcntl.ioctl(fd, EVIOCSCLOCKID, struct.pack("i", time.CLOCK_MONOTONIC))
+            return 0.0
+        except OSError:
+            return time.monotonic() - time.time()
 
     def _poll(self):
         for event in self._dev.read_loop():
-            code, val = event.code, event.value
-            name = ecodes.keys[code]
-
-            if event.type == ecodes.EV_ABS:
-                # D-pad
-                if code in (ecodes.ABS_HAT0X, ecodes.ABS_HAT0Y, ecodes.ABS_HAT1X, ecodes.ABS_HAT1Y, ecodes.ABS_HAT2X, ecodes.ABS_HAT2Y, ecodes.ABS_HAT3X, ecodes.ABS_HAT3Y):
-                    if code % 2 == 0:  # X axis
-                        self.hat[0] = val
-                    else:              # Y axis
-                        self.hat[1] = val
-
-                # main analog sticks
-                elif code in self.axesMap:
-                    mapped_name = self.axesMap[code]
-                    self.axes[mapped_name] = val
-
-                # treat analog triggers as digital buttons
-                elif code == ecodes.ABS_Z:    # left trigger
-                    self.buttons['LT'] = 1 if val > self.TRIGGER_THRESHOLD else 0
-                elif code == ecodes.ABS_RZ:   # right trigger
-                    self.buttons['RT'] = 1 if val > self.TRIGGER_THRESHOLD else 0
-
-                # anything else: ignore
-                else:
-                    continue
-
-            elif event.type == ecodes.EV_KEY:
-                if code in self.buttonMap:
-                    mapped_name = self.buttonMap[code]
-                    self.buttons[mapped_name] = val
-                else:
-                    # unknown key event
-                    continue
-
-        # update combined state
-        self.states = {'axes': self.axes, 'buttons': self.buttons, 'hat': self.hat}
+            self.processEvent(event)
+
+    async def asyncPoll(self):
+        """Apply events as they arrive, for use with threaded=False inside an asyncio program."""
+        self.open()
+        async for event in self._dev.async_read_loop():
+            self.processEvent(event)
+
+    @trace.traced()
+    def processEvent(self, event):
+        """Apply one evdev input event to the gamepad state. A SYN_REPORT publishes a new snapshot."""
+        code, val = event.code, event.value
+        self._eventTime = event.timestamp() + self._timeOffset
+
+        if event.type == ecodes.EV_SYN:
+            if code == ecodes.SYN_REPORT:
+                self._publish()
+
+        elif event.type == ecodes.EV_ABS:
+            # D-pad
+            if code in (ecodes.ABS_HAT0X, ecodes.ABS_HAT0Y, ecodes.ABS_HAT1X, ecodes.ABS_HAT1Y, ecodes.ABS_HAT2X, ecodes.ABS_HAT2Y, ecodes.ABS_HAT3X, ecodes.ABS_HAT3Y):
+                if code % 2 == 0:  # X axis
+                    self.hat[0] = val
+                else:              # Y axis
+                    self.hat[1] = val
+
+            # main analog sticks: scaled by table lookup
+            elif code in self.axesMap:
+                mapped_name = self.axesMap[code]
+                self.axes[mapped_name] = val
+                low, last, table = self.axis_tables[code]
+                i = val - low
+                self.axisValues[mapped_name] = table[0 if i < 0 else last if i > last else i]
+
+            # treat analog triggers as digital buttons
+            elif code == ecodes.ABS_Z:    # left trigger
+                self.buttons['LT'] = 1 if val > self.TRIGGER_THRESHOLD else 0
+            elif code == ecodes.ABS_RZ:   # right trigger
+                self.buttons['RT'] = 1 if val > self.TRIGGER_THRESHOLD else 0
+
+            # anything else: ignore
+
+        elif event.type == ecodes.EV_KEY:
+            if code in self.buttonMap:
+                mapped_name = self.buttonMap[code]
+                self.buttons[mapped_name] = val
+            # unknown key events are ignored
+
+    def _publish(self):
+        axes = self.axes
+        buttons = self.buttons
+        scaled = self.axisValues
+        # sticks in [-1, +1], already scaled by processEvent()
+        # TODO: Verify direction of each axis. Right now, the +Y axis points down
+        values = (
+            scaled['LEFT_X'], scaled['LEFT_Y'], scaled['RIGHT_X'], scaled['RIGHT_Y'],
+            # buttons (including LT/RT from triggers)
+            buttons['Y'], buttons['B'], buttons['A'], buttons['X'],
+            buttons['LB'], buttons['RB'], buttons['LT'], buttons['RT'],
+            buttons['BACK'], buttons['START'], buttons['L_JOY'], buttons['R_JOY'],
+        )
+        seq = 0 if self._snapshot is None else self._snapshot.seq + 1
+        self._reportTimes[seq % len(self._reportTimes)] = self._eventTime    # before the snapshot is visible
+        self._snapshot = GamepadSnapshot(seq, self._eventTime, values,
+                                         MappingProxyType(dict(axes)), MappingProxyType(dict(buttons)),
+                                         tuple(self.hat))
 
     def _updater(self):
         self.stateUpdating = True
@@ -108,66 +295,70 @@ class Gamepad:
             while True:
                 self._poll()
         except Exception as e:
-            print("Gamepad thread stopped:", e)
+            if self.opened:                 # not an error when close() ended the read
+                print("Gamepad thread stopped:", e)
             self.stateUpdating = False
    
+    @property
+    def states(self) -> dict:
+        snapshot = self._snapshot or self.open()._snapshot
+        return {'axes': snapshot.axes, 'buttons': snapshot.buttons, 'hat': snapshot.hat}
+
     def getStates(self):
         return self.states
 
-    def readValues(self):
+    @property
+    def device(self):
+        """The evdev InputDevice (or stand-in) being read."""
+        return self._dev
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the newest snapshot."""
+        return (self._snapshot or self.open()._snapshot).seq
+
+    def changedSince(self, seq: int) -> bool:
+        """True if a snapshot newer than seq has been published."""
+        return self.seq != seq
+
+    def reportTime(self, seq: int) -> float:
+        """
+        Timestamp of snapshot seq, which must not be newer than the newest
+        snapshot. A reader that skipped snapshots uses it to find how long
+        the oldest input it had not seen yet has waited. Only the last 256
+        are kept: for older ones the oldest kept is returned.
+        """
+        kept = len(self._reportTimes)
+        seq = max(seq, self._snapshot.seq - kept + 1)
+        return self._reportTimes[seq % kept]
+
+    @trace.traced()
+    def snapshot(self) -> GamepadSnapshot | None:
+        """Return the newest snapshot, or None if the gamepad stopped reporting."""
+        if not self.opened:
+            self.open()
         if not self.stateUpdating:
             return None
+        return self._snapshot
 
-        # Unpack raw axis values
-        raw_left_x = self.axes['LEFT_X']
-        raw_left_y = self.axes['LEFT_Y']
-        raw_right_x = self.axes['RIGHT_X']
-        raw_right_y = self.axes['RIGHT_Y']
-        
-        # scale sticks ⇒ [-1, +1]
-        # TODO: Verify direction of each axis. Right now, the +Y axis points down
-        left_x = self._scaleAxisValue(raw_left_x, *self.axis_ranges['LEFT_X'])
-        left_y = self._scaleAxisValue(raw_left_y, *self.axis_ranges['LEFT_Y'])
-        right_x = self._scaleAxisValue(raw_right_x, *self.axis_ranges['RIGHT_X'])
-        right_y = self._scaleAxisValue(raw_right_y, *self.axis_ranges['RIGHT_Y'])
-
-        axes = [left_x, left_y, right_x, right_y]
-
-        # pack buttons (now including LT/RT from triggers)
-        buttons = np.array([
-            self.buttons['Y'],   self.buttons['B'],
-            self.buttons['A'],   self.buttons['X'],
-            self.buttons['LB'],  self.buttons['RB'],
-            self.buttons['LT'],  self.buttons['RT'],
-            self.buttons['BACK'],self.buttons['START'],
-            self.buttons['L_JOY'],self.buttons['R_JOY'],
-        ], dtype=int)
-
-        return np.hstack((axes, buttons))
-    
-    def _scaleAxisValue(self, raw_value: int | None, raw_min: int, raw_max: int, deadzone: int) -> float:
-        """Scale a raw axis value to a float in the range [-1.0, 1.0]."""
-        if raw_value is None:
-            return 0.0
-
-        # Shift raw value to be centered around zero
-        raw_cen = (raw_min + raw_max) / 2
-        centered_value = raw_value - raw_cen
-        
-        if abs(centered_value) < deadzone:
-            # Within deadzone, treat as zero
-            return 0.0
+    def readValues(self, out=None):
+        """
+        Returns the 4 scaled stick axes followed by 12 buttons. Pass a
+        16-element list or array as out to fill it in place instead of
+        allocating a new array.
+        """
+        if not self.opened:
+            self.open()
+        if not self.stateUpdating:
+            return None
+        return self._snapshot.readValues(out)
 
-        # Normalize by half of the total range
-        raw_span = (raw_max - raw_min) / 2
-        return centered_value / raw_span
 
 if __name__ == "__main__":
-    gamepad = Gamepad()
-    
-    while True:
-        data = gamepad.readValues()
-        if data is None:
-            break
-        print(data)
-        time.sleep(0.05)
\ No newline at end of file
+    with Gamepad(verbose=True) as gamepad:
+        while True:
+            data = gamepad.readValues()
+            if data is None:
+                break
+            print(data)
+            time.sleep(0.05)
\ No newline at end of file
@@ -2,55 +2,146 @@
 # files. The files can be accessed by NodeRed or other programs.
 # Nodered can be found by browsing to port 1880 on the shared network AP. ie, 192.168.8.1:1880
 # This program works on SCUTTLE with any CPU.
+#
+# The text-file functions below do not write on the caller's thread. They
+# hand their text to a TelemetryWriter, which keeps only the newest text for
+# each file and writes it from a background thread a few times per second.
+# Each file is written to a temporary name and then renamed, so NodeRed never
+# reads a half-written file. Call telemetry.flush() to write immediately.
 
 # Import external libraries
+import atexit   # for writing the last values when the program ends
 import csv      # for handling comma-separated-values file type
+import os       # for renaming the finished files into place
+import threading
+
+import L1_trace as trace                                    # spans for L1_trace.py
+
+basicsDir = "/home/debian/basics/"                          # folder for the NodeRed files
+tmpDir = "/tmp/"                                            # folder for temporary log files
+
+
+class TelemetryWriter:
+    """
+    Writes small text files from a background thread at a fixed rate.
+    write() only stores the text, replacing any value for the same file
+    that has not been written yet.
+    """
+
+    def __init__(self, rate_hz: float = 20.0, threaded: bool = True):
+        self.period = 1.0 / rate_hz
+        self.threaded = threaded    # False: the owner calls flush() itself (see L3_runtime.py)
+        self.enqueued = 0           # calls to write()
+        self.coalesced = 0          # values replaced by a newer one before being written
+        self.written = 0            # files written
+        self.dropped = 0            # values lost because their file could not be written
+        self.lastError = None
+        self._pending = {}          # path -> newest text not yet written
+        self._lock = threading.Lock()        # guards _pending and the counters
+        self._flushLock = threading.Lock()   # one flush at a time, so an older value never replaces a newer one
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+    def write(self, path: str, text: str):
+        """Queue text to become the whole content of the file at path. Never blocks on I/O."""
+        with self._lock:
+            if path in self._pending:
+                self.coalesced += 1
+            self._pending[path] = text
+            self.enqueued += 1
+            if self._thread is None and self.threaded:
+                self._start()
+
+    def flush(self):
+        """Write every pending file now, on the calling thread. Waits for a flush already in progress."""
+        with self._flushLock:
+            with self._lock:
+                pending = self._pending
+                self._pending = {}
+            written = dropped = 0
+            for path, text in pending.items():
+                temp = path + ".tmp"
+                try:
+                    with trace.span("L1_log file write"):
+                        with open(temp, 'w') as txt:
+                            txt.write(text)
+                        os.replace(temp, path)              # atomic: readers see the old or the new file
+                    written += 1
+                except OSError as e:
+                    dropped += 1
+                    self.lastError = e
+            with self._lock:
+                self.written += written
+                self.dropped += dropped
+
+    def _start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self.period)
+            self._wake.clear()
+            self.flush()
+
+    def stop(self):
+        """Stop the background thread after writing whatever is pending."""
+        with self._lock:
+            thread = self._thread
+            self._running = False
+            self._thread = None
+        if thread is not None:
+            self._wake.set()
+            thread.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "written": self.written,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+        }
+
+
+telemetry = TelemetryWriter()                               # the writer used by the functions below
+atexit.register(telemetry.stop)
+
 
 # A function for populating 2 text files with updated phi-dots
 def writeFiles(current_phis):
-    txt = open("/home/debian/basics/PDL.txt", 'w+')         # file for phi dot left
-    txt2 = open("/home/debian/basics/PDR.txt", 'w+')        # file for phi dot right
     phi_dotL = round(current_phis[0], 1)
     phi_dotR = round(current_phis[1], 1)
-    txt.write(str(round(phi_dotL, 1)))
-    txt2.write(str(round(phi_dotR, 1)))
-    txt.close()
-    txt2.close()
+    telemetry.write(basicsDir + "PDL.txt", str(phi_dotL))   # file for phi dot left
+    telemetry.write(basicsDir + "PDR.txt", str(phi_dotR))   # file for phi dot right
 
 
 # A function for populating 2 text files with updating variables
 def NodeRed2(values):                                       # this function takes a 2-element array called val
-    txt = open("/home/debian/basics/a.txt", 'w+')           # file for generic variable a
-    txt2 = open("/home/debian/basics/b.txt", 'w+')          # file for generic variable b
     a = round(values[0], 2)
     b = round(values[1], 2)
-    txt.write(str(a))
-    txt2.write(str(b))
-    txt.close()
-    txt2.close()
+    telemetry.write(basicsDir + "a.txt", str(a))            # file for generic variable a
+    telemetry.write(basicsDir + "b.txt", str(b))            # file for generic variable b
 
 
 # A function for sending 1 value to a log file of specified name
 def uniqueFile(value, fileName):                            # this function takes a 2-element array called val
-    txt = open("/home/debian/basics/" + fileName, 'w+')     # file with specified name
     myValue = round(value, 2)
-    txt.write(str(myValue))
-    txt.close()
+    telemetry.write(basicsDir + fileName, str(myValue))     # file with specified name
 
 
 # A function for sending 1 value to a log file in a temporary folder
 def tmpFile(value, fileName):                               # this function takes a 2-element array called val
-    txt = open("/tmp/" + fileName, 'w+')                    # file with specified name
     myValue = round(value, 2)
-    txt.write(str(myValue))
-    txt.close()
+    telemetry.write(tmpDir + fileName, str(myValue))        # file with specified name
     
     
 # A function for saving a single line string to a log file in a temporary folder
 def stringTmpFile(myString, fileName):     # this function takes a string and filename
-    txt = open("/tmp/" + fileName, 'w+')   # file with specified name
-    txt.write(myString)                    # by default the existing txt is overwritten
-    txt.close()
+    telemetry.write(tmpDir + fileName, myString)   # by default the existing txt is overwritten
 
 
 # A function for creating a CSV file from a list of values.
@@ -62,8 +153,9 @@ def csv_write(list):
     csvFile.close()
 
 # A function for creating a row in a csv file
+# (to log every control loop iteration, use L1_recorder.py and export to CSV afterwards)
 def csv_row(list):
-    row = list.join(",")
+    row = [str(i) for i in list]
     with open('/tmp/excel_data.csv', 'a') as csvFile:
         writer = csv.writer(csvFile)
         writer.writerow(row)
@@ -1,18 +1,54 @@
-from L1_pwm import pwm_from_gpio_pin
-import numpy as np
+from L1_pwm import channels_from_gpio_pins, startup_report
+from L1_rounding import RINT    # rounds like np.rint in plain float math
+import L1_trace as trace
 import time
 
-p0 = pwm_from_gpio_pin(6)
-p1 = pwm_from_gpio_pin(5)
-p2 = pwm_from_gpio_pin(13)
-p3 = pwm_from_gpio_pin(12)
+pins = (6, 5, 13, 12)   # GPIO pins: left channel A, left channel B, right channel A, right channel B
+pwms = None             # PWM outputs for the pins above, opened on first use (see getOutputs)
+duties = [0.0, 0.0, 0.0, 0.0]   # last duty cycle written to each pin above, for logging
 
-# configure and enable
-for p in (p0,p1,p2,p3):
-    p.frequency = 20000
-    p.enable()
+def openOutputs() -> list:
+    """Export, configure and enable the four motor PWM channels."""
+    start = time.perf_counter()
+    outputs = channels_from_gpio_pins(pins)
+    for p in outputs:
+        p.frequency = 20000
+        p.enable()
+    print(startup_report(), f"(total {(time.perf_counter() - start) * 1000:.1f} ms)")
+    return outputs
+
+def getOutputs() -> list:
+    """Return the motor PWM outputs, opening them if needed."""
+    global pwms
+    if pwms is None:
+        pwms = openOutputs()
+    return pwms
+
+def setOutputs(outputs):
+    """Use other PWM-like objects (anything with a duty_cycle attribute) for the motors."""
+    global pwms
+    pwms = list(outputs)
+
+def closeOutputs():
+    """Disable and release the motor PWM outputs."""
+    global pwms
+    if pwms is None:
+        return
+    for p in pwms:
+        p.disable()
+        p.close()
+    pwms = None
+
+def outputStats() -> dict:
+    """Write counts and time per pin for outputs that keep them (see L1_pwm.PWMChannel)."""
+    if pwms is None:
+        return {}
+    return {pin: p.stats() for pin, p in zip(pins, pwms) if hasattr(p, "stats")}
 
 def computePWM(speed: float) -> tuple[float, float]:
+    # Plain float math: on this CPU, NumPy's per-call overhead on scalars costs
+    # far more than the arithmetic. (y * 100 + RINT - RINT) / 100 is exactly
+    # np.round(y, 2), without allocating like round() does.
     if speed == 0:
         return 0, 0
     else:
@@ -20,24 +56,30 @@ def computePWM(speed: float) -> tuple[float, float]:
         x = speed + 1.0
         
         # Channel A sweeps low to high
-        chA = 0.5 * x
-        chA = np.round(chA, 2)
+        chA = (0.5 * x * 100 + RINT - RINT) / 100
         
         # Channel B sweeps high to low
-        chB = 1 - (0.5 * x)
-        chB = np.round(chB, 2)
+        chB = ((1 - (0.5 * x)) * 100 + RINT - RINT) / 100
         
-        chA, chB = np.clip([chA, chB], 0, 1)
+        # Clip both channels to [0,1]
+        chA = 0.0 if chA < 0 else 1.0 if chA > 1 else chA
+        chB = 0.0 if chB < 0 else 1.0 if chB > 1 else chB
 
         return chA, chB
 
+@trace.traced()
 def driveLeft(speed: float):
     chA, chB = computePWM(speed)
-    p0.duty_cycle, p1.duty_cycle = chA, chB
+    p = getOutputs()
+    p[0].duty_cycle, p[1].duty_cycle = chA, chB
+    duties[0], duties[1] = chA, chB
 
+@trace.traced()
 def driveRight(speed: float):
     chA, chB = computePWM(speed)
-    p2.duty_cycle, p3.duty_cycle = chA, chB
+    p = getOutputs()
+    p[2].duty_cycle, p[3].duty_cycle = chA, chB
+    duties[2], duties[3] = chA, chB
 
 def drive(speed):
     """speed ∈ [-1.0…+1.0]: + forward, - reverse, 0 stop"""
@@ -67,12 +109,4 @@ if __name__ == "__main__":
         print("Stopping")
         drive(0)
     finally:
-        p0.disable()
-        p1.disable()
-        p0.close()
-        p1.close()
-
-        p2.disable()
-        p3.disable()
-        p2.close()
-        p3.close()
\ No newline at end of file
+        closeOutputs()
@@ -1,40 +1,134 @@
+import json
 import os
 import re
+import subprocess
+import time
 from pathlib import PurePath
 from periphery import PWM
 
 _trailing_num_re = re.compile(r"\d+$")
+sysfs_root = "/sys/class/pwm"   # where PWMChannel looks for pwmchipN (a fake tree in tests, see L1_fakesysfs.py)
+hat_dir = "/dev/hat/pwm"        # GPIO<n> links made by beagle-pwm-export
+cache_path = os.path.expanduser("~/.cache/scuttle/pwm_map.json")   # mappings found since the last boot
+startup_times = {}              # seconds spent in each phase of the last map_gpio_pins()/channels_from_gpio_pins()
+
+
+def _boot_id() -> str:
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _load_cache() -> dict[int, tuple[int, int]]:
+    """Mappings saved during this boot. The pin muxing done by beagle-pwm-export does not survive a reboot."""
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("boot_id") != _boot_id():
+        return {}
+    return {int(pin): tuple(chip_channel) for pin, chip_channel in cache.get("pins", {}).items()}
+
+
+def _save_cache(mapping: dict[int, tuple[int, int]]):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w") as f:
+            json.dump({"boot_id": _boot_id(), "pins": {str(pin): list(cc) for pin, cc in mapping.items()}}, f)
+    except OSError:
+        pass                    # only a cache: the next start maps the pins again
+
+
+def _chip_exists(chip_num: int) -> bool:
+    return os.path.isdir(f"{sysfs_root}/pwmchip{chip_num}")
+
+
+def _read_hat_link(gpio_pin: int) -> tuple[int, int] | None:
+    """
+    Returns (chip, channel) from the /dev/hat/pwm link of a pin, or None if
+    there is no usable link. The link points at .../pwmchipN/pwmM, which
+    disappears whenever the channel is unexported, so only the link itself
+    and the chip are checked, not the channel directory.
+    """
+    hat_path = f"{hat_dir}/GPIO{gpio_pin}"
+    if not os.path.islink(hat_path):
+        return None
+    parts = PurePath(os.readlink(hat_path)).parts[-2:]
+    if len(parts) != 2 or not parts[0].startswith("pwmchip") or not parts[1].startswith("pwm"):
+        return None
+    chip_match = _trailing_num_re.search(parts[0])
+    channel_match = _trailing_num_re.search(parts[1])
+    if chip_match is None or channel_match is None:
+        return None
+    chip_num, channel_num = int(chip_match.group()), int(channel_match.group())
+    if not _chip_exists(chip_num):
+        return None
+    return chip_num, channel_num
+
+
+def _export_pins(gpio_pins: list[int]):
+    """Run beagle-pwm-export for all the pins at once."""
+    print("Mapping", ", ".join(f"GPIO{pin}" for pin in gpio_pins), "to PWM chips... (sudo required)")
+
+    # It seems the symlinks break after the script ends, so we'll
+    # want to clean things up before we set it up again
+    stale = [f"{hat_dir}/GPIO{pin}" for pin in gpio_pins if os.path.lexists(f"{hat_dir}/GPIO{pin}")]
+    if stale:
+        subprocess.run(["sudo", "rm", "-f", *stale])
+
+    exports = [subprocess.Popen(["sudo", "beagle-pwm-export", "--pin", f"gpio{pin}"]) for pin in gpio_pins]
+    failed = [pin for pin, export in zip(gpio_pins, exports) if export.wait() != 0]
+    if failed:
+        raise KeyError(f"beagle-pwm-export failed for GPIO{failed}")
+
+
+def map_gpio_pins(gpio_pins) -> dict[int, tuple[int, int]]:
+    """
+    Returns {pin: (chip, channel)} for the requested GPIO pins, exporting
+    only the pins that are not mapped yet, all in one step.
+    """
+    start = time.perf_counter()
+    cache = _load_cache()
+    startup_times["cache"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mapping = {}
+    missing = []
+    for pin in gpio_pins:
+        cached = cache.get(pin)
+        if cached is not None and _chip_exists(cached[0]):
+            mapping[pin] = cached
+        else:
+            linked = _read_hat_link(pin)
+            if linked is not None:
+                mapping[pin] = linked
+            else:
+                missing.append(pin)
+    startup_times["links"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if missing:
+        _export_pins(missing)
+        for pin in missing:
+            linked = _read_hat_link(pin)
+            if linked is None:
+                raise KeyError(f"no PWM link for GPIO{pin} after beagle-pwm-export")
+            mapping[pin] = linked
+    startup_times["export"] = time.perf_counter() - start
+
+    if any(cache.get(pin) != chip_channel for pin, chip_channel in mapping.items()):
+        _save_cache({**cache, **mapping})
+    return mapping
+
 
 def pwm_chip_from_gpio_pin(gpio_pin: int) -> tuple[int, int]:
     """
     Returns the hardware PWM chip and channel numbers for the requested GPIO pin.
     """
-    hat_path = f"/dev/hat/pwm/GPIO{gpio_pin}"
-
-    # Check if the friendly mapping already exists
-    if not os.path.isdir(hat_path) or os.readlink(hat_path) == None:
-        # Use beagle-pwm-export to map the chip/channel path
-        # to a known friendly name
-        print(f"Mapping GPIO{gpio_pin} to PWM chip... (sudo required)")
-        
-        # It seems the symlinks break after the script ends, so we'll
-        # want to clean things up before we set it up again
-        command = f"sudo rm {hat_path}"
-        os.system(command)
-        
-        command = f"sudo beagle-pwm-export --pin gpio{gpio_pin}"
-        exit_code = os.system(command)
-        if exit_code != 0:
-            raise KeyError()
-    
-    # Pull the chip and channel numbers from the symlinked path
-    target_path = PurePath(os.readlink(hat_path))
-    chip_part, channel_part = target_path.parts[-2:]
-
-    chip_num = int(_trailing_num_re.search(chip_part).group())
-    channel_num = int(_trailing_num_re.search(channel_part).group())
-
-    return chip_num, channel_num
+    return map_gpio_pins([gpio_pin])[gpio_pin]
 
 
 def pwm_from_gpio_pin(gpio_pin: int) -> PWM:
@@ -45,7 +139,138 @@ def pwm_from_gpio_pin(gpio_pin: int) -> PWM:
     return PWM(chip_num, channel_num)
 
 
+class PWMChannel:
+    """
+    A sysfs PWM channel for fast, repeated duty cycle updates. Unlike
+    periphery.PWM it keeps the period in memory and the duty_cycle file open,
+    writes it with a single pwrite(), and skips the write entirely when the
+    duty cycle in nanoseconds has not changed.
+    """
+
+    _EXPORT_RETRIES = 10
+    _EXPORT_DELAY = 0.1
+
+    def __init__(self, chip: int, channel: int, root: str | None = None):
+        self.chip = chip
+        self.channel = channel
+        root = root or sysfs_root
+        chip_path = f"{root}/pwmchip{chip}"
+        self.devpath = f"{chip_path}/pwm{channel}"
+        if not os.path.isdir(chip_path):
+            raise LookupError(f"PWM chip {chip} not found in {root}")
+        if not os.path.isdir(self.devpath):
+            with open(f"{chip_path}/export", "w") as f:
+                f.write(f"{channel}\n")
+            for _ in range(self._EXPORT_RETRIES):  # the kernel and udev take a moment
+                if os.access(f"{self.devpath}/period", os.W_OK):
+                    break
+                time.sleep(self._EXPORT_DELAY)
+            else:
+                raise TimeoutError(f"exporting PWM: waiting for {self.devpath} timed out")
+
+        self._chip_path = chip_path
+        self._duty_fd = os.open(f"{self.devpath}/duty_cycle", os.O_RDWR)
+        self._enable_fd = os.open(f"{self.devpath}/enable", os.O_RDWR)
+        with open(f"{self.devpath}/period") as f:
+            self._period_ns = int(f.read())
+        self._duty_ns = int((os.pread(self._duty_fd, 32, 0).split() or [b"0"])[0])
+        self._duty = self._duty_ns / self._period_ns if self._period_ns else 0.0
+
+        self.writes = 0             # duty cycle writes that reached sysfs
+        self.skipped = 0            # duty cycle updates that did not change the output
+        self.write_ns = 0           # time spent in those writes (ns)
+
+    @property
+    def period_ns(self) -> int:
+        return self._period_ns
+
+    @period_ns.setter
+    def period_ns(self, value: int):
+        if self._duty_ns > value:   # the kernel rejects a period shorter than the duty cycle
+            self._write_duty_ns(0)
+        with open(f"{self.devpath}/period", "w") as f:
+            f.write(f"{value}\n")
+        self._period_ns = value
+        duty_ns = int(self._duty * value)           # keep the same duty cycle ratio
+        if duty_ns != self._duty_ns:
+            self._write_duty_ns(duty_ns)
+
+    @property
+    def frequency(self) -> float:
+        return 1e9 / self._period_ns
+
+    @frequency.setter
+    def frequency(self, value: float):
+        self.period_ns = int(1e9 / value)
+
+    @property
+    def duty_cycle(self) -> float:
+        return self._duty
+
+    @duty_cycle.setter
+    def duty_cycle(self, value: float):
+        self._duty = value
+        duty_ns = int(value * self._period_ns)
+        if duty_ns == self._duty_ns:
+            self.skipped += 1
+            return
+        self._write_duty_ns(duty_ns)
+
+    def _write_duty_ns(self, duty_ns: int):
+        start = time.perf_counter_ns()
+        os.pwrite(self._duty_fd, b"%d\n" % duty_ns, 0)
+        self.write_ns += time.perf_counter_ns() - start
+        self.writes += 1
+        self._duty_ns = duty_ns
+
+    @property
+    def enabled(self) -> bool:
+        return os.pread(self._enable_fd, 4, 0).strip() == b"1"
+
+    def enable(self):
+        os.pwrite(self._enable_fd, b"1\n", 0)
+
+    def disable(self):
+        os.pwrite(self._enable_fd, b"0\n", 0)
+
+    def stats(self) -> dict:
+        return {"writes": self.writes, "skipped": self.skipped, "write_ms": self.write_ns / 1e6}
+
+    def close(self):
+        """Close the files and unexport the channel, like periphery.PWM.close()."""
+        if self._duty_fd is None:
+            return
+        os.close(self._duty_fd)
+        os.close(self._enable_fd)
+        self._duty_fd = self._enable_fd = None
+        with open(f"{self._chip_path}/unexport", "w") as f:
+            f.write(f"{self.channel}\n")
+
+
+def channel_from_gpio_pin(gpio_pin: int) -> PWMChannel:
+    """
+    Returns a PWMChannel for the requested GPIO pin.
+    """
+    return channels_from_gpio_pins([gpio_pin])[0]
+
+
+def channels_from_gpio_pins(gpio_pins) -> list[PWMChannel]:
+    """
+    Returns PWMChannels for the requested GPIO pins, mapping them together.
+    """
+    mapping = map_gpio_pins(gpio_pins)
+    start = time.perf_counter()
+    channels = [PWMChannel(*mapping[pin]) for pin in gpio_pins]
+    startup_times["open"] = time.perf_counter() - start
+    return channels
+
+
+def startup_report() -> str:
+    return "PWM startup: " + ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in startup_times.items())
+
+
 if __name__ == "__main__":
     gpio_pin = int(input("GPIO pin to map: "))
     chip_num, channel_num = pwm_chip_from_gpio_pin(gpio_pin)
     print(f"GPIO{gpio_pin} is on PWM chip {chip_num}, channel {channel_num}")
+    print(startup_report())
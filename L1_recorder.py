@@ -0,0 +1,203 @@
+# L1_recorder.py
+# A flight recorder for SCUTTLE: appends fixed-size binary records (time,
+# encoder angles, phi dots, gamepad axes and buttons, motor duty cycles) to a
+# preallocated memory-mapped file, fast enough to log every control loop
+# iteration. Recordings are read back as NumPy structured arrays without
+# copying, and can be exported to CSV for spreadsheets.
+# This program runs on SCUTTLE with any CPU.
+#
+# Usage:
+#   python L1_recorder.py info /tmp/scuttle.rec
+#   python L1_recorder.py export /tmp/scuttle.rec /tmp/excel_data.csv
+
+# Import external libraries
+import json
+import mmap
+import os
+import sys
+import numpy as np
+
+MAGIC = b"SCUTREC1"
+HEADER_SIZE = 512                                       # bytes before the first record
+
+# one record per control loop iteration
+RECORD_DTYPE = np.dtype([
+    ("t", "<f8"),                                       # time.monotonic() (s)
+    ("encoders", "<f4", (2,)),                          # shaft angles [L, R] (degrees)
+    ("phiDots", "<f4", (2,)),                           # wheel speeds [L, R] (rad/s)
+    ("axes", "<f4", (4,)),                              # gamepad axes [LEFT_X, LEFT_Y, RIGHT_X, RIGHT_Y]
+    ("buttons", "<u2"),                                 # gamepad buttons, bit i = button i of readValues()[4:]
+    ("duties", "<f4", (4,)),                            # PWM duty cycles [left A, left B, right A, right B]
+])
+
+# header layout: magic, record size, capacity, count, then the dtype as JSON
+_HEADER_DTYPE = np.dtype([("magic", "S8"), ("recordSize", "<u4"), ("pad", "<u4"),
+                          ("capacity", "<u8"), ("count", "<u8")])
+
+
+def buttonBits(buttons) -> int:
+    """Pack a sequence of 0/1 button states into an integer, first button in bit 0."""
+    bits = 0
+    for i, pressed in enumerate(buttons):
+        if pressed:
+            bits |= 1 << i
+    return bits
+
+
+class FlightRecorder:
+    """
+    Appends records to `path`. The file is preallocated to hold maxBytes of
+    records; when it is full it is renamed to path.1 (path.1 to path.2 and
+    so on, keeping maxFiles files) and a new one is started.
+    """
+
+    def __init__(self, path: str = "/tmp/scuttle.rec", maxBytes: int = 32 * 2**20,
+                 maxFiles: int = 4, dtype: np.dtype = RECORD_DTYPE):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.capacity = max(1, (maxBytes - HEADER_SIZE) // self.dtype.itemsize)
+        self.maxFiles = max(1, maxFiles)
+        self.rotations = 0
+        self._map = None
+        self._open()
+
+    def _open(self):
+        size = HEADER_SIZE + self.capacity * self.dtype.itemsize
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, size)         # reserve the blocks now, not during the loop
+            else:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        header = np.ndarray((), _HEADER_DTYPE, self._map, 0)
+        header["magic"] = MAGIC
+        header["recordSize"] = self.dtype.itemsize
+        header["capacity"] = self.capacity
+        header["count"] = 0
+        descr = json.dumps(self.dtype.descr).encode()
+        start = _HEADER_DTYPE.itemsize
+        if start + len(descr) > HEADER_SIZE:
+            raise ValueError("record dtype description does not fit in the header")
+        self._map[start:start + len(descr)] = descr
+
+        self._count = header["count"][...]                 # view into the header, updated after every record
+        self.records = np.ndarray((self.capacity,), self.dtype, self._map, HEADER_SIZE)
+        self._columns = [self.records[name] for name in self.dtype.names]
+        self.count = 0
+
+    def record(self, *values):
+        """Append one record; the values are given in the order of the dtype fields."""
+        if self.count >= self.capacity:
+            self._rotate()
+        i = self.count
+        for column, value in zip(self._columns, values):
+            column[i] = value
+        self.count = i + 1
+        self._count[...] = self.count                   # readers only trust records below the count
+
+    def _rotate(self):
+        self._close()
+        for n in range(self.maxFiles - 1, 0, -1):       # path.(n-1) -> path.n, oldest falls off the end
+            older = self.path if n == 1 else f"{self.path}.{n - 1}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{n}")
+        if self.maxFiles == 1:
+            os.remove(self.path)
+        self.rotations += 1
+        self._open()
+
+    def _close(self):
+        if self._map is None:
+            return
+        used = HEADER_SIZE + self.count * self.dtype.itemsize
+        self.records = None
+        self._columns = None
+        self._count = None
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        os.truncate(self.path, used)                    # give back the unused preallocated space
+
+    def flush(self):
+        if self._map is not None:
+            self._map.flush()
+
+    def close(self):
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def loadRecording(path: str) -> np.ndarray:
+    """Return the records in one file as a read-only structured array mapped from the file (no copy)."""
+    header = np.fromfile(path, _HEADER_DTYPE, count=1)[0]
+    if header["magic"] != MAGIC:
+        raise ValueError(f"{path} is not a SCUTTLE recording")
+    with open(path, "rb") as f:
+        f.seek(_HEADER_DTYPE.itemsize)
+        descr = f.read(HEADER_SIZE - _HEADER_DTYPE.itemsize).rstrip(b"\0")
+    dtype = np.dtype([tuple(field) if len(field) == 2 else (field[0], field[1], tuple(field[2]))
+                      for field in json.loads(descr)])
+    count = int(header["count"])
+    if count == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def loadRecordings(path: str) -> np.ndarray:
+    """Return the current file and its rotated predecessors joined in time order (copies the data)."""
+    paths = [path]
+    n = 1
+    while os.path.exists(f"{path}.{n}"):
+        paths.insert(0, f"{path}.{n}")
+        n += 1
+    return np.concatenate([loadRecording(p) for p in paths])
+
+
+def columnNames(dtype: np.dtype) -> list[str]:
+    names = []
+    for name in dtype.names:
+        shape = dtype[name].shape
+        names += [name] if not shape else [f"{name}_{i}" for i in range(int(np.prod(shape)))]
+    return names
+
+
+def exportCsv(records: np.ndarray, csvPath: str):
+    """Write records to a CSV file with one column per value, for spreadsheets."""
+    columns = []
+    formats = []
+    for name in records.dtype.names:
+        column = records[name].reshape(len(records), -1)
+        kind = column.dtype
+        fmt = "%d" if kind.kind in "iu" else "%.7g" if kind.itemsize == 4 else "%.6f"
+        columns.append(column.astype(np.float64))
+        formats += [fmt] * column.shape[1]
+    table = np.hstack(columns) if columns else np.zeros((0, 0))
+    np.savetxt(csvPath, table, fmt=formats, delimiter=",",
+               header=",".join(columnNames(records.dtype)), comments="")
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("info", "export"):
+        print("usage: python L1_recorder.py info|export RECORDING [CSV]")
+        sys.exit(1)
+
+    records = loadRecordings(sys.argv[2])
+    if sys.argv[1] == "info":
+        print(len(records), "records")
+        if len(records):
+            duration = records["t"][-1] - records["t"][0]
+            print(f"{duration:.2f} s, {len(records) / max(duration, 1e-9):.1f} records/s")
+    else:
+        csvPath = sys.argv[3] if len(sys.argv) > 3 else "/tmp/excel_data.csv"
+        exportCsv(records, csvPath)
+        print("wrote", len(records), "records to", csvPath)
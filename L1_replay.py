@@ -0,0 +1,246 @@
+# L1_replay.py
+# Captures the raw evdev events of the gamepad, with their timestamps, to a
+# compact binary file, and plays them back through ReplayDevice, a stand-in
+# for an evdev InputDevice that L1_gamepad.Gamepad reads like the real one.
+# Playback runs at recorded speed, N times faster, or as fast as possible,
+# and needs no /dev/uinput access, so the same driving session can be
+# repeated when comparing loop throughput and latency between builds.
+# This program runs on SCUTTLE with any CPU.
+#
+# Usage:
+#   python L1_replay.py record /tmp/drive.gpe [--seconds 60]   # Ctrl-C stops the capture
+#   python L1_replay.py info /tmp/drive.gpe
+#   python L1_replay.py play /tmp/drive.gpe [--speed 4]        # 0 plays as fast as possible
+#   python L3_gpDemo.py --replay /tmp/drive.gpe [--speed 4]
+
+# Import external libraries
+import argparse
+import asyncio
+import json
+import struct
+import threading
+import time
+import numpy as np
+from evdev import AbsInfo, InputEvent, ecodes
+
+MAGIC = b"SCUTGPE1"
+EVENT_DTYPE = np.dtype([
+    ("t", "<f8"),                                       # event timestamp (s)
+    ("type", "<u2"),
+    ("code", "<u2"),
+    ("value", "<i4"),
+])
+_LENGTH = struct.Struct("<I")                           # size of the JSON header after MAGIC
+
+
+class EventRecorder:
+    """
+    Writes the events of `device` to `path`: a short header describing the
+    device (name, capabilities and absinfo of every axis) followed by one
+    16-byte record per event. Records are buffered and written in blocks.
+    """
+
+    def __init__(self, path: str, device, bufferEvents: int = 256):
+        self.path = path
+        self.count = 0
+        self._buffer = np.empty(bufferEvents, EVENT_DTYPE)
+        self._used = 0
+        caps = device.capabilities(absinfo=False)
+        header = {
+            "name": device.name,
+            "capabilities": {str(type): list(codes) for type, codes in caps.items()},
+            "absinfo": {str(code): list(device.absinfo(code)) for code in caps.get(ecodes.EV_ABS, [])},
+        }
+        encoded = json.dumps(header).encode()
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + _LENGTH.pack(len(encoded)) + encoded)
+
+    def write(self, event):
+        """Append one evdev InputEvent."""
+        self._buffer[self._used] = (event.timestamp(), event.type, event.code, event.value)
+        self._used += 1
+        self.count += 1
+        if self._used == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        self._file.write(self._buffer[:self._used].tobytes())
+        self._file.flush()
+        self._used = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def loadEvents(path: str) -> tuple[dict, np.ndarray]:
+    """Returns the header and the events of a capture, as a structured array with EVENT_DTYPE."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a gamepad event capture")
+        (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+        header = json.loads(f.read(length))
+        events = np.fromfile(f, EVENT_DTYPE)
+    return header, events
+
+
+def record(path: str, device=None, seconds: float | None = None) -> int:
+    """Capture the events of device (by default the first gamepad) until Ctrl-C or for `seconds`."""
+    import select
+    import L1_gamepad as gp
+    device = device or gp.findGamepad()
+    deadline = None if seconds is None else time.monotonic() + seconds
+    print(f"Recording {device.name} to {path}, Ctrl-C to stop")
+    with EventRecorder(path, device) as recorder:
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if select.select([device.fd], [], [], timeout)[0]:
+                    for event in device.read():
+                        recorder.write(event)
+        except KeyboardInterrupt:
+            pass
+    device.close()
+    print("recorded", recorder.count, "events")
+    return recorder.count
+
+
+class ReplayDevice:
+    """
+    Stands in for an evdev InputDevice, playing back a capture. speed is
+    relative to the recording (2 is twice as fast); 0 plays every event
+    as soon as the reader asks for it. Replayed events are stamped with
+    clock() at the time they are due, so Gamepad latency measurements
+    work as with a real device. `finished` is set after the last event.
+    """
+
+    fd = None                                           # no file descriptor: Gamepad leaves the clock alone
+
+    def __init__(self, path: str, speed: float = 1.0, clock=time.monotonic, sleep=time.sleep):
+        self.path = path
+        self.speed = speed
+        self.clock = clock
+        self.sleep = sleep
+        self.header, events = loadEvents(path)
+        self.name = self.header["name"]
+        self.played = 0                                 # events handed out so far
+        self.finished = threading.Event()
+        self._closed = threading.Event()
+        self._start = None
+        self._rows = list(zip(events["type"].tolist(), events["code"].tolist(), events["value"].tolist()))
+        offsets = events["t"] - events["t"][0] if len(events) else events["t"]
+        self._due = (offsets / speed).tolist() if speed else None   # time of each event after the start (s)
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def duration(self) -> float:
+        """Playback time from the first to the last event (s), 0 when playing as fast as possible."""
+        return self._due[-1] if self._due else 0.0
+
+    def capabilities(self, verbose=False, absinfo=True):
+        caps = {}
+        for type, codes in self.header["capabilities"].items():
+            type = int(type)
+            if absinfo and type == ecodes.EV_ABS:
+                caps[type] = [(code, self.absinfo(code)) for code in codes]
+            else:
+                caps[type] = list(codes)
+        return caps
+
+    def absinfo(self, axis_num):
+        return AbsInfo(*self.header["absinfo"][str(axis_num)])
+
+    def _event(self, t: float, i: int):
+        type, code, value = self._rows[i]
+        sec = int(t)
+        return InputEvent(sec, int((t - sec) * 1e6), type, code, value)
+
+    def _nextDue(self) -> float:
+        if self._start is None:
+            self._start = self.clock()
+        return self.clock() if self._due is None else self._start + self._due[self.played]
+
+    def read_loop(self):
+        """Yield the events at their playback times. Blocks after the last one until close()."""
+        while self.played < len(self._rows) and not self._closed.is_set():
+            due = self._nextDue()
+            wait = due - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+            event = self._event(due, self.played)
+            self.played += 1
+            yield event
+        self.finished.set()
+        self._closed.wait()
+        raise OSError("replay device closed")
+
+    async def async_read_loop(self):
+        """read_loop() for asyncio programs. Returns after the last event once the device is closed."""
+        while self.played < len(self._rows) and not self._closed.is_set():
+            due = self._nextDue()
+            wait = due - self.clock()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            event = self._event(due, self.played)
+            self.played += 1
+            yield event
+        self.finished.set()
+        while not self._closed.is_set():
+            await asyncio.sleep(0.05)
+
+    def eventsUntil(self, now: float) -> list:
+        """
+        The events due by `now`, for programs that feed Gamepad.processEvent()
+        themselves (threaded=False), such as the simulation. The first call
+        starts playback at `now`.
+        """
+        if self._start is None:
+            self._start = now
+        events = []
+        while self.played < len(self._rows):
+            due = now if self._due is None else self._start + self._due[self.played]
+            if due > now:
+                break
+            events.append(self._event(due, self.played))
+            self.played += 1
+        if self.played == len(self._rows):
+            self.finished.set()
+        return events
+
+    def close(self):
+        self._closed.set()
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture and replay gamepad events")
+    parser.add_argument("command", choices=["record", "info", "play"])
+    parser.add_argument("path")
+    parser.add_argument("--seconds", type=float, help="stop recording after this long")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed, 0 for as fast as possible")
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.path, seconds=args.seconds)
+    elif args.command == "info":
+        header, events = loadEvents(args.path)
+        reports = np.count_nonzero((events["type"] == ecodes.EV_SYN) & (events["code"] == ecodes.SYN_REPORT))
+        length = events["t"][-1] - events["t"][0] if len(events) else 0.0
+        print(f"{header['name']}: {len(events)} events, {reports} reports over {length:.2f} s")
+    else:
+        import L1_gamepad as gp
+        device = ReplayDevice(args.path, args.speed)
+        start = time.perf_counter()
+        with gp.Gamepad(device) as gamepad:
+            device.finished.wait()
+            elapsed = time.perf_counter() - start
+            print(f"played {device.played} events in {elapsed:.3f} s, last snapshot {gamepad.seq}:",
+                  gamepad.snapshot().values)
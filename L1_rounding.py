@@ -0,0 +1,7 @@
+# L1_rounding.py
+# Rounding for plain float math, shared by the motor driver and the control
+# math without either importing the other. Imports nothing, so it costs
+# nothing to import from any layer.
+# This program runs on SCUTTLE with any CPU.
+
+RINT = 6755399441055744.0   # 1.5 * 2**52: (y + RINT) - RINT rounds y half-to-even like np.rint, without NumPy
@@ -0,0 +1,166 @@
+# L1_shmring.py
+# A ring buffer of fixed-size records in shared memory, for passing samples
+# from one process to another without pipes or pickling. There is one writer
+# per ring. Every slot carries its own sequence number, written last, so a
+# reader can tell a complete record from one that is being overwritten.
+# This program runs on SCUTTLE with any CPU.
+
+# Import external libraries
+import os
+import struct
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+MAGIC = b"SCUTRNG1"
+HEADER_SIZE = 64
+
+_HEADER_DTYPE = np.dtype([("magic", "S8"), ("slotSize", "<u4"), ("size", "<u4"), ("count", "<u8"),
+                          ("owner", "<u4")])
+_OWNER = struct.Struct("<I")                            # PID of the process that created a block
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:                             # alive, but another user's
+        pass
+    return True
+
+
+def createSharedMemory(name: str, size: int, ownerOffset: int) -> shared_memory.SharedMemory:
+    """
+    Create the block `name` and store this process's PID in it at ownerOffset.
+    If a block of that name exists and the process that created it has exited,
+    the block was left behind by a crash and is replaced. If that process is
+    still running, FileExistsError names it and the block is left alone.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+    except FileExistsError:
+        old = shared_memory.SharedMemory(name)
+        owner = _OWNER.unpack_from(old.buf, ownerOffset)[0] if old.size >= ownerOffset + _OWNER.size else 0
+        if owner and _running(owner):
+            resource_tracker.unregister(old._name, "shared_memory")   # not ours to remove at exit
+            old.close()
+            raise FileExistsError(f"shared memory block {name} is in use by process {owner}") from None
+        old.close()
+        old.unlink()
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+    _OWNER.pack_into(shm.buf, ownerOffset, os.getpid())
+    return shm
+
+
+def attachSharedMemory(name: str, sharedTracker: bool = False) -> shared_memory.SharedMemory:
+    """
+    Open an existing block without letting this process's resource tracker
+    unlink it on exit. Pass sharedTracker=True in a process started by the
+    block's owner through multiprocessing: it uses the owner's tracker, which
+    must keep the block registered.
+    """
+    shm = shared_memory.SharedMemory(name)
+    # Python 3.11 registers attached blocks with the resource tracker too,
+    # which would unlink the owner's block when this process exits.
+    if not sharedTracker:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class ShmRing:
+    """
+    `size` records of `dtype` in the shared memory block `name`. The owner
+    (create=True) allocates and finally unlinks the block; other processes
+    attach to it with create=False, as the writer or as readers
+    (see attachSharedMemory for sharedTracker).
+    """
+
+    def __init__(self, name: str, dtype: np.dtype, size: int = 256, create: bool = False,
+                 sharedTracker: bool = False):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        slotDtype = np.dtype([("seq", "<u8"), ("data", self.dtype)])
+        self.owner = create
+        if create:
+            nbytes = HEADER_SIZE + size * slotDtype.itemsize
+            self.shm = createSharedMemory(name, nbytes, _HEADER_DTYPE.fields["owner"][1])
+            header = np.ndarray((), _HEADER_DTYPE, self.shm.buf, 0)
+            header["magic"] = MAGIC
+            header["slotSize"] = slotDtype.itemsize
+            header["size"] = size
+            header["count"] = 0
+        else:
+            self.shm = attachSharedMemory(name, sharedTracker)
+            header = np.ndarray((), _HEADER_DTYPE, self.shm.buf, 0)
+            if header["magic"] != MAGIC or header["slotSize"] != slotDtype.itemsize:
+                raise ValueError(f"shared memory block {name} does not hold a ring of {self.dtype}")
+            size = int(header["size"])
+
+        self.size = size
+        self._header = header
+        self._count = header["count"][...]          # records ever written, updated after each record
+        self._slots = np.ndarray((size,), slotDtype, self.shm.buf, HEADER_SIZE)
+        self._seqs = self._slots["seq"]
+        self._columns = [self._slots["data"][name] for name in self.dtype.names]
+        self.written = int(self._count)             # the writer's own copy of the count
+
+    @property
+    def count(self) -> int:
+        """Number of records written so far; the newest is record count - 1."""
+        return int(self._count)
+
+    def append(self, *values):
+        """Write the next record; the values are given in the order of the dtype fields."""
+        n = self.written
+        i = n % self.size
+        self._seqs[i] = 0                           # readers skip the slot while it is rewritten
+        for column, value in zip(self._columns, values):
+            column[i] = value
+        self._seqs[i] = n + 1
+        self.written = n + 1
+        self._count[...] = n + 1
+
+    def read(self, n: int, out: np.ndarray) -> bool:
+        """Copy record n into out (an array of shape () and the ring's dtype). False if it is not available."""
+        slot = self._slots[n % self.size]
+        if slot["seq"] != n + 1:
+            return False
+        out[...] = slot["data"]
+        return slot["seq"] == n + 1                 # still the same record after the copy
+
+    def latest(self, out: np.ndarray) -> int:
+        """Copy the newest record into out and return its number, or -1 if nothing was written yet."""
+        while True:
+            n = int(self._count) - 1
+            if n < 0 or self.read(n, out):
+                return n
+
+    def close(self):
+        """Detach, and remove the block if this process created it."""
+        if self.shm is None:
+            return
+        self._header = self._count = self._slots = self._seqs = self._columns = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    import time
+    dtype = np.dtype([("t", "<f8"), ("angles", "<f8", (2,))])
+    with ShmRing("scuttle_ring_demo", dtype, size=8, create=True) as writer:
+        reader = ShmRing("scuttle_ring_demo", dtype, sharedTracker=True)     # same process, same tracker
+        record = np.zeros((), dtype)
+        for i in range(20):
+            writer.append(time.monotonic(), (i, -i))
+        print("newest record:", reader.latest(record), record)
+        print("record 3 is gone:", not reader.read(3, record), "\trecord 15:", reader.read(15, record), record)
+        reader.close()
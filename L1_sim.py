@@ -0,0 +1,283 @@
+# L1_sim.py
+# A simulation backend for SCUTTLE. It stands in for the motor PWM outputs,
+# the encoder i2c bus and the gamepad, and moves a differential-drive model
+# of the robot (using R, L and pulleyRatio from L2_kinematics) in response
+# to the motor duty cycles. Time is simulated, so programs run
+# deterministically and as fast as the CPU allows.
+# This program runs on any Linux computer.
+
+# Import external libraries
+import math
+import queue
+import random
+import threading
+import time
+from evdev import AbsInfo, InputEvent, ecodes
+
+# Import local files
+import L1_encoder as enc
+import L1_fakebus as fb
+import L1_gamepad as gp
+import L1_motor as m
+import L2_encoder_sampler as es
+import L2_kinematics as kin
+import L2_scheduler as sched
+
+AXIS_MIN = -32768           # raw stick range reported by the simulated gamepad
+AXIS_MAX = 32767
+
+# (time (s), forward, turn) keyframes with stick positions in [-1, 1]. Each is held until the next one.
+DEFAULT_SCRIPT = [
+    (0.0, 0.0, 0.0),
+    (0.5, 1.0, 0.0),        # full speed ahead
+    (3.0, 0.5, 0.5),        # curve to the left
+    (5.0, 0.0, -1.0),       # spin in place to the right
+    (6.0, 0.0, 0.0),        # stop
+]
+
+
+class SimPWM:
+    """Stands in for a periphery.PWM output and remembers the last duty cycle written."""
+
+    def __init__(self):
+        self.frequency = 20000
+        self.enabled = False
+        self.writes = 0                     # number of duty cycle writes
+        self._duty = 0.0
+
+    @property
+    def duty_cycle(self) -> float:
+        return self._duty
+
+    @duty_cycle.setter
+    def duty_cycle(self, value: float):
+        self._duty = value
+        self.writes += 1
+
+    @property
+    def period(self) -> float:
+        return 1.0 / self.frequency
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def close(self):
+        pass
+
+
+class DiffDrivePlant:
+    """
+    Two motors with a first-order response to their duty cycle, driving the
+    wheels through the pulley. Tracks wheel speeds, shaft angles and the pose.
+    """
+
+    def __init__(self, phiMax: float = 9.75, tau: float = 0.1, deadband: float = 0.0):
+        self.phiMax = phiMax                # wheel speed at full duty (rad/s)
+        self.tau = tau                      # motor time constant (s)
+        self.deadband = deadband            # duty below which the motors do not turn
+        self.reset()
+
+    def reset(self):
+        self.phiDots = [0.0, 0.0]           # wheel speeds [L, R] (rad/s)
+        self.shaft = [0.0, 0.0]             # cumulative motor shaft angles [L, R] (degrees)
+        self.x = 0.0                        # pose (m, m, rad)
+        self.y = 0.0
+        self.theta = 0.0
+        self.distance = 0.0                 # distance travelled by the chassis center (m)
+
+    def step(self, dt: float, dutyL: float, dutyR: float):
+        for i, duty in enumerate((dutyL, dutyR)):
+            target = 0.0 if abs(duty) < self.deadband else duty * self.phiMax
+            self.phiDots[i] += (target - self.phiDots[i]) * min(dt / self.tau, 1.0)
+            self.shaft[i] += math.degrees(self.phiDots[i] * dt) / kin.pulleyRatio
+
+        xDot = kin.R / 2 * (self.phiDots[0] + self.phiDots[1])
+        thetaDot = kin.R / (2 * kin.L) * (self.phiDots[1] - self.phiDots[0])
+        self.x += xDot * math.cos(self.theta) * dt
+        self.y += xDot * math.sin(self.theta) * dt
+        self.theta += thetaDot * dt
+        self.distance += abs(xDot) * dt
+
+
+class SimGamepadDevice:
+    """Stands in for an evdev InputDevice with two analog sticks."""
+
+    name = "SCUTTLE simulated gamepad"
+
+    def __init__(self):
+        self._events = queue.Queue()
+
+    def capabilities(self, verbose=False, absinfo=True):
+        info = self.absinfo(ecodes.ABS_X)
+        axes = [(code, info) if absinfo else code
+                for code in (ecodes.ABS_X, ecodes.ABS_Y, ecodes.ABS_RX, ecodes.ABS_RY)]
+        return {ecodes.EV_ABS: axes, ecodes.EV_KEY: [ecodes.BTN_SOUTH, ecodes.BTN_EAST]}
+
+    def absinfo(self, axis_num):
+        return AbsInfo(value=0, min=AXIS_MIN, max=AXIS_MAX, fuzz=16, flat=128, resolution=0)
+
+    def push(self, event):
+        """Queue an event for read_loop()."""
+        self._events.put(event)
+
+    def read_loop(self):
+        while True:
+            yield self._events.get()
+
+    def close(self):
+        pass
+
+
+class StickMover:
+    """
+    Moves the left stick of a SimGamepadDevice to random positions at random
+    intervals, in real time, from a background thread. The events are stamped
+    with time.monotonic() like a real gamepad's (see Gamepad._useMonotonicTimestamps).
+    """
+
+    def __init__(self, device: SimGamepadDevice, interval=(0.005, 0.025), seed: int = 1):
+        self.device = device
+        self.interval = interval            # (shortest, longest) time between movements (s)
+        self.rng = random.Random(seed)
+        self.moves = 0
+        self._running = False
+        self._thread = None
+
+    def _event(self, type: int, code: int, value: int):
+        t = time.monotonic()
+        return InputEvent(int(t), int(t % 1 * 1e6), type, code, value)
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.rng.uniform(*self.interval))
+            code = self.rng.choice((ecodes.ABS_X, ecodes.ABS_Y))
+            self.device.push(self._event(ecodes.EV_ABS, code, self.rng.randint(AXIS_MIN, AXIS_MAX)))
+            self.device.push(self._event(ecodes.EV_SYN, ecodes.SYN_REPORT, 0))
+            self.moves += 1
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class Simulation:
+    """
+    Wires the simulated devices into L1_encoder, L1_motor and a Gamepad.
+    Pass sim.monotonic and sim.sleep to a LoopScheduler: every sleep() moves
+    the plant forward, samples the encoders and plays the gamepad script.
+    Pass an L1_replay.ReplayDevice as replay to drive with a captured gamepad
+    session instead of the script, in simulated time.
+    """
+
+    def __init__(self, script=DEFAULT_SCRIPT, physicsRate: float = 1000.0,
+                 samplerRate: float = 500.0, plant: DiffDrivePlant | None = None, replay=None):
+        self.script = sorted(script)
+        self.physicsDt = 1.0 / physicsRate
+        self.samplerDt = 1.0 / samplerRate
+        self.clock = sched.FakeClock()
+        self.bus = fb.FakeEncoderBus(clock=self.clock.monotonic)
+        self.pwms = [SimPWM() for _ in m.pins]
+        self.plant = plant or DiffDrivePlant()
+        self.device = SimGamepadDevice()
+        self.replay = replay
+        self.gamepad = None
+        self.sampler = None
+        self._stick = None                  # (forward, turn) last sent to the gamepad
+        self._nextSample = 0.0
+
+    def install(self):
+        """Route the encoder bus and motor outputs to the simulation and create the gamepad and sampler."""
+        enc.setBus(self.bus)
+        m.setOutputs(self.pwms)
+        self.gamepad = gp.Gamepad(self.device if self.replay is None else self.replay, threaded=False)
+        self.sampler = es.EncoderSampler(1.0 / self.samplerDt, bus=self.bus, clock=self.clock.monotonic)
+        self._updateEncoders()
+        self._playScript()
+        return self
+
+    def monotonic(self) -> float:
+        return self.clock.now
+
+    def sleep(self, seconds: float):
+        """Advance simulated time, stepping the plant at the physics rate."""
+        end = self.clock.now + seconds
+        while end - self.clock.now > 1e-12:
+            self._step(min(self.physicsDt, end - self.clock.now))
+
+    def _step(self, dt: float):
+        dutyL = self.pwms[0].duty_cycle - self.pwms[1].duty_cycle   # channel A minus channel B
+        dutyR = self.pwms[2].duty_cycle - self.pwms[3].duty_cycle
+        self.plant.step(dt, dutyL, dutyR)
+        self.clock.advance(dt)
+        self._updateEncoders()
+        self._playScript()
+
+        if self.sampler is not None and self.clock.now >= self._nextSample:
+            self.sampler.sampleOnce()
+            self._nextSample += self.samplerDt
+
+    def _updateEncoders(self):
+        self.bus.setDegrees(enc.encL, -self.plant.shaft[0] % 360)  # the left encoder reads inverted
+        self.bus.setDegrees(enc.encR, self.plant.shaft[1] % 360)
+
+    def _playScript(self):
+        if self.replay is not None:
+            for event in self.replay.eventsUntil(self.clock.now):
+                self.gamepad.processEvent(event)
+            return
+        stick = (0.0, 0.0)
+        for t, forward, turn in self.script:
+            if t > self.clock.now:
+                break
+            stick = (forward, turn)
+        if stick != self._stick:
+            self._stick = stick
+            forward, turn = stick
+            self._sendAxis(ecodes.ABS_Y, -forward)          # stick +Y points down
+            self._sendAxis(ecodes.ABS_X, -turn)             # L3_gpDemo turns left for -X
+            self._sendEvent(ecodes.EV_SYN, ecodes.SYN_REPORT, 0)
+
+    def _sendAxis(self, code: int, value: float):
+        raw = int(round((value + 1) / 2 * (AXIS_MAX - AXIS_MIN) + AXIS_MIN))
+        self._sendEvent(ecodes.EV_ABS, code, raw)
+
+    def _sendEvent(self, type: int, code: int, value: int):
+        sec = int(self.clock.now)
+        event = InputEvent(sec, int((self.clock.now - sec) * 1e6), type, code, value)
+        if self.gamepad is not None and self.gamepad.thread is None:
+            self.gamepad.processEvent(event)
+        else:
+            self.device.push(event)
+
+    def pose(self) -> tuple[float, float, float]:
+        return self.plant.x, self.plant.y, self.plant.theta
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    import time
+    import L2_inverse_kinematics as inv
+    import L2_speed_control as sc
+    import numpy as np
+
+    sim = Simulation().install()
+    start = time.perf_counter()
+    for i in range(70):                     # 7 simulated seconds in 0.1 s steps
+        data = sim.gamepad.readValues()
+        pdTargets = inv.convert(inv.map_speeds(np.array([-data[1], -data[0]])))
+        sc.driveOpenLoop(pdTargets)
+        sim.sleep(0.1)
+        print("t: ", round(sim.monotonic(), 1), "\t", "pose: ", np.round(sim.pose(), 3),
+              "\t", "phi dots: ", np.round(sim.sampler.latest_velocity(), 2))
+    print("simulated 7 s in", round(time.perf_counter() - start, 3), "s")
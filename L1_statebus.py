@@ -0,0 +1,165 @@
+# L1_statebus.py
+# Publishes the robot's latest state (wheel speeds, chassis motion, gamepad,
+# motor duty cycles) in a block of shared memory that any local process can
+# read without files, locks or system calls. The publisher brackets every
+# update with a sequence counter (a seqlock): the counter is odd while an
+# update is being written, so a reader that sees the same even counter before
+# and after copying the state knows its copy is consistent.
+# This program runs on SCUTTLE with any CPU.
+#
+# Usage (while L3_gpDemo.py is running):
+#   python L1_statebus.py           # print the state whenever it changes
+#   python L1_statebus.py --json    # one JSON object per line, e.g. for NodeRed's exec node
+
+# Import external libraries
+import argparse
+import json
+import time
+import numpy as np
+
+# Import local files
+from L1_shmring import attachSharedMemory, createSharedMemory
+
+NAME = "scuttle_state"                                  # shared memory block name (/dev/shm/scuttle_state)
+MAGIC = b"SCUTSTB1"
+PAYLOAD_OFFSET = 64                                     # keep the counter and the state on separate cache lines
+
+STATE_DTYPE = np.dtype([
+    ("t", "<f8"),                                       # time.monotonic() of the update (s)
+    ("phiDots", "<f8", (2,)),                           # wheel speeds [L, R] (rad/s)
+    ("motion", "<f8", (2,)),                            # chassis speeds [xDot (m/s), thetaDot (rad/s)]
+    ("axes", "<f4", (4,)),                              # gamepad axes [LEFT_X, LEFT_Y, RIGHT_X, RIGHT_Y]
+    ("buttons", "<u2"),                                 # gamepad buttons, see L1_recorder.buttonBits
+    ("duties", "<f4", (4,)),                            # PWM duty cycles [left A, left B, right A, right B]
+])
+
+_HEADER_DTYPE = np.dtype([("seq", "<u8"), ("magic", "S8"), ("stateSize", "<u4"), ("owner", "<u4")])
+
+
+def _views(buf):
+    header = np.ndarray((), _HEADER_DTYPE, buf, 0)
+    seq = np.ndarray((), "<u8", buf, 0)
+    state = np.ndarray((), STATE_DTYPE, buf, PAYLOAD_OFFSET)
+    return header, seq, state
+
+
+class StatePublisher:
+    """
+    Owns the shared state block. Only one process can publish to a given name:
+    FileExistsError if another running process already does.
+    """
+
+    def __init__(self, name: str = NAME):
+        self.name = name
+        size = PAYLOAD_OFFSET + STATE_DTYPE.itemsize
+        self.shm = createSharedMemory(name, size, _HEADER_DTYPE.fields["owner"][1])
+        self._header, self._seq, self.state = _views(self.shm.buf)
+        self._header["magic"] = MAGIC
+        self._header["stateSize"] = STATE_DTYPE.itemsize
+        self.seq = 0
+        self._seq[...] = 0
+
+    def publish(self, t, phiDots, motion, axes, buttons, duties):
+        """Replace the published state. Readers never see a mix of old and new values."""
+        seq = self.seq
+        self._seq[...] = seq + 1                        # odd: update in progress
+        state = self.state
+        state["t"] = t
+        state["phiDots"] = phiDots
+        state["motion"] = motion
+        state["axes"] = axes
+        state["buttons"] = buttons
+        state["duties"] = duties
+        self.seq = seq + 2
+        self._seq[...] = seq + 2                        # even: update complete
+
+    def close(self):
+        """Release and remove the shared block."""
+        if self.shm is None:
+            return
+        self._header = self._seq = self.state = None    # the views must go before the buffer
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StateReader:
+    """Attaches to the state block published under `name`."""
+
+    def __init__(self, name: str = NAME):
+        self.shm = attachSharedMemory(name)
+        self._header, self._seq, self._state = _views(self.shm.buf)
+        if self._header["magic"] != MAGIC or self._header["stateSize"] != STATE_DTYPE.itemsize:
+            raise ValueError(f"shared memory block {name} does not hold a SCUTTLE state")
+        self.retries = 0                                # reads repeated because an update was in progress
+
+    def read(self, out: np.ndarray | None = None):
+        """Return (seq, state) with a consistent copy of the state. seq is 0 before the first update."""
+        if out is None:
+            out = np.zeros((), STATE_DTYPE)
+        while True:
+            before = int(self._seq)
+            if not before & 1:
+                out[...] = self._state
+                if int(self._seq) == before:
+                    return before // 2, out
+            self.retries += 1
+
+    def wait(self, lastSeq: int, timeout: float = 1.0, poll: float = 0.005, out: np.ndarray | None = None):
+        """Poll until the state is newer than lastSeq. Returns (seq, state), or None on timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            seq, state = self.read(out)
+            if seq != lastSeq:
+                return seq, state
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        if self.shm is None:
+            return
+        self._header = self._seq = self._state = None
+        self.shm.close()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def asDict(state: np.ndarray) -> dict:
+    """Convert a state from StateReader.read() to plain Python values (for JSON)."""
+    return {name: state[name].tolist() for name in STATE_DTYPE.names}
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the state published by L3_gpDemo.py")
+    parser.add_argument("--name", default=NAME, help="shared memory block name")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per line")
+    parser.add_argument("--rate", type=float, default=10.0, help="maximum prints per second")
+    args = parser.parse_args()
+
+    with StateReader(args.name) as reader:
+        seq = 0
+        while True:
+            update = reader.wait(seq, timeout=1.0)
+            if update is None:
+                continue
+            seq, state = update
+            values = asDict(state)
+            if args.json:
+                print(json.dumps(values), flush=True)
+            else:
+                print("t:", round(values["t"], 3), "\t", "phi dots:", np.round(values["phiDots"], 2),
+                      "\t", "motion:", np.round(values["motion"], 3), "\t", "duties:", np.round(values["duties"], 2))
+            time.sleep(1.0 / args.rate)
@@ -0,0 +1,218 @@
+# L1_trace.py
+# Lightweight tracing of the hot path. Functions marked with @traced() and
+# blocks inside `with span("name"):` record their start and duration into a
+# preallocated ring buffer while tracing is enabled. While it is disabled a
+# @traced function is the plain function, with no wrapper to call: enable()
+# swaps the timing wrappers in and disable() swaps them out again. A disabled
+# span still enters and leaves an empty context manager (a few hundred ns),
+# so spans mark loop-level blocks only. export() writes the buffer as Chrome
+# trace JSON, which chrome://tracing and https://ui.perfetto.dev open directly.
+# This program runs on SCUTTLE with any CPU.
+#
+# Usage:
+#   python L3_gpDemo.py --trace /tmp/scuttle.trace.json
+#   kill -USR1 <pid>        # write the spans recorded so far while it runs
+
+# Import external libraries
+import array
+import functools
+import itertools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+SIZE = 1 << 16                                      # spans kept; older ones are overwritten
+
+enabled = False
+# Ring buffers, allocated by the first enable() so that importing this module
+# (and every module with spans, such as L1_motor) costs no memory or NumPy import.
+_starts = None                                      # time.perf_counter_ns() at the start of each span
+_durations = None                                   # ns
+_names = None                                       # index into _nameList
+_threads = None                                     # native thread id
+_counter = itertools.count()                        # next() is atomic, so threads never share a slot
+_written = 0                                        # spans recorded since the last clear(), at least
+_nameIds = {}                                       # span name -> index
+_nameList = []
+_threadNames = {}                                   # native thread id -> thread name
+_traced = []                                        # (function, wrapper) of every @traced function
+
+
+def nameId(name: str) -> int:
+    """Index of a span name, added on first use."""
+    i = _nameIds.get(name)
+    if i is None:
+        i = _nameIds[name] = len(_nameList)
+        _nameList.append(name)
+    return i
+
+
+def record(name: int, start: int, end: int):
+    """Store one span; name from nameId(), times from time.perf_counter_ns()."""
+    global _written
+    i = next(_counter)
+    slot = i & (SIZE - 1)
+    _starts[slot] = start
+    _durations[slot] = end - start
+    _names[slot] = name
+    tid = threading.get_native_id()
+    _threads[slot] = tid
+    if tid not in _threadNames:
+        _threadNames[tid] = threading.current_thread().name
+    if i >= _written:
+        _written = i + 1
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: int):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.start, time.perf_counter_ns())
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """Context manager timing a block. Allocates nothing while tracing is disabled, but still costs three calls."""
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(nameId(name))
+
+
+def _rebind(fn, replacement):
+    """Point the module or class attribute that holds fn (or its wrapper) at replacement."""
+    owner = sys.modules.get(fn.__module__)
+    for part in fn.__qualname__.split(".")[:-1]:
+        owner = getattr(owner, part, None)
+    if owner is not None:
+        setattr(owner, fn.__name__, replacement)
+
+
+def traced(name: str | None = None):
+    """
+    Decorator timing every call of a function, named after it unless name is
+    given. Returns the function itself while tracing is disabled; enable()
+    and disable() rebind the module function or class method. References
+    taken before that (a bound method handed to a thread, a function
+    imported by name) keep calling what they got, so enable tracing before
+    starting the program's threads.
+    """
+    def decorate(fn):
+        module = os.path.splitext(os.path.basename(fn.__code__.co_filename))[0]     # not __main__ when run directly
+        spanName = nameId(name or f"{module}.{fn.__qualname__}")
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(spanName, start, time.perf_counter_ns())
+
+        if "<locals>" in fn.__qualname__:               # nowhere to rebind it: always wrapped
+            return wrapper
+        _traced.append((fn, wrapper))
+        return wrapper if enabled else fn
+    return decorate
+
+
+def enable():
+    global enabled, _starts, _durations, _names, _threads
+    if _starts is None:
+        _starts = array.array("q", bytes(8 * SIZE))
+        _durations = array.array("q", bytes(8 * SIZE))
+        _names = array.array("H", bytes(2 * SIZE))
+        _threads = array.array("Q", bytes(8 * SIZE))
+    enabled = True
+    for fn, wrapper in _traced:
+        _rebind(fn, wrapper)
+
+
+def disable():
+    global enabled
+    enabled = False
+    for fn, wrapper in _traced:
+        _rebind(fn, fn)
+
+
+def clear():
+    global _counter, _written
+    _counter = itertools.count()
+    _written = 0
+
+
+def spans() -> list[tuple[str, int, int, int]]:
+    """The recorded spans as (name, start ns, duration ns, thread id), oldest first."""
+    count = _written
+    first = max(0, count - SIZE)
+    slots = [i & (SIZE - 1) for i in range(first, count)]
+    return [(_nameList[_names[s]], _starts[s], _durations[s], _threads[s]) for s in slots]
+
+
+def export(path: str) -> int:
+    """Write the recorded spans as Chrome trace JSON. Returns the number of spans written."""
+    pid = os.getpid()
+    events = [{"name": name, "ph": "X", "ts": start / 1000, "dur": duration / 1000, "pid": pid, "tid": tid}
+              for name, start, duration, tid in spans()]
+    events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": threadName}}
+               for tid, threadName in list(_threadNames.items())]
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    os.replace(temp, path)
+    return len(events) - len(_threadNames)
+
+
+def exportOnSignal(path: str, signum: int = signal.SIGUSR1):
+    """
+    Export to path whenever the process receives signum (call from the main
+    thread). The handler only wakes a background thread, which does the
+    export, so a control loop running on the main thread is not held up.
+    """
+    requested = threading.Event()
+
+    def exporter():
+        while True:
+            requested.wait()
+            requested.clear()
+            print(f"trace: wrote {export(path)} spans to {path}")
+
+    threading.Thread(target=exporter, name="trace export", daemon=True).start()
+    signal.signal(signum, lambda signum, frame: requested.set())
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    @traced()
+    def work(n):
+        with span("inner sleep"):
+            time.sleep(n)
+
+    enable()
+    for i in range(5):
+        work(0.001 * i)
+    print("spans:", spans()[:3], "...")
+    print("wrote", export("/tmp/scuttle.trace.json"), "spans to /tmp/scuttle.trace.json")
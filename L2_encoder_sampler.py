@@ -0,0 +1,175 @@
+# L2_encoder_sampler.py
+# Polls both encoders from a background thread at a fixed rate and keeps the
+# samples in a timestamped ring buffer, so the control loop can get wheel
+# speeds instantly instead of waiting on getPdCurrent()'s sleep.
+# This program runs on SCUTTLE with any CPU.
+
+# Import external libraries
+import threading
+import time
+from typing import NamedTuple
+import numpy as np
+
+# Import local files
+import L1_encoder as enc                    # local library for encoders
+import L2_kinematics as kin                 # for wrapTravel, pulleyRatio and the A matrix
+import L2_scheduler as sched                # for the fixed-rate polling loop
+import L1_trace as trace                    # spans for L1_trace.py
+
+
+class EncoderSample(NamedTuple):
+    t: float                                                # time of the sample (s)
+    angles: np.ndarray                                      # shaft angles [L, R] (degrees)
+    status: tuple[int, int]                                 # L1_encoder.VALID, ESTIMATED, STALE or INVALID per side
+
+
+class EncoderSampler:
+    """
+    Reads both encoders at rate_hz into a ring buffer of `size` samples.
+    Velocities are computed between the newest sample and the one `window`
+    seconds before it, so latest_velocity() and latest_motion() are O(1)
+    and never touch the bus.
+
+    Reads go through an L1_encoder.EncoderReader with bounded retries. When
+    both encoders fail no sample is stored, so the velocity spans the gap;
+    when one fails its angle is extrapolated from its last speed and marked
+    ESTIMATED. If no sample arrives for staleAfter seconds, the velocity
+    holds its last value and latest_sample() reports STALE.
+    """
+
+    def __init__(self, rate_hz: float = 500.0, window: float = kin.wait, size: int = 1024,
+                 bus=None, clock=time.monotonic, sleep=time.sleep, retries: int = 2, budget: float = 0.0015,
+                 staleAfter: float = 0.05):
+        self.rate = rate_hz
+        self.lag = max(1, int(round(window * rate_hz)))     # samples between the two velocity points
+        self.size = max(size, self.lag + 2)
+        self.bus = bus                                      # SMBus-like object, None for L1_encoder's bus
+        self.clock = clock
+        self.sleep = sleep
+        self.reader = enc.EncoderReader(bus, retries, budget)
+        self.staleAfter = staleAfter
+
+        self.times = np.zeros(self.size)                    # sample times (s)
+        self.angles = np.zeros((self.size, 2))              # shaft angles [L, R] (degrees)
+        self.travel = np.zeros((self.size, 2))              # cumulative shaft travel since the first sample (degrees)
+        self.status = np.zeros((self.size, 2), np.uint8)    # L1_encoder status of each side
+        self.count = 0                                      # total samples taken; the newest is at (count-1) % size
+        self.errors = 0                                     # samples lost because both encoders failed
+        self.estimated = 0                                  # samples with one side extrapolated
+
+        self.scheduler = None
+        self._thread = None
+
+    @trace.traced()
+    def sampleOnce(self):
+        """Take one sample. Called by the background thread, or directly when stepping by hand."""
+        angleL, angleR, _, statusL, statusR = self.reader.read()   # both encoders in one i2c transaction
+        t = self.clock()
+        n = self.count
+        if statusL == statusR == enc.INVALID or (n == 0 and (statusL or statusR)):
+            self.errors += 1                                # no sample: the velocity is taken across the gap
+            return
+
+        i = n % self.size
+        if n:
+            p = (n - 1) % self.size
+            if statusL or statusR:
+                self.estimated += 1
+                if statusL:
+                    angleL = self._extrapolate(0, n, t)
+                if statusR:
+                    angleR = self._extrapolate(1, n, t)
+            self.travel[i, 0] = self.travel[p, 0] + kin.wrapTravel(angleL - self.angles[p, 0])
+            self.travel[i, 1] = self.travel[p, 1] + kin.wrapTravel(angleR - self.angles[p, 1])
+        else:
+            self.travel[i] = 0.0
+        self.times[i] = t
+        self.angles[i, 0] = angleL
+        self.angles[i, 1] = angleR
+        self.status[i, 0] = enc.ESTIMATED if statusL else enc.VALID
+        self.status[i, 1] = enc.ESTIMATED if statusR else enc.VALID
+        self.count = n + 1                                  # publish the sample only once it is complete
+
+    def _extrapolate(self, side: int, n: int, t: float) -> float:
+        """The angle of one side at time t if it kept its speed over the velocity window."""
+        p = (n - 1) % self.size
+        angle = self.angles[p, side]
+        if n >= 2:
+            q = (n - 1 - min(self.lag, n - 1)) % self.size
+            deltaT = self.times[p] - self.times[q]
+            if deltaT > 0:
+                angle += (self.travel[p, side] - self.travel[q, side]) / deltaT * (t - self.times[p])
+        return angle % 360
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.scheduler = sched.LoopScheduler(self.rate, sched.SKIP, clock=self.clock, sleep=self.sleep)
+        self._thread = threading.Thread(target=self.scheduler.run, args=(self.sampleOnce,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.scheduler.stop()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def latest_angles(self):
+        """Return (t, [angleL, angleR]) of the newest sample, or None before the first sample."""
+        n = self.count
+        if n == 0:
+            return None
+        i = (n - 1) % self.size
+        return self.times[i], self.angles[i].copy()
+
+    def latest_sample(self) -> EncoderSample | None:
+        """The newest sample with its status, STALE on both sides if it is older than staleAfter."""
+        n = self.count
+        if n == 0:
+            return None
+        i = (n - 1) % self.size
+        t = float(self.times[i])
+        if self.clock() - t > self.staleAfter:
+            return EncoderSample(t, self.angles[i].copy(), (enc.STALE, enc.STALE))
+        return EncoderSample(t, self.angles[i].copy(), (int(self.status[i, 0]), int(self.status[i, 1])))
+
+    def health(self) -> dict:
+        """Sample counters and the per-encoder read counters."""
+        latest = self.latest_sample()
+        return {"samples": self.count, "lost": self.errors, "estimated": self.estimated,
+                "stale": latest is None or latest.status[0] == enc.STALE, "devices": self.reader.report()}
+
+    def latest_velocity(self):
+        """Return [pdl, pdr] in rad/s over the last `window` seconds, like getPdCurrent()."""
+        n = self.count
+        if n < 2:
+            return np.zeros(2)
+        i = (n - 1) % self.size
+        j = (n - 1 - min(self.lag, n - 1)) % self.size
+        deltaT = self.times[i] - self.times[j]
+        if deltaT <= 0:
+            return np.zeros(2)
+        wheelTravel = (self.travel[i] - self.travel[j]) * kin.pulleyRatio  # wheel travel (degrees)
+        return wheelTravel / deltaT * np.pi / 180                           # wheel speeds (rad/s)
+
+    def latest_motion(self):
+        """Return [xDot, thetaDot] from the latest wheel speeds, like getMotion()."""
+        C = np.matmul(kin.A, self.latest_velocity())
+        return np.round(C, decimals=3)
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    with EncoderSampler() as sampler:
+        while True:
+            time.sleep(0.2)
+            print("xdot(m/s), thetadot (rad/s):", sampler.latest_motion(),
+                  "\t", "samples: ", sampler.count)
@@ -7,6 +7,9 @@
 import numpy as np                          # to perform matrix operations
 import time
 
+# Import local files
+from L1_rounding import RINT                # rounds like np.rint in plain float math
+
 # define robot geometry
 R = 0.041                                   # wheel radius
 L = 0.201                                   # half of the wheelbase
@@ -15,36 +18,107 @@ A = np.array([[1/R, -L/R], [1/R, L/R]])     # matrix A * [xd, td] = [pdl, pdr]
 # define constraints for theta and x speeds
 max_xd = 0.4                                # maximum achievable x_dot (m/s) FW  translation
 max_td = (max_xd / L)                       # maximum achievable theta_dot (rad/s)
+max_pd = 9.7                                # largest wheel speed target (rad/s)
+
+# The per-iteration functions here and in L2_speed_control.py take an optional
+# `out`: pass a 2-element list or array to have the result written into it
+# instead of a new array, so that the control loop does not allocate.
 
-def map_speeds(B):                          # this function will map the gamepad speeds to max values
-    B_mapped = np.zeros(2)
+def map_speeds(B, out=None):                # this function will map the gamepad speeds to max values
+    B_mapped = np.zeros(2) if out is None else out
     B_mapped[0] = max_xd*B[0]
     B_mapped[1] = max_td*B[1]
     return(B_mapped)
 
 
 # Convert will take the "B" matrix containing [x_dot, theta_dot]
-# and return the C matrix containing [phi_dot_L, phi_dot_R]
-def convert(B):
-    C = np.matmul(A, B)                     # matrix multiplication
-    C = np.round(C, decimals=3)             # round both elements in the array
+# and return the C matrix containing [phi_dot_L, phi_dot_R].
+# The 2x2 product is written out in plain floats; it gives the same
+# result as np.round(np.matmul(A, B), 3) without allocating temporaries.
+a00, a01 = float(A[0, 0]), float(A[0, 1])
+a10, a11 = float(A[1, 0]), float(A[1, 1])
+
+def convert(B, out=None):
+    xd = float(B[0])
+    td = float(B[1])
+    C = np.empty(2) if out is None else out
+    C[0] = ((a00*xd + a01*td) * 1000 + RINT - RINT) / 1000  # matrix multiplication, rounded to 3 decimals
+    C[1] = ((a10*xd + a11*td) * 1000 + RINT - RINT) / 1000
     return(C)
 
 
-def getPdTargets():
-    B = populate_gp()                       # retrieves targets in [xdot, thetadot] form
+def populate_gp(gp_data, out=None):         # gamepad values (as from Gamepad.readValues) -> [xd, td]
+    B = np.zeros(2) if out is None else out
+    B[0] = -gp_data[1]                      # forward is up on the left stick
+    B[1] = -gp_data[0]                      # turning left is left on the left stick
+    return(map_speeds(B, B))
+
+
+# Saturate scales both wheels by the same factor when either one is above
+# the limit, so the robot slows down along the same curve instead of
+# turning more or less sharply than commanded (as clipping each wheel would).
+def saturate(C, limit=max_pd, out=None):
+    pdl = float(C[0])
+    pdr = float(C[1])
+    C = np.empty(2) if out is None else out
+    largest = max(abs(pdl), abs(pdr))
+    scale = limit / largest if largest > limit else 1.0
+    C[0] = pdl * scale
+    C[1] = pdr * scale
+    return(C)
+
+
+def getPdTargets(gp_data):
+    B = populate_gp(gp_data)                # retrieves targets in [xdot, thetadot] form
     C = convert(B)                          # convert the targets to [pdl, pdr] form
-    C = np.clip(C, -9.7, 9.7)
+    C = saturate(C)                         # keep both wheels within max_pd, on the same curve
     return(C)
 
 
+# Batch versions for whole sequences of commands (for example a planned path):
+# each takes all N [xd, td] rows at once as an (N, 2) array and returns (N, 2)
+# [pdl, pdr] in one vectorized call.
+
+def batch_map_speeds(B):                    # (N, 2) stick values in [-1, 1] -> (N, 2) [xd, td]
+    return np.asarray(B, dtype=float) * [max_xd, max_td]
+
+def batch_convert(B, decimals=3):           # (N, 2) [xd, td] -> (N, 2) [pdl, pdr], like convert()
+    C = np.asarray(B, dtype=float) @ A.T
+    return C if decimals is None else np.round(C, decimals=decimals)
+
+def batch_saturate(C, limit=max_pd):        # saturate() for every row
+    C = np.asarray(C, dtype=float)
+    largest = np.abs(C).max(axis=1, keepdims=True)
+    return C * np.minimum(1.0, limit / np.maximum(largest, limit))
+
+def batch_pd_targets(B, limit=max_pd, decimals=3):     # (N, 2) [xd, td] -> saturated (N, 2) [pdl, pdr]
+    return batch_saturate(batch_convert(B, decimals), limit)
+
+def sample_path(times, B, rate=100.0, limit=max_pd):
+    """
+    Wheel speed targets for a planned path: B[i] = [xd, td] is held from
+    times[i] until times[i + 1] (the last one is the final command).
+    Returns (ticks, targets): the control loop times at `rate` Hz from
+    times[0] to times[-1], and the (len(ticks), 2) [pdl, pdr] to apply at each.
+    """
+    times = np.asarray(times, dtype=float)
+    if np.any(np.diff(times) < 0):
+        raise ValueError("path times must not decrease")
+    count = int(np.floor((times[-1] - times[0]) * rate + 1e-9)) + 1
+    ticks = times[0] + np.arange(count) / rate
+    rows = np.searchsorted(times, ticks + 1e-9, side="right") - 1   # a tick on a keyframe time takes that keyframe
+    return ticks, batch_pd_targets(B, limit)[rows]
+
+
 # create a function that can convert an obstacle into an influence on theta dot
+influence_limit = 0.30                      # meters to limit influence (lateral distance)
+lookahead = 0.60                            # scan points further ahead than this (m) are ignored
+
 def phi_influence(yValue):
-    limit = 0.30                                            # meters to limit influence
-    if (yValue < limit and yValue > 0):
-        theta_influence = max_td*0.7*(limit - yValue)       # give theta push only if object is near
-    elif (yValue > -limit and yValue < 0):
-        theta_influence = -1*max_td*0.7*(limit - yValue)    # give theta push only if object is near
+    if (yValue < influence_limit and yValue > 0):
+        theta_influence = max_td*0.7*(influence_limit - yValue)     # give theta push only if object is near
+    elif (yValue > -influence_limit and yValue < 0):
+        theta_influence = -1*max_td*0.7*(influence_limit + yValue)  # give theta push only if object is near
     else:
         theta_influence = 0
     B = np.array([0, theta_influence])
@@ -52,6 +126,52 @@ def phi_influence(yValue):
     return(C)
 
 
+# Obstacle influence for a whole lidar scan, as (N, 2) [distance (m), angle (deg)]
+# with 0 deg straight ahead and positive angles to the left (distance 0 = no return).
+# Every point is weighed at once with masks instead of one phi_influence call per
+# point. Angles are looked up in a table of cos and sin built once per angular
+# resolution, so a scan costs no trigonometry.
+_angleTables = {}                           # resolution (deg) -> (cos, sin) of every step in one turn
+
+def angleTable(resolution=0.5):
+    table = _angleTables.get(resolution)
+    if table is None:
+        angles = np.radians(np.arange(0, 360, resolution))
+        cos, sin = np.round(np.cos(angles), 15), np.round(np.sin(angles), 15)  # exactly 0 at 90 and 270 deg
+        table = _angleTables[resolution] = (cos, sin)
+    return table
+
+def scan_push(scan, resolution=0.5, out=None):     # returns the [xd, td] influence of every point in the scan
+    scan = np.asarray(scan, dtype=float)
+    distance = scan[:, 0]
+    cos, sin = angleTable(resolution)
+    steps = np.rint(scan[:, 1] / resolution).astype(np.intp) % len(cos)
+    x = distance * cos[steps]                       # ahead (m)
+    y = distance * sin[steps]                       # to the left (m)
+    ahead = (distance > 0) & (x > 0) & (x < lookahead)
+    side = np.abs(y)
+
+    # theta: the nearest point on each side pushes, as phi_influence would for it alone
+    push = np.where(ahead & (side < influence_limit), max_td*0.7*(influence_limit - side)*np.sign(y), 0.0)
+    td = push.max(initial=0.0) + push.min(initial=0.0)
+
+    # x: slow down for points in the robot's path, the nearest one the most
+    inPath = ahead & (side < L)
+    xd = -max_xd*(1 - x[inPath].min()/lookahead) if inPath.any() else 0.0
+
+    B = np.zeros(2) if out is None else out
+    B[0] = xd
+    B[1] = td
+    return(B)
+
+def scan_influence(scan, resolution=0.5, out=None):    # scan_push mapped through A to [pdl, pdr] (rad/s)
+    xd, td = scan_push(scan, resolution)
+    C = np.empty(2) if out is None else out
+    C[0] = a00*xd + a01*td
+    C[1] = a10*xd + a11*td
+    return(C)
+
+
 # this function takes user input for x_dot and theta_dot
 def wait_user():
     x_dot = input("please enter x_dot (m/s): ")                     # takes x_dot as user input
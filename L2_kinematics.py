@@ -10,6 +10,7 @@ import time                                 # library for time access
 
 # Import local files
 import L1_encoder as enc                    # local library for encoders
+import L1_trace as trace                    # spans for L1_trace.py
 
 # define kinematics
 R = 0.041                                   # wheel radius (meters)
@@ -18,18 +19,23 @@ res = (360/2**14)                           # resolution of the encoders (degree
 pulleyRatio = 0.5                           # wheel movement per shaft movement
 A = np.array([[R/2, R/2], [-R/(2*L), R/(2*L)]])     # This matrix relates [PDL, PDR] to [XD,TD]
 wait = 0.02                                 # wait time between encoder measurements (s)
+clock = time.monotonic                      # clock and sleep used by getPdCurrent; benchmarks swap in a FakeClock
+sleep = time.sleep
+pdCurrents = np.zeros(2)                    # the last wheel speeds from getPdCurrent (rad/s)
 
 
 # Note:  this function takes at least 5.1ms plus "wait" to run.  It also populates a global
 # variable so programs can access the previous measurement instantaneously.
+@trace.traced()
 def getPdCurrent():
     global pdCurrents                       # make a global var for easy retrieval
     encoders_t1 = enc.readShaftPositions()  # grabs the current encoder readings in degrees
-    t1 = time.monotonic()                   # time.monotonic() reports in seconds
-    time.sleep(wait)                        # delay for the specified amount
+    t1 = clock()                            # time.monotonic() reports in seconds
+    with trace.span("getPdCurrent sleep"):
+        sleep(wait)                         # delay for the specified amount
     
     encoders_t2 = enc.readShaftPositions()  # grabs the current encoder readings in degrees
-    t2 = time.monotonic()                   # usually takes about .003 seconds gap
+    t2 = clock()                            # usually takes about .003 seconds gap
     global deltaT
     deltaT = round((t2 - t1), 3)            # compute delta-time (t.ttt scalar)
 
@@ -48,7 +54,8 @@ def getPdCurrent():
     # build an array of wheel speeds in rad/s
     wheelTravel = shaftTravel * pulleyRatio     # compute wheel turns from motor turns
     wheelSpeeds_deg = wheelTravel / deltaT      # compute wheel speeds (degrees/s)
-    pdCurrents = wheelSpeeds_deg * np.pi / 180  # compute wheel speeds (rad/s) & store to global variable
+    speeds = wheelSpeeds_deg * np.pi / 180      # compute wheel speeds (rad/s)
+    pdCurrents = np.where(np.isnan(speeds), pdCurrents, speeds)    # hold the last speed of an encoder that failed (NaN) & store to global variable
     return(pdCurrents)                          # returns [pdl, pdr] in radians/second
 
 
@@ -72,6 +79,62 @@ def phiTravels(encoders_t1, encoders_t2):   # get travel of wheels [deg, deg] (t
     wheelTravel = shaftTravel * pulleyRatio # compute wheel turns from motor turns [deg,deg]
     return(wheelTravel)                     # return the movement
 
+def wrapTravel(travel):                     # scalar version of the +/-360 search in phiTravels (degrees)
+    if travel > 180:                        # the shortest of travel, travel+360 and travel-360
+        return travel - 360
+    if travel < -180:
+        return travel + 360
+    return travel
+
+# Batch versions for recorded data (for example L1_recorder's "t" and "encoders"
+# columns): each takes all N samples at once as (N, 2) arrays and works in a
+# few vectorized passes instead of one Python call per pair of samples.
+
+def unwrapShafts(angles):                   # (N, 2) shaft angles in [0, 360) -> continuous shaft angles (degrees)
+    angles = np.asarray(angles, dtype=float)
+    steps = np.diff(angles, axis=0)         # wrap every step with wrapTravel's rule, so ties at +/-180
+    steps = np.where(steps > 180, steps - 360, np.where(steps < -180, steps + 360, steps))   # match phiTravels
+    shafts = np.empty_like(angles)
+    shafts[:1] = angles[:1]
+    shafts[1:] = angles[:1] + np.cumsum(steps, axis=0)
+    return shafts
+
+def batchTravels(angles):                   # wheel travel between consecutive samples, (N-1, 2) [deg, deg]
+    return np.diff(unwrapShafts(angles), axis=0) * pulleyRatio
+
+def batchPhiDots(times, angles, lag=1):     # wheel speeds between samples i-lag and i, (N-lag, 2) rad/s
+    shafts = unwrapShafts(angles)
+    times = np.asarray(times, dtype=float)
+    deltaT = (times[lag:] - times[:-lag])[:, None]
+    wheelTravel = (shafts[lag:] - shafts[:-lag]) * pulleyRatio
+    return wheelTravel / deltaT * np.pi / 180
+
+def batchMotion(phiDots, decimals=None):    # (N, 2) [pdl, pdr] -> (N, 2) [xDot, thetaDot], like getMotion()
+    C = np.asarray(phiDots) @ A.T
+    return C if decimals is None else np.round(C, decimals=decimals)
+
+def batchPose(angles, x=0.0, y=0.0, theta=0.0):     # dead reckoning over all samples, like L2_odometry
+    """
+    Returns (N, 4) [x, y, theta, distance] after each sample, the first
+    sample being the starting pose. Each step follows the exact arc, as
+    Odometry.update() does.
+    """
+    wheel = np.radians(batchTravels(angles))                # wheel rotation per step (rad)
+    steps = wheel @ A.T                                     # [chassis travel (m), heading change (rad)]
+    ds, dTheta = steps[:, 0], steps[:, 1]
+    headings = theta + np.concatenate(([0.0], np.cumsum(dTheta)))
+    before, after = headings[:-1], headings[1:]
+    turning = np.abs(dTheta) > 1e-9
+    radius = np.divide(ds, dTheta, out=np.zeros_like(ds), where=turning)
+    dx = np.where(turning, radius * (np.sin(after) - np.sin(before)), ds * np.cos(before))
+    dy = np.where(turning, -radius * (np.cos(after) - np.cos(before)), ds * np.sin(before))
+    pose = np.empty((len(headings), 4))
+    pose[:, 0] = x + np.concatenate(([0.0], np.cumsum(dx)))
+    pose[:, 1] = y + np.concatenate(([0.0], np.cumsum(dy)))
+    pose[:, 2] = headings
+    pose[:, 3] = np.concatenate(([0.0], np.cumsum(np.abs(ds))))
+    return pose
+
 # THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
 if __name__ == "__main__":
     while True:
@@ -0,0 +1,81 @@
+# L2_latency.py
+# Measures input-to-actuation latency: the time from a gamepad event (its
+# evdev timestamp) to the moment the motor duty cycles computed from it are
+# written. The control loop calls record() right after the duty write. The
+# last `window` samples are kept for percentiles, and every sample is also
+# counted in a histogram.
+# This program runs on SCUTTLE with any CPU.
+
+# Import external libraries
+import time
+import numpy as np
+
+# Import local files
+import L2_scheduler as sched                # for Histogram
+
+LATENCY_BINS = [0.001, 0.002, 0.005, 0.010, 0.015, 0.020, 0.030, 0.050, 0.100]
+
+
+class LatencyMonitor:
+    """
+    Keeps a rolling window of latencies. `total` runs from the input event to
+    the duty write; `processing` from reading the input in the control loop to
+    the duty write, so total - processing is the time spent waiting for the loop.
+    """
+
+    def __init__(self, window: int = 1000, clock=time.monotonic, bins: list[float] = LATENCY_BINS):
+        self.clock = clock                          # must be the clock the event timestamps use
+        self.window = window
+        self.total = np.zeros(window)
+        self.processing = np.zeros(window)
+        self.histogram = sched.Histogram(bins)      # every total latency since the start
+        self.count = 0
+
+    def record(self, eventTime: float, readTime: float):
+        """Call right after writing the duty cycles computed from an input event."""
+        now = self.clock()
+        i = self.count % self.window
+        self.total[i] = now - eventTime
+        self.processing[i] = now - readTime
+        self.histogram.add(now - eventTime)
+        self.count += 1
+
+    def percentiles(self) -> dict:
+        """Return p50, p99 and max (seconds) of both latencies over the window."""
+        n = min(self.count, self.window)
+        result = {"count": self.count}
+        for name, samples in (("total", self.total[:n]), ("processing", self.processing[:n])):
+            if n:
+                p50, p99 = np.percentile(samples, (50, 99))
+                result[name] = {"p50": float(p50), "p99": float(p99), "max": float(samples.max())}
+            else:
+                result[name] = {"p50": 0.0, "p99": 0.0, "max": 0.0}
+        return result
+
+    def stats(self) -> dict:
+        result = self.percentiles()
+        result["histogram"] = self.histogram.asDict()
+        return result
+
+    def report(self) -> str:
+        p = self.percentiles()
+        total, processing = p["total"], p["processing"]
+        return (f"input to motor latency over the last {min(p['count'], self.window)} inputs: "
+                f"p50 {total['p50'] * 1000:.2f} ms, p99 {total['p99'] * 1000:.2f} ms, "
+                f"max {total['max'] * 1000:.2f} ms "
+                f"(processing p50 {processing['p50'] * 1000:.3f} ms, p99 {processing['p99'] * 1000:.3f} ms)")
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    # Inputs arriving at random times into a 100 Hz loop wait 5 ms on average
+    rng = np.random.default_rng(1)
+    clock = sched.FakeClock()
+    monitor = LatencyMonitor(clock=clock.monotonic)
+    for _ in range(2000):
+        eventTime = clock.now
+        clock.advance(rng.uniform(0, 0.010))        # wait for the next loop iteration
+        readTime = clock.now
+        clock.advance(0.0002)                       # inverse kinematics and duty writes
+        monitor.record(eventTime, readTime)
+    print(monitor.report())
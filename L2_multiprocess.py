@@ -0,0 +1,221 @@
+# L2_multiprocess.py
+# Runs the encoder sampler and the gamepad reader in their own processes, so
+# they use other CPU cores instead of competing with the control loop for
+# Python's GIL. Each process writes into a shared-memory ring (L1_shmring.py);
+# the control process reads them through RingSampler and RingGamepad, which
+# offer the same methods as EncoderSampler and Gamepad.
+# This program runs on SCUTTLE with any CPU.
+
+# Import external libraries
+import contextlib
+import multiprocessing
+import os
+from types import MappingProxyType
+import numpy as np
+
+# Import local files
+import L1_encoder as enc
+import L1_gamepad as gp
+import L1_shmring as ring
+import L2_kinematics as kin
+import L2_scheduler as sched
+
+ENCODER_RING = "scuttle_encoders"                   # ring names, followed by the PID of the control process
+GAMEPAD_RING = "scuttle_gamepad"
+
+ENCODER_DTYPE = np.dtype([
+    ("t", "<f8"),                                   # time of the read (s)
+    ("angles", "<f8", (2,)),                        # shaft angles [L, R] (degrees)
+    ("travel", "<f8", (2,)),                        # cumulative shaft travel since the first sample (degrees)
+])
+
+GAMEPAD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),                           # newest event of the snapshot (s)
+    ("values", "<f8", (16,)),                       # as returned by Gamepad.readValues()
+])
+
+_NO_STATES = MappingProxyType({})
+
+
+def runEncoders(ringName: str, rate_hz: float, stop, fakeDelay: float | None = None):
+    """Process body: sample both encoders at rate_hz into the ring until stop is set."""
+    bus = None
+    if fakeDelay is not None:
+        import L1_fakebus as fb
+        bus = fb.FakeEncoderBus(delay=fakeDelay)
+        bus.spin(enc.encL, 720)
+        bus.spin(enc.encR, -720)
+    samples = ring.ShmRing(ringName, ENCODER_DTYPE, sharedTracker=True)
+    reader = enc.EncoderReader(bus, budget=0.0015)
+    travel = [0.0, 0.0]
+    previous = None
+
+    def sampleOnce():
+        nonlocal previous
+        angleL, angleR, t, statusL, statusR = reader.read()
+        if statusL or statusR:
+            return not stop.is_set()                # no sample: the readers' velocity spans the gap
+        if previous is not None:
+            travel[0] += kin.wrapTravel(angleL - previous[0])
+            travel[1] += kin.wrapTravel(angleR - previous[1])
+        previous = (angleL, angleR)
+        samples.append(t, previous, travel)
+        return not stop.is_set()
+
+    try:
+        sched.LoopScheduler(rate_hz, sched.SKIP).run(sampleOnce)
+    finally:
+        samples.close()
+
+
+def runGamepad(ringName: str, stop, fake: bool = False):
+    """Process body: read gamepad events and write every new snapshot to the ring until stop is set."""
+    device = None
+    if fake:
+        import L1_sim
+        device = L1_sim.SimGamepadDevice()
+        L1_sim.StickMover(device).start()
+    with contextlib.redirect_stdout(None) if fake else contextlib.nullcontext():
+        gamepad = gp.Gamepad(device, threaded=False)
+    snapshots = ring.ShmRing(ringName, GAMEPAD_DTYPE, sharedTracker=True)
+    lastSeq = gamepad.seq
+    try:
+        for event in gamepad.device.read_loop():
+            gamepad.processEvent(event)
+            snapshot = gamepad.snapshot()
+            if snapshot.seq != lastSeq:
+                lastSeq = snapshot.seq
+                snapshots.append(snapshot.timestamp, snapshot.values)
+            if stop.is_set():
+                break
+    finally:
+        snapshots.close()
+
+
+class RingSampler:
+    """The reading side of EncoderSampler, over the samples written by runEncoders()."""
+
+    def __init__(self, samples: ring.ShmRing, rate_hz: float = 500.0, window: float = kin.wait):
+        self.samples = samples
+        self.lag = max(1, int(round(window * rate_hz)))
+        self._newest = np.zeros((), ENCODER_DTYPE)
+        self._older = np.zeros((), ENCODER_DTYPE)
+
+    @property
+    def count(self) -> int:
+        return self.samples.count
+
+    def latest_angles(self):
+        """Return (t, [angleL, angleR]) of the newest sample, or None before the first sample."""
+        if self.samples.latest(self._newest) < 0:
+            return None
+        return float(self._newest["t"]), self._newest["angles"].copy()
+
+    def latest_velocity(self):
+        """Return [pdl, pdr] in rad/s over the last `window` seconds."""
+        n = self.samples.latest(self._newest)
+        if n < 1 or not self.samples.read(max(n - self.lag, 0), self._older):
+            return np.zeros(2)                      # too few samples, or the older one was overwritten
+        deltaT = self._newest["t"] - self._older["t"]
+        if deltaT <= 0:
+            return np.zeros(2)
+        wheelTravel = (self._newest["travel"] - self._older["travel"]) * kin.pulleyRatio
+        return wheelTravel / deltaT * np.pi / 180
+
+    def latest_motion(self):
+        """Return [xDot, thetaDot] from the latest wheel speeds."""
+        return np.round(np.matmul(kin.A, self.latest_velocity()), decimals=3)
+
+
+class RingGamepad:
+    """The reading side of Gamepad, over the snapshots written by runGamepad()."""
+
+    stateUpdating = True
+
+    def __init__(self, snapshots: ring.ShmRing):
+        self.snapshots = snapshots
+        self._record = np.zeros((), GAMEPAD_DTYPE)
+        self._older = np.zeros((), GAMEPAD_DTYPE)
+        self._snapshot = gp.GamepadSnapshot(0, 0.0, (0.0,) * 16, _NO_STATES, _NO_STATES, (0, 0))
+
+    @property
+    def seq(self) -> int:
+        return self.snapshots.count
+
+    def changedSince(self, seq: int) -> bool:
+        return self.snapshots.count != seq
+
+    def snapshot(self) -> gp.GamepadSnapshot:
+        """Return the newest snapshot; the sequence numbers count the snapshots written to the ring."""
+        if self.snapshots.count != self._snapshot.seq:
+            n = self.snapshots.latest(self._record)
+            self._snapshot = gp.GamepadSnapshot(n + 1, float(self._record["timestamp"]),
+                                                tuple(self._record["values"].tolist()),
+                                                _NO_STATES, _NO_STATES, (0, 0))
+        return self._snapshot
+
+    def reportTime(self, seq: int) -> float:
+        """Timestamp of snapshot seq (ring record seq - 1), or of the oldest one the ring still holds."""
+        seq = max(seq, self.snapshots.count - self.snapshots.size + 1, 1)
+        while not self.snapshots.read(seq - 1, self._older):
+            seq += 1                                # overwritten while reading: try the next one
+        return float(self._older["timestamp"])
+
+    def readValues(self, out=None):
+        return self.snapshot().readValues(out)
+
+
+class SensorProcesses:
+    """
+    Starts the encoder and gamepad processes and gives the control process
+    their readers as .sampler and .gamepad. fake=True uses the fake bus and a
+    simulated gamepad with random stick movements instead of the hardware.
+    """
+
+    def __init__(self, samplerRate: float = 500.0, fake: bool = False, fakeDelay: float = 0.0007):
+        context = multiprocessing.get_context("spawn")      # start clean, without this process's threads
+        self.stop = context.Event()
+        encoderName = f"{ENCODER_RING}_{os.getpid()}"     # per run, so several runs never share a ring
+        gamepadName = f"{GAMEPAD_RING}_{os.getpid()}"
+        self.encoderRing = ring.ShmRing(encoderName, ENCODER_DTYPE, size=1024, create=True)
+        self.gamepadRing = ring.ShmRing(gamepadName, GAMEPAD_DTYPE, size=64, create=True)
+        self.processes = [
+            context.Process(target=runEncoders, name="encoders", daemon=True,
+                            args=(encoderName, samplerRate, self.stop, fakeDelay if fake else None)),
+            context.Process(target=runGamepad, name="gamepad", daemon=True,
+                            args=(gamepadName, self.stop, fake)),
+        ]
+        self.sampler = RingSampler(self.encoderRing, samplerRate)
+        self.gamepad = RingGamepad(self.gamepadRing)
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        return self
+
+    def close(self):
+        """Stop the processes (the gamepad one may be waiting for an event) and remove the rings."""
+        self.stop.set()
+        for process in self.processes:
+            process.join(timeout=0.5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.encoderRing.close()
+        self.gamepadRing.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    import time
+    with SensorProcesses(fake=True) as sensors:
+        for _ in range(10):
+            time.sleep(0.2)
+            print("samples:", sensors.sampler.count, "\t", "phi dots:", np.round(sensors.sampler.latest_velocity(), 2),
+                  "\t", "gamepad:", np.round(sensors.gamepad.readValues()[:2], 2))
@@ -0,0 +1,98 @@
+# L2_odometry.py
+# Dead reckoning: integrates the wheel travel between encoder samples into
+# the chassis pose (x, y, theta) and the distance driven. Each sample costs
+# the same few float operations however long the robot has been running.
+# The pose is published as an immutable OdometryPose in one attribute
+# assignment, so other threads can read it at any time without locking.
+# This program runs on SCUTTLE with any CPU.
+
+# Import external libraries
+import math
+import threading
+from typing import NamedTuple
+
+# Import local files
+import L2_kinematics as kin                 # for wrapTravel, pulleyRatio and the A matrix
+
+_A = kin.A.tolist()                         # [[R/2, R/2], [-R/(2L), R/(2L)]] as floats
+
+
+class OdometryPose(NamedTuple):
+    t: float                                # time of the newest sample (s)
+    x: float                                # position (m)
+    y: float
+    theta: float                            # heading (rad), not wrapped
+    distance: float                         # distance travelled by the chassis center (m)
+    samples: int                            # samples integrated since the last reset
+
+
+class Odometry:
+    """
+    Integrates shaft angle samples (degrees, as from L1_encoder.readAnglesPair
+    or EncoderSampler). The first sample after a reset only sets the reference
+    angles. Between samples each shaft must turn less than half a revolution,
+    which holds at the sampler's rate.
+    """
+
+    def __init__(self, x: float = 0.0, y: float = 0.0, theta: float = 0.0):
+        self._lock = threading.Lock()       # between update() and reset() from another thread
+        self.followed = 0                   # EncoderSampler samples already integrated by follow()
+        self.reset(x, y, theta)
+
+    def reset(self, x: float = 0.0, y: float = 0.0, theta: float = 0.0, t: float = 0.0):
+        """Set the pose; the next sample becomes the new reference."""
+        with self._lock:
+            self._last = None
+            self._x, self._y, self._theta, self._distance, self._samples = x, y, theta, 0.0, 0
+            self.pose = OdometryPose(t, x, y, theta, 0.0, 0)
+
+    def update(self, t: float, angleL: float, angleR: float) -> OdometryPose:
+        """Integrate one sample of both shaft angles (degrees) and return the new pose."""
+        with self._lock:
+            last = self._last
+            self._last = (angleL, angleR)
+            if last is None:
+                self.pose = self.pose._replace(t=t)
+                return self.pose
+            # wheel rotation since the last sample (rad), with phiTravels' wraparound
+            phiL = math.radians(kin.wrapTravel(angleL - last[0]) * kin.pulleyRatio)
+            phiR = math.radians(kin.wrapTravel(angleR - last[1]) * kin.pulleyRatio)
+            ds = _A[0][0] * phiL + _A[0][1] * phiR          # chassis travel (m)
+            dTheta = _A[1][0] * phiL + _A[1][1] * phiR      # heading change (rad)
+
+            theta = self._theta
+            if abs(dTheta) > 1e-9:                          # exact for a constant-curvature arc
+                radius = ds / dTheta
+                self._x += radius * (math.sin(theta + dTheta) - math.sin(theta))
+                self._y -= radius * (math.cos(theta + dTheta) - math.cos(theta))
+            else:
+                self._x += ds * math.cos(theta)
+                self._y += ds * math.sin(theta)
+            self._theta = theta + dTheta
+            self._distance += abs(ds)
+            self._samples += 1
+            self.pose = OdometryPose(t, self._x, self._y, self._theta, self._distance, self._samples)
+            return self.pose
+
+    def follow(self, sampler) -> OdometryPose:
+        """Integrate the EncoderSampler samples taken since the last call (at most a ring's worth)."""
+        n = sampler.count
+        start = max(self.followed, n - sampler.size)
+        for k in range(start, n):
+            i = k % sampler.size
+            self.update(float(sampler.times[i]), float(sampler.angles[i, 0]), float(sampler.angles[i, 1]))
+        self.followed = n
+        return self.pose
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    import time
+    import L2_encoder_sampler as es
+    odometry = Odometry()
+    with es.EncoderSampler() as sampler:
+        while True:
+            time.sleep(0.2)
+            pose = odometry.follow(sampler)
+            print(f"x {pose.x:7.3f} m   y {pose.y:7.3f} m   theta {math.degrees(pose.theta):7.1f} deg",
+                  f"  distance {pose.distance:7.3f} m")
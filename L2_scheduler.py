@@ -0,0 +1,217 @@
+# L2_scheduler.py
+# Runs a loop body at a fixed rate on absolute monotonic deadlines and keeps
+# timing statistics: overruns, a histogram of loop periods and a histogram of
+# wake-up jitter (how late each iteration started relative to its deadline).
+# This program runs on SCUTTLE with any CPU.
+
+# Import external libraries
+import bisect
+import time
+
+# policies for handling a missed deadline
+SKIP = "skip"                   # drop the missed ticks and realign to the deadline grid
+CATCH_UP = "catch_up"           # run the missed ticks back to back until caught up
+SAFETY_STOP = "safety_stop"     # stop the motors and end the loop
+
+POLICIES = (SKIP, CATCH_UP, SAFETY_STOP)
+
+# default histogram bin edges (seconds)
+PERIOD_BINS = [0.001, 0.002, 0.005, 0.008, 0.010, 0.012, 0.015, 0.020, 0.030, 0.050, 0.100]
+JITTER_BINS = [0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.010]
+
+
+def motorSafetyStop():
+    """Stop both motors. Imported lazily so the scheduler can be used without PWM hardware."""
+    import L1_motor
+    L1_motor.drive(0)
+
+
+class Histogram:
+    """Counts samples into fixed bins. The last bin collects everything above the top edge."""
+
+    def __init__(self, edges: list[float]):
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.total = 0
+        self.min = float("inf")
+        self.max = 0.0
+        self.sum = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.total += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def mean(self) -> float:
+        return self.sum / self.total if self.total else 0.0
+
+    def reset(self):
+        self.counts = [0] * (len(self.edges) + 1)
+        self.total = 0
+        self.min = float("inf")
+        self.max = 0.0
+        self.sum = 0.0
+
+    def asDict(self) -> dict:
+        labels = [f"<={e * 1000:g}ms" for e in self.edges] + [f">{self.edges[-1] * 1000:g}ms"]
+        return {
+            "count": self.total,
+            "mean": self.mean(),
+            "min": self.min if self.total else 0.0,
+            "max": self.max,
+            "bins": dict(zip(labels, self.counts)),
+        }
+
+
+class FakeClock:
+    """
+    A clock whose time only moves when sleep() or advance() is called.
+    Pass clock.monotonic and clock.sleep to LoopScheduler to run it deterministically.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self.now += seconds
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class LoopScheduler:
+    """
+    Calls a loop body at a fixed rate. Deadlines are computed as start + n * period,
+    so timing errors do not accumulate the way they do with a relative sleep.
+    """
+
+    def __init__(self, rate_hz: float = 100.0, policy: str = SKIP,
+                 clock=time.monotonic, sleep=time.sleep,
+                 on_safety_stop=motorSafetyStop, max_catch_up: int = 5,
+                 period_bins: list[float] = PERIOD_BINS, jitter_bins: list[float] = JITTER_BINS):
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive")
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+
+        self.period = 1.0 / rate_hz
+        self.policy = policy
+        self.clock = clock
+        self.sleep = sleep
+        self.onSafetyStop = on_safety_stop
+        self.maxCatchUp = max_catch_up
+
+        self.periods = Histogram(period_bins)
+        self.jitter = Histogram(jitter_bins)
+        self.iterations = 0
+        self.overruns = 0            # iterations that finished after the next deadline
+        self.skipped = 0             # ticks dropped by the SKIP policy (or by a capped CATCH_UP)
+        self.safetyStopped = False
+
+        self._running = False
+        self._deadline = None
+        self._lastStart = None
+
+    def stop(self):
+        """Ask run() to return after the current iteration."""
+        self._running = False
+
+    def run(self, body, iterations: int | None = None):
+        """
+        Call body() once per period until stop() is called, body() returns False,
+        the iteration count is reached or a SAFETY_STOP is triggered.
+        """
+        self._running = True
+        self._deadline = self.clock()
+        self._lastStart = None
+        count = 0
+
+        while self._running and (iterations is None or count < iterations):
+            self._waitForDeadline()
+
+            result = body()
+            count += 1
+            self.iterations += 1
+            if result is False:
+                break
+
+            self._deadline += self.period
+            if self.clock() > self._deadline:
+                self._handleOverrun()
+
+        self._running = False
+
+    def _waitForDeadline(self):
+        now = self.clock()
+        remaining = self._deadline - now
+        if remaining > 0:
+            self.sleep(remaining)
+            now = self.clock()
+
+        self.jitter.add(max(now - self._deadline, 0.0))   # lateness of this wake-up
+        if self._lastStart is not None:
+            self.periods.add(now - self._lastStart)
+        self._lastStart = now
+
+    def _handleOverrun(self):
+        self.overruns += 1
+        late = self.clock() - self._deadline
+        missed = int(late // self.period) + 1             # ticks whose deadline has already passed
+
+        if self.policy == SKIP:
+            self._deadline += missed * self.period        # stay on the original grid
+            self.skipped += missed
+        elif self.policy == CATCH_UP:
+            if missed > self.maxCatchUp:                  # too far behind, give up on the extra ticks
+                dropped = missed - self.maxCatchUp
+                self._deadline += dropped * self.period
+                self.skipped += dropped
+        else:
+            self.safetyStopped = True
+            self._running = False
+            if self.onSafetyStop is not None:
+                self.onSafetyStop()
+
+    def stats(self) -> dict:
+        return {
+            "rate_hz": 1.0 / self.period,
+            "policy": self.policy,
+            "iterations": self.iterations,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "safety_stopped": self.safetyStopped,
+            "period": self.periods.asDict(),
+            "jitter": self.jitter.asDict(),
+        }
+
+    def report(self) -> str:
+        s = self.stats()
+        return (f"{s['iterations']} iterations at {s['rate_hz']:g} Hz, "
+                f"{s['overruns']} overruns, {s['skipped']} skipped, "
+                f"period mean {s['period']['mean'] * 1000:.2f} ms max {s['period']['max'] * 1000:.2f} ms, "
+                f"jitter mean {s['jitter']['mean'] * 1000:.3f} ms max {s['jitter']['max'] * 1000:.3f} ms")
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    # Demonstrate the policies against a fake clock: every 10th iteration takes 25 ms at 100 Hz
+    for policy in (SKIP, CATCH_UP, SAFETY_STOP):
+        clock = FakeClock()
+        n = [0]
+
+        def body():
+            n[0] += 1
+            clock.advance(0.025 if n[0] % 10 == 0 else 0.002)
+
+        sched = LoopScheduler(100, policy, clock=clock.monotonic, sleep=clock.sleep,
+                              on_safety_stop=lambda: print("safety stop: motors would be stopped here"))
+        sched.run(body, iterations=100)
+        print(policy, "->", sched.report())
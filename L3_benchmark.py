@@ -0,0 +1,1263 @@
+# L3_benchmark.py
+# Benchmarks for the SCUTTLE software stack. Hardware is replaced with fakes
+# (see L1_fakebus.py and L1_sim.py) so the numbers can be collected on any
+# Linux machine as well as on the robot itself.
+#
+# Usage:
+#   python L3_benchmark.py encoder [--seconds 2] [--delay 0.0007]
+#   python L3_benchmark.py scheduler
+#   python L3_benchmark.py suite [--output FILE] [--baseline FILE] [--tolerance 1.5] [--save-baseline]
+#   python L3_benchmark.py kernels
+#   python L3_benchmark.py latency [--seconds 10] [--max-latency 15]
+#   python L3_benchmark.py multiprocess [--seconds 2] [--delay 0.0007]
+#   python L3_benchmark.py pwm
+#   python L3_benchmark.py imports [--import-slack 1.0]
+#   python L3_benchmark.py step
+#   python L3_benchmark.py odometry
+#   python L3_benchmark.py batch [--samples 100000]
+#   python L3_benchmark.py faults
+#   python L3_benchmark.py trace [--seconds 1]
+#   python L3_benchmark.py replay
+#   python L3_benchmark.py obstacles [--seconds 1]
+#   python L3_benchmark.py ik [--samples 100000]
+#   python L3_benchmark.py runtime [--seconds 1]
+#   python L3_benchmark.py recorder
+#
+# The suite times each hot function in isolation plus one full iteration of
+# the L3_gpDemo loop, writes the results as JSON and exits with status 1 if
+# any of them is slower than the stored baseline by more than the tolerance.
+# Without a baseline it warns that the gate was skipped, and fails if
+# --tolerance was given.
+
+# Import external libraries
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+import numpy as np
+
+# Import local files
+import L1_encoder as enc
+import L1_fakebus as fb
+import L1_trace as trace
+import L2_kinematics as kin
+
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+TOLERANCE = 1.5                                     # default slowdown over the baseline that counts as a regression
+
+
+def timeCalls(fn, seconds: float) -> float:
+    """Call fn() repeatedly for about `seconds` and return the calls per second."""
+    calls = 0
+    batch = 1
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        for _ in range(batch):
+            fn()
+        calls += batch
+        batch = min(batch * 2, 4096)
+        elapsed = time.perf_counter() - start
+    return calls / elapsed
+
+
+def timePerCall(fn, seconds: float, repeats: int = 5) -> float:
+    """Return the best time per call of fn() in nanoseconds over `repeats` runs."""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * seconds / repeats / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeats, number)) / number * 1e9
+
+
+def concurrentPairReads(reads: int = 100000) -> list[int]:
+    """
+    Two threads call readRawPair() at once, each on its own fake bus with
+    different angles and with thread switches forced as often as possible.
+    Returns the number of replies each thread got that were not its own.
+    """
+    def reader(degrees, wrong):
+        bus = fb.FakeEncoderBus()
+        bus.setDegrees(enc.encL, degrees[0])
+        bus.setDegrees(enc.encR, degrees[1])
+        expected = enc.readRawPair(bus)[:2]
+        wrong.append(sum(enc.readRawPair(bus)[:2] != expected for _ in range(reads)))
+
+    wrong = []
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=reader, args=(degrees, wrong)) for degrees in ((10, 20), (200, 300))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    return wrong
+
+
+def benchEncoder(args):
+    """
+    Compare the two-transaction readShaftPositions() with the batched
+    readRawPair(). Fails if readRawPair() from two threads at once mixes up
+    their replies.
+    """
+    bus = fb.FakeEncoderBus(delay=args.delay)
+    bus.spin(enc.encL, 720)
+    bus.spin(enc.encR, -720)
+
+    paths = [
+        ("readShaftPositions (2 transactions)", lambda: enc.readShaftPositions(bus)),
+        ("readRawPair (1 transaction)", lambda: enc.readRawPair(bus)),
+        ("readAnglesPair (1 transaction, degrees)", lambda: enc.readAnglesPair(bus)),
+    ]
+    results = {}
+    for name, fn in paths:
+        results[name] = timeCalls(fn, args.seconds)
+        print(f"{name:42s} {results[name]:12.0f} reads/s")
+    wrong = concurrentPairReads()
+    print("readRawPair from two threads:", wrong, "replies mixed up")
+    if any(wrong):
+        print("FAIL: concurrent readRawPair() calls share their i2c buffers")
+        sys.exit(1)
+    return results
+
+
+def runPolicy(policy: str, slow: dict, iterations: int = 100):
+    """
+    Run a 100 Hz LoopScheduler on a FakeClock with a body that takes 2 ms,
+    or slow[n] seconds on iteration n (from 1). Returns the scheduler, the
+    start time of each iteration in periods, and the number of safety stops.
+    """
+    import L2_scheduler as sched
+
+    clock = sched.FakeClock()
+    starts = []
+    stops = []
+
+    def body():
+        starts.append(round(clock.now * 100, 6))
+        clock.advance(slow.get(len(starts), 0.002))
+
+    scheduler = sched.LoopScheduler(100, policy, clock=clock.monotonic, sleep=clock.sleep,
+                                    on_safety_stop=lambda: stops.append(clock.now))
+    scheduler.run(body, iterations)
+    return scheduler, starts, len(stops)
+
+
+def benchScheduler(args):
+    """
+    Check the overrun policies deterministically on a fake clock: every 10th
+    iteration takes 25 ms of a 10 ms period. Fails if an overrun count, the
+    skipped or caught-up ticks, or a safety stop differ from what each policy
+    promises.
+    """
+    import L2_scheduler as sched
+
+    failures = []
+
+    def check(name: str, actual, expected):
+        status = "ok" if actual == expected else "WRONG"
+        print(f"  {name:44s} {str(actual):>24s}  (expected {expected})  {status}")
+        if actual != expected:
+            failures.append(f"{name}: {actual}, expected {expected}")
+
+    every10th = {n: 0.025 for n in range(10, 101, 10)}
+
+    # SKIP: a 25 ms iteration ends 15 ms after the next deadline, so that tick and the
+    # one after are dropped and the loop resumes on the original 10 ms grid
+    scheduler, starts, _ = runPolicy(sched.SKIP, every10th)
+    print(sched.SKIP)
+    check("overruns", scheduler.overruns, 10)
+    check("skipped ticks", scheduler.skipped, 20)
+    check("starts of iterations 10 to 12 (periods)", starts[9:12], [9.0, 12.0, 13.0])
+    check("every start on the grid", all(s == int(s) for s in starts), True)
+
+    # CATCH_UP: the missed tick runs late, right after the slow iteration, and the
+    # next one runs straight after it, so the loop is back on the grid by iteration 13
+    scheduler, starts, _ = runPolicy(sched.CATCH_UP, every10th)
+    print(sched.CATCH_UP)
+    check("overruns", scheduler.overruns, 19)      # 2 per slow iteration, 1 for the last one
+    check("skipped ticks", scheduler.skipped, 0)
+    check("starts of iterations 10 to 13 (periods)", starts[9:13], [9.0, 11.5, 11.7, 12.0])
+    check("iterations run", scheduler.iterations, 100)
+
+    # CATCH_UP with max_catch_up 5: an 85 ms iteration misses 8 ticks, 3 are dropped
+    scheduler, starts, _ = runPolicy(sched.CATCH_UP, {10: 0.085}, iterations=20)
+    print(sched.CATCH_UP, "(85 ms once, max_catch_up 5)")
+    check("skipped ticks", scheduler.skipped, 3)
+    check("starts of iterations 11 and 16 (periods)", [starts[10], starts[15]], [17.5, 18.5])
+
+    # SAFETY_STOP: the first overrun stops the motors and ends the loop
+    scheduler, starts, stops = runPolicy(sched.SAFETY_STOP, every10th)
+    print(sched.SAFETY_STOP)
+    check("iterations run", scheduler.iterations, 10)
+    check("overruns", scheduler.overruns, 1)
+    check("safety stops", stops, 1)
+    check("safety_stopped", scheduler.safetyStopped, True)
+
+    for failure in failures:
+        print("FAIL", failure)
+    if failures:
+        sys.exit(1)
+    return {"failures": len(failures)}
+
+
+def suiteCases(sim, logDir: str) -> dict:
+    """Build the functions timed by the suite, all running against the simulator."""
+    import L1_log as log
+    import L1_motor as m
+    import L2_inverse_kinematics as inv
+    import L2_kinematics as kin
+    import L2_scheduler as sched
+    import L2_speed_control as sc
+    import L3_gpDemo as demo
+
+    log.basicsDir = logDir + os.sep                 # keep the NodeRed files off the real folders
+    log.tmpDir = logDir + os.sep
+    fakeClock = sched.FakeClock()                   # time getMotion()'s math and reads, not its sleep:
+    kin.clock, kin.sleep = fakeClock.monotonic, fakeClock.sleep     # deltaT is still the real kin.wait
+
+    speeds = np.array([0.25, 0.5])
+    chassis = np.array([0.2, 0.8])
+    targets = np.array([4.2, 7.1])
+    enc_t1 = np.array([350.1, 10.4])
+    enc_t2 = np.array([2.3, 355.0])
+
+    def demoLoop():
+        demo.lastSeq = -1                           # as if the gamepad had just changed: the full iteration
+        demo.loop(sim.gamepad, sim.sampler)
+
+    return {
+        "L1_motor.computePWM": lambda: m.computePWM(0.42),
+        "L1_motor.drive": lambda: m.drive(0.42),
+        "L2_inverse_kinematics.map_speeds": lambda: inv.map_speeds(speeds),
+        "L2_inverse_kinematics.convert": lambda: inv.convert(chassis),
+        "L2_kinematics.phiTravels": lambda: kin.phiTravels(enc_t1, enc_t2),
+        "L2_kinematics.getMotion": kin.getMotion,
+        "L2_speed_control.openLoop": lambda: sc.openLoop(targets[0], targets[1]),
+        "L2_speed_control.driveOpenLoop": lambda: sc.driveOpenLoop(targets),
+        "L1_gamepad.Gamepad.readValues": sim.gamepad.readValues,
+        "L1_log.writeFiles": lambda: log.writeFiles(targets),
+        "L1_log.NodeRed2": lambda: log.NodeRed2(targets),
+        "L1_log.uniqueFile": lambda: log.uniqueFile(4.2, "u.txt"),
+        "L1_log.tmpFile": lambda: log.tmpFile(4.2, "t.txt"),
+        "L1_log.stringTmpFile": lambda: log.stringTmpFile("4.2,7.1", "s.txt"),
+        "L1_log.TelemetryWriter.flush": lambda: (log.stringTmpFile("4.2,7.1", "s.txt"), log.telemetry.flush()),
+        "L3_gpDemo.loop": demoLoop,
+    }
+
+
+def compareToBaseline(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return the names of the benchmarks that are slower than baseline * tolerance."""
+    regressions = []
+    for name, ns in results.items():
+        base = baseline.get(name)
+        if base is not None and ns > base * tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def benchSuite(args):
+    """Time every hot function, write the results and check them against the baseline."""
+    import L1_sim
+
+    sim = L1_sim.Simulation().install()
+    sim.sleep(1.0)                                  # get the robot moving so the encoders change
+
+    results = {}
+    with tempfile.TemporaryDirectory() as logDir, open(os.devnull, "w") as devnull:
+        for name, fn in suiteCases(sim, logDir).items():
+            with contextlib.redirect_stdout(devnull):   # driveOpenLoop and the demo loop print
+                results[name] = timePerCall(fn, args.seconds)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    tolerance = TOLERANCE if args.tolerance is None else args.tolerance
+    regressions = compareToBaseline(results, baseline, tolerance)
+
+    for name, ns in results.items():
+        base = baseline.get(name)
+        change = f"{ns / base:6.2f}x baseline" if base else ""
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:36s} {ns / 1000:10.2f} us {change}{flag}")
+
+    report = {
+        "unit": "ns_per_call",
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "machine": os.uname().machine,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("results written to", args.output)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print("baseline saved to", args.baseline)
+    elif not baseline:
+        print("WARNING: no baseline found at", args.baseline, "- regression gate skipped "
+              "(use --save-baseline to store one)")
+        if args.tolerance is not None:                  # a gate was asked for but cannot run
+            print("FAIL: --tolerance given without a baseline")
+            sys.exit(1)
+
+    if regressions:
+        print(len(regressions), "benchmark(s) regressed by more than", tolerance, "x")
+        sys.exit(1)
+    return results
+
+
+# The NumPy implementations of the control math before it was rewritten with
+# plain floats. The kernels check compares the current functions against them.
+def referenceComputePWM(speed):
+    if speed == 0:
+        return 0, 0
+    x = speed + 1.0
+    chA = np.round(0.5 * x, 2)
+    chB = np.round(1 - (0.5 * x), 2)
+    chA, chB = np.clip([chA, chB], 0, 1)
+    return chA, chB
+
+
+def referenceOpenLoop(pdl, pdr, phi_max, DRS):
+    duties = np.array([pdl, pdr])
+    duties = duties * 1/phi_max * DRS
+    duties[0] = sorted([-0.99, duties[0], 0.99])[1]
+    duties[1] = sorted([-0.99, duties[1], 0.99])[1]
+    return duties
+
+
+def referenceConvert(A, B):
+    return np.round(np.matmul(A, B), decimals=3)
+
+
+def referenceScaleAxis(raw_value, raw_min, raw_max, deadzone):
+    if raw_value is None:
+        return 0.0
+    centered_value = raw_value - (raw_min + raw_max) / 2
+    if abs(centered_value) < deadzone:
+        return 0.0
+    return centered_value / ((raw_max - raw_min) / 2)
+
+
+def allocatedBytes(fn, n: int = 5000) -> tuple[int, int]:
+    """
+    Return (net, peak) bytes allocated by n calls of fn() after n warm-up calls.
+    tracemalloc must be running. itertools.repeat is used so the loop itself
+    does not create int objects.
+    """
+    for _ in itertools.repeat(None, n):
+        fn()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in itertools.repeat(None, n):
+        fn()
+    current, peak = tracemalloc.get_traced_memory()
+    return current - before, peak - before
+
+
+class NullPWM:
+    """A motor output that only stores the duty cycle, so the check measures the control path alone."""
+    __slots__ = ("duty_cycle",)
+
+    def __init__(self):
+        self.duty_cycle = 0.0
+
+
+def benchKernels(args):
+    """Check the float control math against the NumPy reference and that a loop iteration does not allocate."""
+    import L1_motor as m
+    import L1_sim
+    import L2_inverse_kinematics as inv
+    import L2_speed_control as sc
+    import L3_gpDemo as demo
+    from evdev import InputEvent, ecodes
+
+    rng = random.Random(1)
+    mismatches = {"computePWM": 0, "openLoop": 0, "convert": 0, "readValues": 0}
+    for _ in range(args.samples):
+        speed = rng.uniform(-1.2, 1.2)
+        if tuple(m.computePWM(speed)) != tuple(referenceComputePWM(speed)):
+            mismatches["computePWM"] += 1
+        pdl, pdr = rng.uniform(-12, 12), rng.uniform(-12, 12)
+        if not np.array_equal(sc.openLoop(pdl, pdr), referenceOpenLoop(pdl, pdr, sc.phi_max, sc.DRS)):
+            mismatches["openLoop"] += 1
+        B = np.array([rng.uniform(-inv.max_xd, inv.max_xd), rng.uniform(-inv.max_td, inv.max_td)])
+        if not np.array_equal(inv.convert(B), referenceConvert(inv.A, B)):
+            mismatches["convert"] += 1
+
+    sim = L1_sim.Simulation().install()
+    sim.sleep(1.0)
+    gamepad = sim.gamepad
+    axisNames = ("LEFT_X", "LEFT_Y", "RIGHT_X", "RIGHT_Y")
+    axisCodes = {name: code for code, name in gamepad.axesMap.items()}
+    for _ in range(1000):
+        raw = {}
+        for name in axisNames:
+            lo, hi, _ = gamepad.axis_ranges[name]
+            raw[name] = rng.randint(lo, hi)
+            gamepad.processEvent(InputEvent(0, 0, ecodes.EV_ABS, axisCodes[name], raw[name]))
+        gamepad.processEvent(InputEvent(0, 0, ecodes.EV_SYN, ecodes.SYN_REPORT, 0))
+        expected = [referenceScaleAxis(raw[name], *gamepad.axis_ranges[name]) for name in axisNames]
+        if list(gamepad.readValues()[:4]) != expected:
+            mismatches["readValues"] += 1
+
+    for name, count in mismatches.items():
+        print(f"{name:12s} {count} mismatches against the NumPy reference")
+
+    def driveFull():
+        demo.lastSeq = -1                           # as if the gamepad had just changed
+        demo.drive(gamepad)
+
+    m.setOutputs([NullPWM() for _ in m.pins])
+    tracemalloc.start()
+    try:
+        allocatedBytes(driveFull)                   # the first measurement pays for tracemalloc's own setup
+        used = allocatedBytes(driveFull)
+        baseline = allocatedBytes(lambda: None)
+    finally:
+        tracemalloc.stop()
+    net = used[0] - baseline[0]                     # both relative to an empty loop
+    peak = used[1] - baseline[1]
+    print(f"L3_gpDemo.drive: {net} bytes net, {peak} bytes peak allocated over 5000 iterations")
+
+    if any(mismatches.values()) or net > 0 or peak > 0:
+        sys.exit(1)
+
+
+def benchLatency(args):
+    """
+    Measure input-to-actuation latency in real time: a thread feeds stick
+    events stamped with time.monotonic() to a threaded Gamepad on a simulated
+    device while L3_gpDemo.drive() runs at its loop rate. Fails if the p99
+    latency is above --max-latency.
+    """
+    import L1_gamepad as gp
+    import L1_motor as m
+    import L1_sim
+    import L2_latency as lat
+    import L2_scheduler as sched
+    import L3_gpDemo as demo
+
+    device = L1_sim.SimGamepadDevice()
+    with contextlib.redirect_stdout(None):
+        gamepad = gp.Gamepad(device, threaded=True)
+    m.setOutputs([NullPWM() for _ in m.pins])
+    demo.latency = lat.LatencyMonitor()
+
+    sticks = L1_sim.StickMover(device).start()      # inputs arrive at any point of the loop period
+    scheduler = sched.LoopScheduler(demo.LOOP_RATE, sched.SKIP)
+    try:
+        scheduler.run(lambda: demo.drive(gamepad), int(args.seconds * demo.LOOP_RATE))
+    finally:
+        sticks.stop()
+
+    print(scheduler.report())
+    print(demo.latency.report())
+    p99 = demo.latency.percentiles()["total"]["p99"] * 1000
+    if demo.latency.count == 0 or p99 > args.max_latency:
+        print(f"FAIL: p99 latency {p99:.2f} ms is above {args.max_latency:g} ms")
+        sys.exit(1)
+
+
+def benchRecorder(args):
+    """
+    Record past the size limit of L1_recorder.FlightRecorder so the files
+    rotate and the oldest falls off, reload them with loadRecordings() and
+    export them to CSV. Fails unless exactly the newest records come back,
+    field for field, in the files and in the CSV.
+    """
+    import L1_recorder as rec
+
+    capacity, maxFiles, total = 100, 3, 350
+    rng = np.random.default_rng(8)
+    expected = np.zeros(total, rec.RECORD_DTYPE)
+    expected["t"] = 1000.0 + np.cumsum(rng.uniform(0.009, 0.011, total))
+    for name in ("encoders", "phiDots", "axes", "duties"):
+        expected[name] = rng.uniform(-360.0, 360.0, expected[name].shape).astype(np.float32)
+    expected["buttons"] = rng.integers(0, 1 << 12, total)
+    kept = expected[-((maxFiles - 1) * capacity + total % capacity):]   # full rotated files plus the current one
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "flight.rec")
+        maxBytes = rec.HEADER_SIZE + capacity * rec.RECORD_DTYPE.itemsize
+        with rec.FlightRecorder(path, maxBytes, maxFiles) as recorder:
+            start = time.perf_counter()
+            for row in expected:
+                recorder.record(*row.item())
+            rate = total / (time.perf_counter() - start)
+        files = sorted(os.listdir(tmp))
+        loaded = rec.loadRecordings(path)
+        print(f"recorded {total} records at {rate:,.0f} records/s, {recorder.rotations} rotations,",
+              f"files {files}, reloaded {len(loaded)} records")
+        if files != ["flight.rec", "flight.rec.1", "flight.rec.2"]:
+            failures.append(f"expected the current file and {maxFiles - 1} rotated ones, found {files}")
+        if len(loaded) != len(kept):
+            failures.append(f"reloaded {len(loaded)} records instead of the newest {len(kept)}")
+        else:
+            for name in rec.RECORD_DTYPE.names:
+                if not np.array_equal(loaded[name], kept[name]):
+                    failures.append(f"field {name} differs after reloading")
+
+        csvPath = os.path.join(tmp, "flight.csv")
+        rec.exportCsv(loaded, csvPath)
+        with open(csvPath) as f:
+            header = f.readline().strip().split(",")
+        table = np.loadtxt(csvPath, delimiter=",", skiprows=1, ndmin=2)
+        flat = np.hstack([kept[name].reshape(len(kept), -1).astype(np.float64) for name in rec.RECORD_DTYPE.names])
+        if header != rec.columnNames(rec.RECORD_DTYPE):
+            failures.append("CSV header does not name every column")
+        if table.shape != flat.shape or not np.allclose(table, flat, rtol=1e-6, atol=1e-6):
+            failures.append("CSV values differ from the records")
+        else:
+            print(f"CSV: {table.shape[0]} rows of {table.shape[1]} columns, max difference {np.abs(table - flat).max():.1e}")
+    for failure in failures:
+        print("FAIL:", failure)
+    if failures:
+        sys.exit(1)
+    return {"records_per_s": rate}
+
+
+def benchRuntime(args):
+    """
+    Run L3_runtime's tasks against the simulation in real time, once until
+    the time runs out and once with a control task that fails. Fails if the
+    robot did not move, a task never ran, or the motors are not zeroed
+    once run() returns.
+    """
+    import asyncio
+    import L1_log as log
+    import L1_motor as m
+    import L1_sim
+    import L2_latency as lat
+    import L3_gpDemo as demo
+    import L3_runtime as rt
+
+    failures = []
+    with tempfile.TemporaryDirectory() as logDir, open(os.devnull, "w") as devnull:
+        log.basicsDir = log.tmpDir = logDir + os.sep
+        log.telemetry.threaded = False              # the telemetry task flushes the files itself
+        for case in ("time limit", "failing task"):
+            with contextlib.redirect_stdout(devnull):
+                sim = L1_sim.Simulation().install()
+                sim.sleep(0.6)                      # past the start of the script's full speed ahead
+                runtime = rt.Runtime(sim.gamepad, sim.sampler, sim)
+                demo.latency = lat.LatencyMonitor(clock=sim.monotonic)
+                demo.lastSeq = -1
+                if case == "failing task":
+                    control, calls = runtime.control, itertools.count()
+
+                    def failing():
+                        if next(calls) == 50:
+                            raise RuntimeError("control task failure")
+                        control()
+                    runtime.tasks[0].fn = failing
+                asyncio.run(runtime.run(args.seconds))
+            duties = [p.duty_cycle for p in sim.pwms]
+            moved = max(abs(v) for v in sim.plant.phiDots)
+            print(f"{case:14s}", ", ".join(f"{t.name} {t.iterations}" for t in runtime.tasks),
+                  f"iterations, wheel speed at stop {moved:.2f} rad/s, duties after run {duties}")
+            if moved < 1.0:
+                failures.append(f"{case}: the robot did not drive")
+            if any(t.iterations == 0 for t in runtime.tasks):
+                failures.append(f"{case}: a task never ran")
+            if any(duties):
+                failures.append(f"{case}: motors not zeroed after run()")
+            if not isinstance(runtime._gpData, tuple):
+                failures.append(f"{case}: telemetry shares drive()'s gamepad list")
+        log.telemetry.threaded = True
+    m.setOutputs([])
+    for failure in failures:
+        print("FAIL:", failure)
+    if failures:
+        sys.exit(1)
+
+
+def benchMultiprocess(args):
+    """
+    Compare the sustainable control rate with the encoder sampler and the
+    gamepad reader as threads of the control process and as separate
+    processes (L2_multiprocess.py), on the fake bus and a simulated gamepad.
+    """
+    import L1_gamepad as gp
+    import L1_motor as m
+    import L1_sim
+    import L2_encoder_sampler as es
+    import L2_multiprocess as mp
+    import L3_gpDemo as demo
+
+    m.setOutputs([NullPWM() for _ in m.pins])
+
+    def measure(gamepad, sampler) -> dict:
+        def control():
+            demo.lastSeq = -1                       # recompute the motor commands every time
+            demo.drive(gamepad)
+            sampler.latest_motion()
+
+        time.sleep(0.5)                             # let the samplers fill their buffers
+        samples = sampler.count
+        start = time.perf_counter()
+        rate = timeCalls(control, args.seconds)
+        samplesPerSecond = (sampler.count - samples) / (time.perf_counter() - start)
+        return {"control_hz": rate, "encoder_samples_per_s": samplesPerSecond}
+
+    bus = fb.FakeEncoderBus(delay=args.delay)
+    bus.spin(enc.encL, 720)
+    bus.spin(enc.encR, -720)
+    device = L1_sim.SimGamepadDevice()
+    with contextlib.redirect_stdout(None):
+        gamepad = gp.Gamepad(device, threaded=True)
+    sticks = L1_sim.StickMover(device).start()
+    with es.EncoderSampler(bus=bus) as sampler:
+        single = measure(gamepad, sampler)
+    sticks.stop()
+
+    with contextlib.redirect_stdout(None), mp.SensorProcesses(fake=True, fakeDelay=args.delay) as sensors:
+        multi = measure(sensors.gamepad, sensors.sampler)
+
+    for name, result in (("single process", single), ("multi process", multi)):
+        print(f"{name:15s} {result['control_hz']:10.0f} control iterations/s "
+              f"{result['encoder_samples_per_s']:8.0f} encoder samples/s")
+    return {"single": single, "multi": multi}
+
+
+class OpenPerWritePWM:
+    """Writes the duty cycle the way periphery.PWM does: open, write and close the sysfs file every time."""
+
+    def __init__(self, devpath: str, period_ns: int):
+        self.devpath = devpath
+        self.period_ns = period_ns
+
+    @property
+    def duty_cycle(self) -> float:
+        with open(self.devpath + "/duty_cycle") as f:
+            return int(f.readline()) / self.period_ns
+
+    @duty_cycle.setter
+    def duty_cycle(self, value: float):
+        with open(self.devpath + "/duty_cycle", "w") as f:
+            f.write(str(int(value * self.period_ns)) + "\n")
+
+
+def benchPWM(args):
+    """Time L1_motor.drive() on a fake sysfs tree, writing through periphery-style files and PWMChannel."""
+    import L1_fakesysfs
+    import L1_motor as m
+    import L1_pwm
+
+    # a stick that moves every 20th loop iteration, as when driving by hand
+    speeds = itertools.cycle([0.5] * 19 + [0.62] + [0.62] * 19 + [0.5])
+
+    def drive():
+        m.drive(next(speeds))
+
+    results = {}
+    with L1_fakesysfs.FakePWMSysfs({0: 4}) as tree:
+        m.setOutputs([OpenPerWritePWM(tree.path(0, i), 50000) for i in range(4)])
+        results["open per write"] = timePerCall(drive, args.seconds)
+        channels = [L1_pwm.PWMChannel(0, i, root=tree.root) for i in range(4)]
+        m.setOutputs(channels)
+        results["PWMChannel"] = timePerCall(drive, args.seconds)
+        for name, ns in results.items():
+            print(f"{name:16s} {ns / 1000:8.2f} us per L1_motor.drive()")
+        stats = m.outputStats()
+        writes = sum(s["writes"] for s in stats.values())
+        skipped = sum(s["skipped"] for s in stats.values())
+        print(f"PWMChannel wrote {writes} of {writes + skipped} duty cycle updates,",
+              f"{sum(s['write_ms'] for s in stats.values()) / max(writes, 1) * 1000:.2f} us per write")
+        m.closeOutputs()
+    return results
+
+
+def stepMetrics(t, y, target: float, stepTime: float) -> dict:
+    """Rise time (10-90 %), overshoot, 5 % settling time and steady-state error of a step response."""
+    t = np.asarray(t) - stepTime
+    y = np.asarray(y)
+    after = t >= 0
+    t, y = t[after], y[after]
+    rise = t[np.argmax(y >= 0.9 * target)] - t[np.argmax(y >= 0.1 * target)] if (y >= 0.9 * target).any() else np.nan
+    outside = np.nonzero(np.abs(y - target) > 0.05 * abs(target))[0]
+    settling = t[outside[-1] + 1] if len(outside) and outside[-1] + 1 < len(t) else (0.0 if not len(outside) else np.nan)
+    tail = y[t >= t[-1] - 0.5]
+    return {"rise_s": float(rise), "overshoot_pct": float(max(y.max() - target, 0) / target * 100),
+            "settling_s": float(settling), "steady_error_pct": float((target - tail.mean()) / target * 100)}
+
+
+def benchStep(args):
+    """
+    Step response of the wheel speed control on the simulated plant, at the
+    control loop rate with speeds from the EncoderSampler, open loop and with
+    L2_speed_control.PIDController, on a plant matching the open-loop scaling
+    and on a weaker one with a motor deadband. Fails if the PID leaves a
+    steady-state error above 5 %, or if on the nominal plant it overshoots
+    by more than 5 % or does not settle at least 10 % sooner than open loop.
+    """
+    import L1_motor as m
+    import L1_sim
+    import L2_scheduler as sched
+    import L2_speed_control as sc
+
+    rate = 100.0
+    target, stepTime, duration = 5.0, 0.2, 2.0                  # rad/s, s, s
+    plants = {"nominal plant": {}, "weak plant": {"phiMax": 7.5, "deadband": 0.15}}
+    controllers = {"open loop": dict(kp=0.0, ki=0.0, kd=0.0), "PID": {}}
+    failures = []
+    results = {}
+    for plantName, plantArgs in plants.items():
+        for controllerName, gains in controllers.items():
+            with contextlib.redirect_stdout(None):
+                sim = L1_sim.Simulation(script=[], plant=L1_sim.DiffDrivePlant(**plantArgs)).install()
+            controller = sc.PIDController(**gains, clock=sim.monotonic)
+            scheduler = sched.LoopScheduler(rate, sched.SKIP, clock=sim.monotonic, sleep=sim.sleep)
+            times, speeds = [], []
+            duties = [0.0, 0.0]
+
+            def control():
+                targets = (target, target) if sim.monotonic() >= stepTime else (0.0, 0.0)
+                controller.update(targets, sim.sampler.latest_velocity(), out=duties)
+                m.driveLeft(duties[0])
+                m.driveRight(duties[1])
+                times.append(sim.monotonic())
+                speeds.append(sim.plant.phiDots[0])
+
+            scheduler.run(control, int((stepTime + duration) * rate))
+            metrics = results[f"{plantName}, {controllerName}"] = stepMetrics(times, speeds, target, stepTime)
+            print(f"{plantName:14s} {controllerName:10s} rise {metrics['rise_s'] * 1000:6.0f} ms",
+                  f"overshoot {metrics['overshoot_pct']:5.1f} %  settling {metrics['settling_s'] * 1000:6.0f} ms",
+                  f"steady-state error {metrics['steady_error_pct']:5.1f} %")
+            if controllerName == "PID" and abs(metrics["steady_error_pct"]) > 5:
+                failures.append(f"PID steady-state error above 5 % on the {plantName}")
+    m.setOutputs([])
+    nominalPID, nominalOpen = results["nominal plant, PID"], results["nominal plant, open loop"]
+    if nominalPID["overshoot_pct"] > 5:
+        failures.append("PID overshoots by more than 5 % on the nominal plant")
+    if not nominalPID["settling_s"] <= 0.9 * nominalOpen["settling_s"] + 1e-9:     # nan (never settles) fails too
+        failures.append("PID does not settle at least 10 % sooner than open loop on the nominal plant")
+    for failure in failures:
+        print("FAIL:", failure)
+    if failures:
+        sys.exit(1)
+    return results
+
+
+# (seconds, left wheel speed, right wheel speed in rad/s): straight, arcs both
+# ways, a spin in place and a reverse arc, fast enough to wrap the shafts often.
+ODOMETRY_PATH = [(2.0, 8.0, 8.0), (3.0, 4.0, 8.0), (1.5, -6.0, 6.0), (2.5, 9.0, 5.0), (2.0, -5.0, -7.0)]
+
+
+def exactPath(path) -> tuple[float, float, float, float]:
+    """Final (x, y, theta, distance) of constant wheel speed segments, in closed form."""
+    x = y = theta = distance = 0.0
+    for seconds, phiDotL, phiDotR in path:
+        v = kin.R / 2 * (phiDotL + phiDotR)
+        omega = kin.R / (2 * kin.L) * (phiDotR - phiDotL)
+        if omega:
+            x += v / omega * (np.sin(theta + omega * seconds) - np.sin(theta))
+            y -= v / omega * (np.cos(theta + omega * seconds) - np.cos(theta))
+        else:
+            x += v * seconds * np.cos(theta)
+            y += v * seconds * np.sin(theta)
+        theta += omega * seconds
+        distance += abs(v) * seconds
+    return x, y, theta, distance
+
+
+def benchOdometry(args):
+    """
+    Drive the fake encoders along ODOMETRY_PATH, sample them at 200 Hz through
+    readAnglesPair() into L2_odometry.Odometry, and compare the final pose with
+    the closed-form one. Fails if the position drifts by more than 0.5 % of the
+    distance or the heading by more than 0.5 degrees.
+    """
+    import L2_odometry as odo
+    import L2_scheduler as sched
+
+    rate = 200.0
+    clock = sched.FakeClock()
+    bus = fb.FakeEncoderBus(clock=clock.monotonic)
+    odometry = odo.Odometry()
+    degrees = np.degrees(1) / kin.pulleyRatio                   # shaft degrees per wheel radian
+    odometry.update(0.0, *enc.readAnglesPair(bus)[:2])
+    for seconds, phiDotL, phiDotR in ODOMETRY_PATH:
+        bus.spin(enc.encL, -phiDotL * degrees)                  # the left encoder reads inverted
+        bus.spin(enc.encR, phiDotR * degrees)
+        for _ in range(int(round(seconds * rate))):
+            clock.advance(1 / rate)
+            angleL, angleR, _ = enc.readAnglesPair(bus)
+            odometry.update(clock.now, angleL, angleR)
+
+    pose = odometry.pose
+    x, y, theta, distance = exactPath(ODOMETRY_PATH)
+    drift = float(np.hypot(pose.x - x, pose.y - y))
+    headingError = float(np.degrees(abs(pose.theta - theta)))
+    print(f"odometry  x {pose.x:8.4f}  y {pose.y:8.4f}  theta {np.degrees(pose.theta):8.3f} deg  distance {pose.distance:7.3f} m")
+    print(f"exact     x {x:8.4f}  y {y:8.4f}  theta {np.degrees(theta):8.3f} deg  distance {distance:7.3f} m")
+    print(f"drift {drift * 1000:.3f} mm over {distance:.2f} m ({drift / distance * 100:.3f} %),",
+          f"heading error {headingError:.3f} deg, {pose.samples} samples")
+
+    angles = itertools.cycle([(10.0, 350.0), (20.0, 340.0), (30.0, 330.0)])
+    perUpdate = timePerCall(lambda: odometry.update(0.0, *next(angles)), args.seconds)
+    print(f"Odometry.update: {perUpdate / 1000:.2f} us per sample")
+    if drift > 0.005 * distance or headingError > 0.5:
+        print("FAIL: odometry drifted from the exact path")
+        sys.exit(1)
+    return {"drift_m": drift, "heading_error_deg": headingError, "update_ns": perUpdate}
+
+
+def benchBatch(args):
+    """
+    Check the batch kinematics in L2_kinematics against the per-sample
+    functions on a random encoder log (with steps of exactly +/-180 degrees),
+    then compare samples per second. Fails on any mismatch.
+    """
+    import L2_odometry as odo
+
+    rng = np.random.default_rng(1)
+    n = max(args.samples, 1000)
+    steps = rng.uniform(-179.0, 179.0, (n, 2))
+    steps[rng.integers(0, n, n // 100)] = 180.0                 # ties of the +/-360 search
+    steps[rng.integers(0, n, n // 100)] = -180.0
+    angles = np.cumsum(steps, axis=0) % 360                     # what the encoders report
+    times = np.cumsum(rng.uniform(0.0015, 0.0025, n))           # about 500 Hz with jitter
+
+    checked = min(n, 20000)                                     # the per-sample versions are slow
+    travels = kin.batchTravels(angles)
+    phiDots = kin.batchPhiDots(times, angles)
+    motion = kin.batchMotion(phiDots)
+    pose = kin.batchPose(angles)
+
+    def scalarLog(count):
+        odometry = odo.Odometry()
+        odometry.update(times[0], *angles[0])
+        rows = []
+        for i in range(1, count):
+            travel = kin.phiTravels(angles[i - 1], angles[i])
+            pd = travel / (times[i] - times[i - 1]) * np.pi / 180
+            p = odometry.update(times[i], angles[i, 0], angles[i, 1])
+            rows.append((travel, pd, np.matmul(kin.A, pd), (p.x, p.y, p.theta, p.distance)))
+        return rows
+
+    rows = scalarLog(checked)
+    errors = {
+        "batchTravels": np.abs(travels[:checked - 1] - [r[0] for r in rows]).max(),
+        "batchPhiDots": np.abs(phiDots[:checked - 1] - [r[1] for r in rows]).max(),
+        "batchMotion": np.abs(motion[:checked - 1] - [r[2] for r in rows]).max(),
+        "batchPose": np.abs(pose[1:checked] - [r[3] for r in rows]).max(),
+    }
+    for name, error in errors.items():
+        print(f"{name:14s} max difference {error:.2e} over {checked - 1} samples")
+
+    start = time.perf_counter()
+    scalarLog(checked)
+    scalarRate = (checked - 1) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    kin.batchMotion(kin.batchPhiDots(times, angles))
+    kin.batchPose(angles)
+    batchRate = n / (time.perf_counter() - start)
+    print(f"per sample   {scalarRate:12,.0f} samples/s")
+    print(f"batch        {batchRate:12,.0f} samples/s ({batchRate / scalarRate:.0f}x) over {n} samples")
+    if any(error > 1e-6 for error in errors.values()):       # rounding of the unwrapped cumulative angles
+        print("FAIL: the batch kinematics differ from the per-sample functions")
+        sys.exit(1)
+    return {"scalar_samples_per_s": scalarRate, "batch_samples_per_s": batchRate}
+
+
+def benchFaults(args):
+    """
+    Sample spinning fake encoders through the EncoderSampler while the bus
+    fails 10 % of reads at random, loses the left encoder for 0.4 s and both
+    encoders for about 0.1 s. Fails if the velocity ever strays more than
+    0.5 rad/s from the true wheel speed, or if the outage is not reported STALE.
+    """
+    import L2_encoder_sampler as es
+    import L2_scheduler as sched
+
+    rate = 500.0
+    shaftRates = (720.0, -540.0)                                # degrees/s, as read (left not inverted)
+    truth = np.radians(shaftRates) * kin.pulleyRatio            # wheel speeds (rad/s)
+    clock = sched.FakeClock()
+    bus = fb.FakeEncoderBus(clock=clock.monotonic, failRate=0.1, seed=3)
+    bus.spin(enc.encL, -shaftRates[0])                          # the left encoder reads inverted
+    bus.spin(enc.encR, shaftRates[1])
+    sampler = es.EncoderSampler(rate, bus=bus, clock=clock.monotonic)
+    worst = 0.0
+    staleSeen = False
+    for step in range(int(5 * rate)):
+        if step == int(1.0 * rate):
+            bus.failNext(600, enc.encL)                         # the left encoder drops out (3 reads per sample)
+        if step == int(3.0 * rate):
+            bus.failNext(250)                                   # the whole bus drops out
+        clock.advance(1 / rate)
+        sampler.sampleOnce()
+        if step >= rate * kin.wait * 2:
+            velocity = sampler.latest_velocity()
+            worst = max(worst, float(np.abs(velocity - truth).max()) if not np.isnan(velocity).any() else np.inf)
+            staleSeen |= sampler.latest_sample().status[0] == enc.STALE
+
+    health = sampler.health()
+    print(f"{bus.faults} injected faults, {health['lost']} samples lost, {health['estimated']} estimated,",
+          f"{health['samples']} stored")
+    for device, stats in health["devices"].items():
+        print(f"  {device}: {stats}")
+    print(f"worst velocity error {worst:.3f} rad/s (true speeds {np.round(truth, 3)} rad/s),",
+          f"outage reported stale: {staleSeen}")
+    if worst > 0.5 or not staleSeen:
+        print("FAIL: bad samples reached the velocity estimate")
+        sys.exit(1)
+    return {"worst_velocity_error": worst}
+
+
+@trace.traced("benchmark")
+def tracedProbe(x):                                 # module level, so enable()/disable() can rebind it
+    return x
+
+
+def benchTrace(args):
+    """
+    Cost of a traced function and a span, with tracing disabled and enabled,
+    against a plain call. Fails if a disabled @traced function, or one of
+    the hot functions, is still wrapped.
+    """
+    import L1_gamepad as gp
+    import L1_motor as m
+
+    def plain(x):
+        return x
+
+    def block():
+        with trace.span("benchmark block"):
+            pass
+
+    hot = {"L1_encoder.singleReading": lambda: enc.singleReading,
+           "L1_motor.driveLeft": lambda: m.driveLeft,
+           "L1_gamepad.Gamepad.processEvent": lambda: gp.Gamepad.processEvent,
+           "benchmark": lambda: tracedProbe}
+    failures = []
+    results = {"plain call": timePerCall(lambda: plain(1), args.seconds)}
+    for state in ("disabled", "enabled"):
+        trace.enable() if state == "enabled" else trace.disable()
+        for name, get in hot.items():
+            if hasattr(get(), "__wrapped__") != (state == "enabled"):
+                failures.append(f"{name} is {'not ' if state == 'enabled' else ''}wrapped while tracing is {state}")
+        results[f"@traced, {state}"] = timePerCall(lambda: tracedProbe(1), args.seconds)
+        results[f"span, {state}"] = timePerCall(block, args.seconds)
+    trace.disable()
+    trace.clear()
+    for name, ns in results.items():
+        print(f"{name:20s} {ns:8.0f} ns")
+    if failures:
+        print("FAIL:", "; ".join(failures))
+        sys.exit(1)
+    return results
+
+
+def captureSession(path: str, reports: int = 2000, seed: int = 5):
+    """Write a synthetic capture: the left stick moved at random every 5-15 ms, as StickMover does."""
+    import L1_replay as rp
+    import L1_sim
+    from evdev import InputEvent, ecodes
+
+    rng = random.Random(seed)
+    t = 1000.0
+    with rp.EventRecorder(path, L1_sim.SimGamepadDevice()) as recorder:
+        for _ in range(reports):
+            t += rng.uniform(0.005, 0.015)
+            sec, usec = int(t), int(t % 1 * 1e6)
+            for code in (ecodes.ABS_X, ecodes.ABS_Y):
+                recorder.write(InputEvent(sec, usec, ecodes.EV_ABS, code, rng.randint(L1_sim.AXIS_MIN, L1_sim.AXIS_MAX)))
+            recorder.write(InputEvent(sec, usec, ecodes.EV_SYN, ecodes.SYN_REPORT, 0))
+    return t - 1000.0
+
+
+def benchReplay(args):
+    """
+    Replay a synthetic 20 s gamepad capture through Gamepad as fast as
+    possible and at 10x, and twice through the simulation. Fails if a
+    replay ends in a different gamepad state or pose than the others.
+    """
+    import L1_gamepad as gp
+    import L1_replay as rp
+    import L1_sim
+    import L2_inverse_kinematics as inv
+    import L2_speed_control as sc
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "session.gpe")
+        length = captureSession(path)
+        print(f"capture: {os.path.getsize(path)} bytes, {len(rp.ReplayDevice(path))} events over {length:.2f} s")
+
+        reference = gp.Gamepad(rp.ReplayDevice(path, speed=0), threaded=False)
+        for event in reference.device.eventsUntil(0.0):
+            reference.processEvent(event)
+        expected = (reference.seq, reference.snapshot().values)
+
+        failures = []
+        results = {}
+        for speed in (0, 10):
+            device = rp.ReplayDevice(path, speed)
+            start = time.perf_counter()
+            with gp.Gamepad(device) as gamepad:
+                device.finished.wait()
+                elapsed = time.perf_counter() - start
+                snapshot = gamepad.snapshot()
+            label = "fast" if speed == 0 else f"{speed:g}x"
+            results[f"{label}_events_per_s"] = len(device) / elapsed
+            print(f"replay {label:5s} {elapsed:7.3f} s  ({len(device) / elapsed:10,.0f} events/s, "
+                  f"expected {device.duration:.3f} s)  {snapshot.seq} snapshots")
+            if (snapshot.seq, snapshot.values) != expected:
+                failures.append(f"replay at speed {speed:g} ended in a different gamepad state")
+
+        poses = []
+        for run in range(2):
+            sim = L1_sim.Simulation(replay=rp.ReplayDevice(path)).install()
+            for _ in range(500):                                # 5 simulated seconds at 100 Hz
+                data = sim.gamepad.readValues()
+                sc.driveOpenLoop(inv.convert(inv.map_speeds(np.array([-data[1], -data[0]]))), verbose=False)
+                sim.sleep(0.01)
+            poses.append(np.round(sim.pose(), 9))
+        print("simulated pose after 5 s, two replays:", poses[0], poses[1])
+        if not np.array_equal(poses[0], poses[1]):
+            failures.append("two simulated replays of the same capture ended in different poses")
+
+    for failure in failures:
+        print("FAIL", failure)
+    if failures:
+        sys.exit(1)
+    return results
+
+
+def referenceScanInfluence(scan, resolution: float):
+    """scan_influence() one point at a time with phi_influence(), at the same angular resolution."""
+    import math
+    import L2_inverse_kinematics as inv
+
+    left = right = np.zeros(2)
+    nearest = None
+    for distance, angle in scan:
+        angle = math.radians(round(angle / resolution) * resolution)
+        x, y = distance * round(math.cos(angle), 15), distance * round(math.sin(angle), 15)
+        if distance <= 0 or not 0 < x < inv.lookahead:
+            continue
+        push = inv.phi_influence(y)
+        if push[1] > left[1]:                                   # pdr grows with theta dot
+            left = push
+        if push[1] < right[1]:
+            right = push
+        if abs(y) < inv.L and (nearest is None or x < nearest):
+            nearest = x
+    xd = 0.0 if nearest is None else -inv.max_xd * (1 - nearest / inv.lookahead)
+    return left + right + np.matmul(inv.A, [xd, 0.0])
+
+
+def lidarScans(count: int, points: int = 720, seed: int = 11) -> list[np.ndarray]:
+    """Synthetic 360 degree scans of a cluttered room: [distance (m), angle (deg)], 5 % without a return."""
+    rng = np.random.default_rng(seed)
+    step = 360 / points
+    scans = []
+    for _ in range(count):
+        angles = np.arange(points) * step - 180 + rng.normal(0, step / 10, points)
+        distances = rng.uniform(0.05, 4.0, points)
+        distances[rng.random(points) < 0.05] = 0.0
+        scans.append(np.column_stack((distances, angles)))
+    return scans
+
+
+def benchObstacles(args):
+    """
+    Time scan_influence() on 720-point scans against one phi_influence()
+    call per point, and report the CPU share needed for a 10 Hz lidar.
+    Fails if the results differ or if that share is over 5 % of a core.
+    """
+    import L2_inverse_kinematics as inv
+
+    resolution = 0.5
+    scans = lidarScans(50)
+    worst = max(float(np.abs(inv.scan_influence(scan, resolution) - referenceScanInfluence(scan, resolution)).max())
+                for scan in scans)
+    out = np.empty(2)
+    scan = scans[0]
+    vectorNs = timePerCall(lambda: inv.scan_influence(scan, resolution, out), args.seconds)
+    scalarNs = timePerCall(lambda: referenceScanInfluence(scan, resolution), args.seconds, repeats=3)
+    share = vectorNs * 1e-9 * 10
+    print(f"per point    {scalarNs / 1000:10.1f} us per scan")
+    print(f"vectorized   {vectorNs / 1000:10.1f} us per scan ({scalarNs / vectorNs:.0f}x)")
+    print(f"10 Hz x {len(scan)} points: {share * 100:.3f} % of a core, largest difference {worst:.2e} rad/s")
+    if worst > 1e-9:
+        print("FAIL: scan_influence differs from phi_influence applied point by point")
+        sys.exit(1)
+    if share > 0.05:
+        print("FAIL: scan_influence needs more than 5 % of a core at 10 Hz")
+        sys.exit(1)
+    return {"scan_us": vectorNs / 1000, "per_point_scan_us": scalarNs / 1000, "core_share_10hz": share}
+
+
+def benchIK(args):
+    """
+    Check the batch inverse kinematics against convert(), map_speeds() and
+    saturate() row by row, check that saturation keeps the turning radius,
+    and time one batch call against a loop over the rows.
+    """
+    import L2_inverse_kinematics as inv
+
+    rng = np.random.default_rng(7)
+    n = args.samples
+    sticks = rng.uniform(-1, 1, (n, 2))
+    B = inv.batch_map_speeds(sticks)
+    failures = []
+    if not np.array_equal(B, np.array([inv.map_speeds(row) for row in sticks])):
+        failures.append("batch_map_speeds differs from map_speeds")
+
+    raw = np.array([inv.convert(row) for row in B])
+    unsaturated = np.abs(raw).max(axis=1) <= inv.max_pd
+    batch = inv.batch_pd_targets(B)
+    if not np.array_equal(batch[unsaturated], raw[unsaturated]):
+        failures.append("batch_pd_targets differs from convert in the unsaturated range")
+    if not np.allclose(batch, np.array([inv.saturate(row) for row in raw]), rtol=0, atol=1e-12):
+        failures.append("batch_saturate differs from saturate")
+    if np.abs(batch).max() > inv.max_pd + 1e-12:
+        failures.append("a saturated wheel speed is above max_pd")
+
+    # the turning radius is L*(pdr + pdl)/(pdr - pdl), kept as long as [pdl, pdr] keeps its direction
+    unit = raw / np.linalg.norm(raw, axis=1, keepdims=True).clip(1e-12)
+
+    def curveError(C):                                          # distance of C from the commanded direction
+        return float(np.abs(unit[:, 0] * C[:, 1] - unit[:, 1] * C[:, 0]).max())
+    bent = curveError(batch)
+    clipBent = curveError(np.clip(raw, -inv.max_pd, inv.max_pd))
+    if bent > 1e-9:
+        failures.append("saturation changed the direction of [pdl, pdr]")
+
+    loopNs = timePerCall(lambda: [inv.saturate(inv.convert(row)) for row in B[:1000]], args.seconds, repeats=3) / 1000
+    batchNs = timePerCall(lambda: inv.batch_pd_targets(B), args.seconds) / n
+    print(f"{n} commands, {np.count_nonzero(~unsaturated)} saturated")
+    print(f"per row      {1e9 / loopNs:12,.0f} commands/s")
+    print(f"batch        {1e9 / batchNs:12,.0f} commands/s ({loopNs / batchNs:.0f}x)")
+    print(f"largest curve error: scaling {bent:.1e} rad/s, clipping each wheel {clipBent:.2f} rad/s")
+    for failure in failures:
+        print("FAIL", failure)
+    if failures:
+        sys.exit(1)
+    return {"row_commands_per_s": 1e9 / loopNs, "batch_commands_per_s": 1e9 / batchNs}
+
+
+# Import time budgets (ms, cumulative including dependencies) on the robot.
+# Importing a module must also not open any hardware: that happens on first use.
+IMPORT_BUDGETS_MS = {
+    "L1_encoder": 250,
+    "L1_gamepad": 300,
+    "L1_motor": 100,
+    "L1_pwm": 100,
+    "L2_kinematics": 250,
+    "L2_inverse_kinematics": 250,
+    "L2_speed_control": 300,
+    "L3_gpDemo": 450,
+}
+HARDWARE_PATHS = ("/dev/input/", "/dev/i2c-", "/sys/class/pwm/", "/dev/hat/")
+
+_IMPORT_PROBE = """
+import json, os
+import {module}
+opened = []
+for fd in os.listdir("/proc/self/fd"):
+    try:
+        opened.append(os.readlink(f"/proc/self/fd/{{fd}}"))
+    except OSError:
+        pass                    # the descriptor used by listdir itself
+print(json.dumps([path for path in opened if path.startswith({paths!r})]))
+"""
+
+
+def importTime(module: str) -> tuple[float, list[str]]:
+    """Import module in a fresh interpreter. Returns (cumulative ms, hardware files left open)."""
+    probe = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                            _IMPORT_PROBE.format(module=module, paths=HARDWARE_PATHS)],
+                           capture_output=True, text=True, check=True)
+    for line in probe.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1000, json.loads(probe.stdout)
+    raise RuntimeError(f"no import time reported for {module}")
+
+
+def benchImports(args):
+    """Time each module's import (best of 3) against IMPORT_BUDGETS_MS and check it opens no hardware."""
+    results = {}
+    failures = []
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        limit = budget * args.import_slack
+        times, opened = zip(*(importTime(module) for _ in range(3)))
+        results[module] = ms = min(times)
+        status = "ok"
+        if ms > limit:
+            status = "OVER BUDGET"
+            failures.append(f"{module}: {ms:.0f} ms, limit {limit:g} ms")
+        if opened[0]:
+            status = "OPENS HARDWARE"
+            failures.append(f"{module}: importing opens {opened[0]}")
+        print(f"{module:24s} {ms:7.1f} ms  (limit {limit:g} ms)  {status}")
+    for failure in failures:
+        print("FAIL", failure)
+    if failures:
+        sys.exit(1)
+    return results
+
+
+BENCHMARKS = {
+    "encoder": benchEncoder,
+    "scheduler": benchScheduler,
+    "suite": benchSuite,
+    "kernels": benchKernels,
+    "latency": benchLatency,
+    "multiprocess": benchMultiprocess,
+    "pwm": benchPWM,
+    "imports": benchImports,
+    "step": benchStep,
+    "odometry": benchOdometry,
+    "batch": benchBatch,
+    "faults": benchFaults,
+    "trace": benchTrace,
+    "replay": benchReplay,
+    "obstacles": benchObstacles,
+    "ik": benchIK,
+    "runtime": benchRuntime,
+    "recorder": benchRecorder,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SCUTTLE benchmarks (no hardware required)")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent on each measurement")
+    parser.add_argument("--delay", type=float, default=0.0007,
+                        help="simulated duration of one i2c transaction on the fake bus (s); "
+                             "0 measures only the Python overhead")
+    parser.add_argument("--output", default=RESULTS_FILE, help="where the suite writes its JSON results")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="stored results to compare the suite against")
+    parser.add_argument("--tolerance", type=float,
+                        help=f"slowdown factor over the baseline that counts as a regression (default {TOLERANCE}); "
+                             "the suite fails if it is given and there is no baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--import-slack", type=float, default=1.0,
+                        help="factor applied to the import budgets, for machines slower than the robot")
+    parser.add_argument("--samples", type=int, default=100000, help="random inputs tried by the kernels and ik checks, samples in the batch benchmark")
+    parser.add_argument("--max-latency", type=float, default=15.0,
+                        help="p99 input-to-motor latency (ms) above which the latency check fails")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
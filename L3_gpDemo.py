@@ -7,20 +7,88 @@
 # v2020.11.29 DPM
 
 # Import External programs
+import argparse
 import numpy as np
 import time
 
 # Import Internal Programs
+import L1_encoder as enc
 import L1_gamepad as gp
 import L1_log as log
+import L1_motor as m
+import L1_recorder as rec
+import L1_replay as rp
+import L1_statebus as bus
+import L1_trace as trace
+import L2_encoder_sampler as es
 import L2_inverse_kinematics as inv
-import L2_kinematics as kin
+import L2_latency as lat
+import L2_scheduler as sched
 import L2_speed_control as sc
 
-gamepad = gp.Gamepad()
+LOOP_RATE = 100                                     # control loop rate (Hz)
 
-# Run the main loop
-while True:
+# buffers reused every iteration so that drive() does not allocate
+gpValues = [0.0] * 16                               # scaled axes and buttons from the gamepad
+stick = [0.0, 0.0]                                  # [xd, td] in [-1, 1] from the left stick
+chassisTargets = [0.0, 0.0]                         # [xd, td] in m/s and rad/s
+pdTargets = [0.0, 0.0]                              # [pdl, pdr] in rad/s
+lastSeq = -1                                        # gamepad snapshot that the motor commands were computed from
+latency = None                                      # LatencyMonitor, from gamepad event to duty write
+recorder = None                                     # FlightRecorder when run with --record
+publisher = None                                    # StatePublisher for other local processes (L1_statebus.py)
+
+
+@trace.traced()
+def drive(gamepad):
+    """
+    Read the gamepad and drive the motors in open loop. Returns the gamepad
+    values, or None. When the gamepad has not reported anything new, the
+    motors already have the right commands and nothing is recomputed.
+    """
+    global lastSeq
+    # COLLECT GAMEPAD COMMANDS
+    snapshot = gamepad.snapshot()
+    if snapshot is None:
+        return None
+    if snapshot.seq == lastSeq:
+        return gpValues
+    if latency is not None:
+        readTime = latency.clock()
+        # measure from the oldest input not yet acted on: with several reports since the last
+        # iteration, the first one has waited longest (snapshot 0 is the initial state, not an input)
+        firstNew = max(lastSeq + 1, 1)
+        eventTime = snapshot.timestamp if firstNew >= snapshot.seq else gamepad.reportTime(firstNew)
+    lastSeq = snapshot.seq
+    gp_data = snapshot.readValues(gpValues)
+
+    # DRIVE IN OPEN LOOP
+    stick[0] = -gp_data[1]                          # forward is up on the left stick
+    stick[1] = -gp_data[0]                          # turning left is left on the left stick
+    inv.map_speeds(stick, chassisTargets)           # generate xd, td
+    inv.convert(chassisTargets, pdTargets)          # pd means phi dot (rad/s)
+
+    #DRIVING
+    sc.driveOpenLoop(pdTargets, verbose=False)      #call driving function
+    if latency is not None and snapshot.seq:        # snapshot 0 is the initial state, not an input
+        latency.record(eventTime, readTime)
+    return gp_data
+
+
+@trace.traced()
+def publish(sampler, gp_data, phiDots):
+    """Send this iteration's state to the flight recorder and the state bus."""
+    latest = sampler.latest_angles()
+    t, angles = latest if latest is not None else (0.0, (0.0, 0.0))   # time of the newest encoder sample
+    buttons = rec.buttonBits(gp_data[4:16])
+    if recorder is not None:
+        recorder.record(t, angles, phiDots, gp_data[0:4], buttons, m.duties)
+    if publisher is not None:
+        publisher.publish(t, phiDots, sampler.latest_motion(), gp_data[0:4], buttons, m.duties)
+
+
+@trace.traced()
+def loop(gamepad, sampler):
     # # ACCELEROMETER SECTION
     # accel = mpu.getAccel()                          # call the function from within L1_mpu.py
     # (xAccel) = accel[0]                             # x axis is stored in the first element
@@ -33,10 +101,10 @@ while True:
     # vb = adc.getDcJack()
     # log.tmpFile(vb,"vb.txt")
     
-    # COLLECT GAMEPAD COMMANDS
-    gp_data = gamepad.readValues()
+    # COLLECT GAMEPAD COMMANDS AND DRIVE
+    gp_data = drive(gamepad)
     if gp_data is None:
-        continue
+        return
     
     axis0 = gp_data[0] * -1
     axis1 = gp_data[1] * -1
@@ -53,21 +121,115 @@ while True:
     #     gpio.write(1, 0, 0) # write LOW
     # #print("rthumb axis:", rthumb)
     
-    phiDots = kin.getPdCurrent()
+    phiDots = sampler.latest_velocity()             # non-blocking, from the background encoder sampler
     myString = str(round(phiDots[0],1)) + "," + str(round(phiDots[1],1))
     log.stringTmpFile(myString,"phidots.txt")
+    if recorder is not None or publisher is not None:
+        publish(sampler, gp_data, phiDots)
 
     myString = str(round(axis0*100,1)) + "," + str(round(axis1*100,1))
     log.stringTmpFile(myString,"uFile.txt")
     print("Gamepad, xd: " ,axis1, " td: ", axis0) # print gamepad percents
     
-    # DRIVE IN OPEN LOOP
-    chassisTargets = inv.map_speeds(np.array([axis1, axis0])) # generate xd, td
-    pdTargets = inv.convert(chassisTargets) # pd means phi dot (rad/s)
     # phiString = str(pdTargets[0]) + "," + str(pdTargets[1])
     # log.stringTmpFile(phiString,"pdTargets.txt")
-    
-    #DRIVING
-    sc.driveOpenLoop(pdTargets) #call driving function 
     #servo.move1(rthumb) # control the servo for laser
-    time.sleep(0.05)
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive SCUTTLE with a gamepad")
+    parser.add_argument("--sim", type=float, metavar="SECONDS",
+                        help="run against the simulator (L1_sim.py) for this many simulated seconds")
+    parser.add_argument("--record", metavar="PATH",
+                        help="record every iteration to this file (see L1_recorder.py)")
+    parser.add_argument("--statebus", default=bus.NAME, metavar="NAME",
+                        help="shared memory block to publish the state in (see L1_statebus.py), '' for none")
+    parser.add_argument("--processes", action="store_true",
+                        help="read the encoders and the gamepad in separate processes (see L2_multiprocess.py)")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="record hot-path spans and write them to this Chrome trace file on exit "
+                             "or on SIGUSR1 (see L1_trace.py)")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="drive with a gamepad session captured by L1_replay.py instead of the gamepad")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed relative to the capture, 0 for as fast as possible (default 1)")
+    args = parser.parse_args()
+    if args.sim and args.processes:
+        parser.error("--processes cannot be used with --sim")
+    if args.replay and args.processes:
+        parser.error("--replay cannot be used with --processes")
+    if args.replay and args.sim and not args.speed:
+        parser.error("--speed 0 needs real time; the simulation already runs as fast as it can")
+    if args.trace:
+        trace.enable()
+        trace.exportOnSignal(args.trace)
+
+    sensors = None
+    replay = None
+    if args.replay:
+        replay = rp.ReplayDevice(args.replay, args.speed)
+    if args.sim:
+        import L1_sim
+        sim = L1_sim.Simulation(replay=replay).install()
+        gamepad, sampler = sim.gamepad, sim.sampler     # the simulation steps the sampler itself
+        scheduler = sched.LoopScheduler(LOOP_RATE, sched.SKIP, clock=sim.monotonic, sleep=sim.sleep)
+        latency = lat.LatencyMonitor(clock=sim.monotonic)   # simulated events carry simulated time
+        iterations = int(args.sim * LOOP_RATE)
+    elif args.processes:
+        import L2_multiprocess as mp
+        sensors = mp.SensorProcesses().start()
+        gamepad, sampler = sensors.gamepad, sensors.sampler
+    else:
+        gamepad = gp.Gamepad(replay)
+        sampler = es.EncoderSampler()
+        sampler.start()
+    if not args.sim:
+        # Run the main loop on fixed deadlines, skipping any ticks that an iteration overruns
+        scheduler = sched.LoopScheduler(LOOP_RATE, sched.SKIP)
+        latency = lat.LatencyMonitor()
+        iterations = None
+
+    if args.record:
+        recorder = rec.FlightRecorder(args.record)
+    if args.statebus:
+        try:
+            publisher = bus.StatePublisher(args.statebus)
+        except FileExistsError as e:                # another running program already publishes there
+            print(f"{e}; running without the state bus (pick another with --statebus NAME)")
+
+    def body():
+        loop(gamepad, sampler)
+        return args.sim or replay is None or not replay.finished.is_set()   # a replay ends the run in real time
+
+    start = time.perf_counter()
+    try:
+        scheduler.run(body, iterations)
+    finally:
+        if sensors is not None:
+            sensors.close()
+        else:
+            sampler.stop()
+            if not args.sim:
+                gamepad.close()
+                enc.closeBus()
+        log.telemetry.stop()
+        if recorder is not None:
+            recorder.close()
+            print("recorded", recorder.count, "iterations to", args.record)
+        if publisher is not None:
+            publisher.close()
+        print(scheduler.report())
+        print(latency.report())
+        print("telemetry:", log.telemetry.stats())
+        if hasattr(sampler, "health"):
+            print("encoders:", sampler.health())
+        if m.outputStats():
+            print("motor outputs:", m.outputStats())
+        if replay is not None:
+            print(f"replay: played {replay.played} of {len(replay)} events from {args.replay}")
+        if args.trace:
+            print(f"trace: wrote {trace.export(args.trace)} spans to {args.trace}")
+        if args.sim:
+            elapsed = time.perf_counter() - start
+            print(f"simulated {sim.monotonic():.2f} s in {elapsed:.2f} s ({sim.monotonic() / elapsed:.1f}x real time),",
+                  "final pose (x, y, theta):", np.round(sim.pose(), 3))
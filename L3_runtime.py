@@ -0,0 +1,215 @@
+# L3_runtime.py
+# Drives SCUTTLE with the gamepad like L3_gpDemo.py, but as independent
+# asyncio tasks, each running at its own rate:
+#   gamepad    - applies evdev events as they arrive (async_read_loop)
+#   encoders   - samples both encoders at 500 Hz on a dedicated i2c thread
+#   control    - inverse kinematics and motor commands at 100 Hz
+#   telemetry  - NodeRed files and console output at 20 Hz, written on a worker thread
+# Blocking work (i2c reads, file writes) runs in threads, so a slow file
+# write or an i2c hiccup never delays a motor update. However the program
+# ends (Ctrl+C, SIGTERM, a failing task), the motors are stopped.
+# This program runs on SCUTTLE with any CPU.
+#
+# Usage:
+#   python L3_runtime.py
+#   python L3_runtime.py --sim 10    # against L1_sim.py, in real time
+
+# Import external libraries
+import argparse
+import asyncio
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Import local files
+import L1_gamepad as gp
+import L1_log as log
+import L1_motor as m
+import L1_recorder as rec
+import L1_statebus as bus
+import L2_encoder_sampler as es
+import L2_latency as lat
+import L2_scheduler as sched
+import L3_gpDemo as demo
+
+CONTROL_RATE = demo.LOOP_RATE                       # motor updates (Hz)
+SAMPLER_RATE = 500                                  # encoder samples (Hz)
+TELEMETRY_RATE = 20                                 # NodeRed files and console output (Hz)
+
+
+class RateTask:
+    """
+    Calls a function at a fixed rate on absolute deadlines inside the event loop,
+    skipping ticks it has fallen behind on like LoopScheduler's SKIP policy.
+    With an executor, the function runs there and the event loop stays free.
+    """
+
+    def __init__(self, name: str, rate_hz: float, fn, executor=None, clock=time.monotonic):
+        self.name = name
+        self.period = 1.0 / rate_hz
+        self.fn = fn
+        self.executor = executor
+        self.clock = clock
+        self.iterations = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter = sched.Histogram(sched.JITTER_BINS)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        deadline = self.clock()
+        while True:
+            remaining = deadline - self.clock()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            self.jitter.add(max(self.clock() - deadline, 0.0))
+
+            if self.executor is None:
+                self.fn()
+            else:
+                await loop.run_in_executor(self.executor, self.fn)
+            self.iterations += 1
+
+            deadline += self.period
+            late = self.clock() - deadline
+            if late > 0:
+                self.overruns += 1
+                missed = int(late // self.period) + 1
+                deadline += missed * self.period
+                self.skipped += missed
+
+    def report(self) -> str:
+        return (f"{self.name}: {self.iterations} iterations at {1 / self.period:g} Hz, "
+                f"{self.overruns} overruns, {self.skipped} skipped, "
+                f"jitter mean {self.jitter.mean() * 1000:.3f} ms max {self.jitter.max * 1000:.3f} ms")
+
+
+class Runtime:
+    """Owns the devices and the tasks. run() returns once everything is stopped and the motors are off."""
+
+    def __init__(self, gamepad, sampler, sim=None, clock=time.monotonic):
+        self.gamepad = gamepad
+        self.sampler = sampler
+        self.sim = sim
+        self.i2c = ThreadPoolExecutor(1, "i2c")       # one thread, so bus transactions never overlap
+        self.files = ThreadPoolExecutor(1, "telemetry")
+        self.tasks = [
+            RateTask("control", CONTROL_RATE, self.control, clock=clock),
+            RateTask("telemetry", TELEMETRY_RATE, self.telemetry, self.files, clock=clock),
+        ]
+        if sim is None:
+            self.tasks.append(RateTask("encoders", SAMPLER_RATE, sampler.sampleOnce, self.i2c, clock=clock))
+        self._stop = None
+        self._gpData = None
+
+    def control(self):
+        gp_data = demo.drive(self.gamepad)
+        if gp_data is None:
+            self._gpData = None
+            return
+        self._gpData = tuple(gp_data)               # drive() rewrites its list in place: give telemetry a copy
+        if demo.recorder is not None or demo.publisher is not None:
+            demo.publish(self.sampler, gp_data, self.sampler.latest_velocity())
+
+    def telemetry(self):
+        """Runs on the telemetry thread: format the NodeRed values and write the files."""
+        gp_data = self._gpData
+        if gp_data is None:
+            return
+        phiDots = self.sampler.latest_velocity()
+        log.stringTmpFile(str(round(phiDots[0], 1)) + "," + str(round(phiDots[1], 1)), "phidots.txt")
+        axis0, axis1 = -gp_data[0], -gp_data[1]
+        log.stringTmpFile(str(round(axis0 * 100, 1)) + "," + str(round(axis1 * 100, 1)), "uFile.txt")
+        print("Gamepad, xd: ", axis1, " td: ", axis0)
+        log.telemetry.flush()
+
+    async def readGamepad(self):
+        await self.gamepad.asyncPoll()
+        raise EOFError("gamepad disconnected")
+
+    async def stepSimulation(self):
+        """Advance the simulation in step with the real clock."""
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(0.001)
+            now = time.monotonic()
+            self.sim.sleep(now - last)
+            last = now
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def run(self, seconds: float | None = None):
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        coroutines = [task.run() for task in self.tasks]
+        coroutines.append(self.stepSimulation() if self.sim is not None else self.readGamepad())
+        running = [asyncio.create_task(c) for c in coroutines]
+        stopper = asyncio.create_task(asyncio.wait_for(self._stop.wait(), seconds))
+        try:
+            done, _ = await asyncio.wait(running + [stopper], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not stopper and task.exception() is not None:
+                    print("runtime stopping:", repr(task.exception()))
+        finally:
+            m.drive(0)                              # before anything else can go wrong
+            for task in running + [stopper]:
+                task.cancel()
+            await asyncio.gather(*running, stopper, return_exceptions=True)
+            self.i2c.shutdown(wait=True)
+            self.files.shutdown(wait=True)
+            m.drive(0)                              # nothing can command the motors any more
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+
+
+# THIS SECTION ONLY RUNS IF THE PROGRAM IS CALLED DIRECTLY
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive SCUTTLE with a gamepad, one asyncio task per job")
+    parser.add_argument("--sim", type=float, metavar="SECONDS",
+                        help="run against the simulator (L1_sim.py) for this many seconds")
+    parser.add_argument("--record", metavar="PATH",
+                        help="record every control iteration to this file (see L1_recorder.py)")
+    parser.add_argument("--statebus", default=bus.NAME, metavar="NAME",
+                        help="shared memory block to publish the state in (see L1_statebus.py), '' for none")
+    args = parser.parse_args()
+
+    log.telemetry.threaded = False                  # the telemetry task flushes the files itself
+    if args.sim:
+        import L1_sim
+        sim = L1_sim.Simulation().install()
+        runtime = Runtime(sim.gamepad, sim.sampler, sim)
+        demo.latency = lat.LatencyMonitor(clock=sim.monotonic)
+    else:
+        runtime = Runtime(gp.Gamepad(threaded=False), es.EncoderSampler())
+        demo.latency = lat.LatencyMonitor()
+    if args.record:
+        demo.recorder = rec.FlightRecorder(args.record)
+    if args.statebus:
+        try:
+            demo.publisher = bus.StatePublisher(args.statebus)
+        except FileExistsError as e:                # another running program already publishes there
+            print(f"{e}; running without the state bus (pick another with --statebus NAME)")
+
+    try:
+        asyncio.run(runtime.run(args.sim))
+    finally:
+        m.drive(0)
+        if not args.sim:
+            m.closeOutputs()
+        log.telemetry.stop()
+        if demo.recorder is not None:
+            demo.recorder.close()
+            print("recorded", demo.recorder.count, "iterations to", args.record)
+        if demo.publisher is not None:
+            demo.publisher.close()
+        for task in runtime.tasks:
+            print(task.report())
+        print(demo.latency.report())
+        print("telemetry:", log.telemetry.stats())
+        if args.sim:
+            print("final pose (x, y, theta):", [round(v, 3) for v in sim.pose()])